@@ -1,6 +1,11 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import options
-from app.ext import db, migrate, mail, csrf, login_manager, init_auth
+from app.utils.security import TokenService
+from app.ext import (
+  db, engine_tuning, role_table, mail, mail_dispatcher, email_renderer,
+  password_hasher, metrics, query_profiler, rate_limiter, server_sessions,
+  assets, template_cache, csrf, login_manager, init_auth)
 
 
 def create_app(config_name: str) -> Flask:
@@ -14,24 +19,40 @@ def create_app(config_name: str) -> Flask:
   app = Flask(__name__)
   app.config.from_object(options[config_name])
   options[config_name].init_app(app)
-
+  if app.config.get('PROXY_FIX_X_FOR'):
+    # take the client address from the proxies' X-Forwarded-For
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+  app.token_service = TokenService(
+    app.config['SECRET_KEY'], cache_size=app.config['TOKEN_CACHE_SIZE'])
+
+  # sets the jinja options, must run before anything uses `app.jinja_env`
+  template_cache.init_app(app)
   db.init_app(app)
-  migrate.init_app(app, db)
+  engine_tuning.init_app(app)
+  role_table.init_app(app)
   mail.init_app(app)
+  mail_dispatcher.init_app(app)
+  password_hasher.init_app(app)
+  metrics.init_app(app)
+  query_profiler.init_app(app)
+  rate_limiter.init_app(app)
+  server_sessions.init_app(app)
+  assets.init_app(app)
   csrf.init_app(app)
   login_manager.init_app(app)
   init_auth(app.user_service)
 
-  if app.config['ENV'] != 'production':
-    migrate.init_app(app, db)
-
   with app.app_context():
-    from app.models import User, Role
+    from app.models import User, Role, AnonymousUser
+  login_manager.anonymous_user = AnonymousUser
 
-  from app.blueprints import main_bp, auth_bp, user_bp
+  from app.blueprints import main_bp, auth_bp, user_bp, admin_bp
 
   app.register_blueprint(main_bp)
   app.register_blueprint(auth_bp, url_prefix='/auth')
   app.register_blueprint(user_bp, url_prefix='/user')
+  app.register_blueprint(admin_bp, url_prefix='/admin')
+
+  email_renderer.init_app(app)
 
   return app
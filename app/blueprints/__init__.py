@@ -1,3 +1,4 @@
 from .main import main_bp
 from .auth import auth_bp
 from .user import user_bp
+from .admin import admin_bp
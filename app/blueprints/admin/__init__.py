@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+admin_bp = Blueprint('admin', __name__)
+
+from . import views
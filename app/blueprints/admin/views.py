@@ -0,0 +1,70 @@
+import io
+import csv
+from flask import (
+  render_template, request, current_app, Response, stream_with_context)
+from app.models import Permission
+from app.utils.roles import permission_required
+from . import admin_bp
+
+CSV_COLUMNS = ('id', 'username', 'email', 'confirmed', 'role')
+# spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+
+def csv_cell(value: str) -> str:
+  """`value` quoted with "'" when a spreadsheet would read a formula"""
+  return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def user_filters() -> dict:
+  """`confirmed` ("1" or "0") and `role` (id) filters of the query string"""
+  return dict(
+    confirmed={'1': True, '0': False}.get(request.args.get('confirmed')),
+    role_id=request.args.get('role', type=int))
+
+
+@admin_bp.route('/users')
+@permission_required(Permission.ADMIN)
+def users():
+  srv = current_app.user_service
+  page = srv.users_page(
+    after=request.args.get('after', type=int),
+    before=request.args.get('before', type=int),
+    per_page=current_app.config['ADMIN_USERS_PER_PAGE'],
+    **user_filters())
+  # filters carried over to the page and export links
+  filters = {
+    key: request.args[key] for key in ('confirmed', 'role')
+    if request.args.get(key)}
+  return render_template(
+    'admin/users.html', page=page, filters=filters,
+    roles=current_app.extensions['roles'].roles())
+
+
+@admin_bp.route('/users.csv')
+@permission_required(Permission.ADMIN)
+def export_users():
+  srv = current_app.user_service
+  batches = srv.iter_users(
+    batch_size=current_app.config['ADMIN_EXPORT_BATCH_SIZE'], **user_filters())
+  roles = current_app.extensions['roles'].roles()
+
+  def generate():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    # one chunk per batch, memory stays flat whatever the table size
+    for rows in batches:
+      for row in rows:
+        role = roles.get(row.role_id)
+        writer.writerow((
+          row.id, csv_cell(row.username), csv_cell(row.email),
+          int(bool(row.confirmed)), csv_cell(role.name) if role else ''))
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+    yield buffer.getvalue()
+
+  return Response(
+    stream_with_context(generate()), mimetype='text/csv',
+    headers={'Content-Disposition': 'attachment; filename=users.csv'})
@@ -5,12 +5,14 @@ from flask_login import (
 from app.errors import (
   LoginError, EmailAlreadyExistsError, UsernameAlreadyExistsError, 
   TokenError, UserNotFoundError, TokenPayloadError)
+from app.ext import rate_limiter
 from . import auth_bp
 from .forms import (
   LoginForm, RegisterForm, VerifyUserEmailForm, ChangePasswordForm)
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit(account_field='email')
 def login():
   if current_user.is_authenticated:
     return redirect(url_for('main.index'))
@@ -40,6 +42,7 @@ def logout():
 
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit(account_field='email')
 def register():
   if current_user.is_authenticated:
     return redirect(url_for('main.index'))
@@ -89,13 +92,16 @@ def resend_confirmation():
   if current_user.confirmed:
     return redirect(url_for('main.index'))
   srv = current_app.user_service
-  srv.send_confirmation_mail(current_user)
-  flash('A new email have been sent, please check your inbox.')
+  if srv.send_confirmation_mail(current_user):
+    flash('A new email have been sent, please check your inbox.')
+  else:
+    flash('Could not send the email, please try again later.', category='danger')
 
   return redirect(url_for('main.index'))
 
 
 @auth_bp.route('/reset-password', methods=['GET', 'POST'])
+@rate_limiter.limit(account_field='email')
 def reset_password_request():
   if current_user.is_authenticated:
     return redirect(url_for('main.index'))
@@ -104,6 +110,8 @@ def reset_password_request():
   srv = current_app.user_service
   
   if form.validate_on_submit():
+    # the same answer whether the account exists or the mail was queued,
+    # the service logs mail it couldn't queue
     try:
       srv.reset_password_request(email=form.email.data)
     except UserNotFoundError:
@@ -3,15 +3,28 @@ from flask_wtf.csrf import CSRFError
 from . import main_bp
 
 
+@main_bp.app_errorhandler(403)
+def forbidden(e):
+  return render_template('errors/403.html'), 403
+
+
 @main_bp.app_errorhandler(404)
 def page_not_found(e):
-  return render_template('errors/404.html')
+  return render_template('errors/404.html'), 404
 
 
 @main_bp.app_errorhandler(500)
 def internal_server_error(e):
-  return render_template('errors/500.html')
+  return render_template('errors/500.html'), 500
+
+
+@main_bp.app_errorhandler(429)
+def too_many_requests(e):
+  # plain text, a rejected request shouldn't cost a page render
+  return 'Too many requests, please try again later.', 429, \
+    {'Retry-After': str(e.retry_after or 60)}
+
 
 @main_bp.app_errorhandler(CSRFError)
 def csrf_error(e):
-  return render_template('errors/400.html')
+  return render_template('errors/400.html'), 400
@@ -1,8 +1,16 @@
-from flask import redirect, url_for, request, flash
+from flask import redirect, url_for, request, flash, current_app
 from flask_login import current_user
+from app.ext import metrics
 from . import main_bp
 
 
+@main_bp.before_app_request
+def start_request_metrics():
+  app_metrics = metrics.get(current_app)
+  if app_metrics is not None:
+    app_metrics.start_request()
+
+
 @main_bp.before_app_request
 def before_request():
   if current_user.is_authenticated\
@@ -12,3 +20,11 @@ def before_request():
     flash(
       'Please confirm your account to continue using the website\'s features.',
       category='warning')
+
+
+@main_bp.after_app_request
+def record_request_metrics(response):
+  app_metrics = metrics.get(current_app)
+  if app_metrics is not None:
+    app_metrics.end_request(request.endpoint, request.method, response.status_code)
+  return response
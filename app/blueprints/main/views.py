@@ -1,7 +1,19 @@
-from flask import render_template
+from flask import render_template, current_app, abort, request, Response
+from app.ext import metrics as app_metrics
 from . import main_bp
 
 
 @main_bp.route('/')
 def index():
   return render_template('index.html')
+
+
+@main_bp.route('/metrics')
+def metrics():
+  registry = app_metrics.get(current_app)
+  if registry is None:
+    abort(404)
+  if not registry.allows(request):
+    abort(403)
+  return Response(
+    registry.registry.expose(), mimetype='text/plain; version=0.0.4')
@@ -9,6 +9,8 @@ from .forms import (
   ChangePasswordForm, UpdateUserProfileForm, UpdateEmailForm,
   VerifyUserPasswordForm)
 
+MAIL_FAILED = 'Could not send the email, please try again later.'
+
 
 def profile_form_handler(form):
   if form.validate_on_submit():
@@ -27,10 +29,12 @@ def email_form_handler(form):
     srv = current_app.user_service
     user = current_user._get_current_object()
     try:
-      srv.update_email_request(user=user, new_email=form.email.data)
-      flash(
-        'An email have been sent, please check you inbox.', 
-        category='info')
+      if srv.update_email_request(user=user, new_email=form.email.data):
+        flash(
+          'An email have been sent, please check you inbox.', 
+          category='info')
+      else:
+        flash(MAIL_FAILED, category='danger')
       return redirect(url_for('user.settings'))
     except EmailAlreadyExistsError:
       form.email.errors.append(
@@ -42,11 +46,12 @@ def password_form_handler(form):
     srv = current_app.user_service
     user = current_user._get_current_object()
     try:
-      srv.password_change_request(
-        user=user, password=form.password.data)
-      flash(
-        'An email have been sent, please check you inbox.',
-        category='info')
+      if srv.password_change_request(user=user, password=form.password.data):
+        flash(
+          'An email have been sent, please check you inbox.',
+          category='info')
+      else:
+        flash(MAIL_FAILED, category='danger')
       return redirect(url_for('user.settings'))
     except PasswordValidationError:
       flash('Incorrect Password.')
@@ -86,6 +91,9 @@ def update_user_email(token):
     flash('Email address updated.', category='info')
   except TokenError as e:
     flash(e, category='danger')
+  except EmailAlreadyExistsError:
+    flash(
+      'This email is already associated with an account.', category='danger')
   
   return redirect(url_for('user.settings'))
 
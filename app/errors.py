@@ -48,3 +48,13 @@ class TokenPayloadError(TokenError):
   def __init__(self, message='Payload does not match the context'):
     super().__init__(self, message)
 
+
+class MailError(Exception):
+  """Base class for mail delivery errors."""
+  def __init__(self, message='Mail delivery failed'):
+    super().__init__(message)
+
+
+class MailQueueFullError(MailError):
+  def __init__(self, message='Mail queue is full'):
+    super().__init__(message)
@@ -1,13 +1,34 @@
 from flask import redirect, url_for, request
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_mail import Mail
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
+from app.utils.mail_dispatcher import MailDispatcher
+from app.utils.email_templates import EmailRenderer
+from app.utils.hashing import PasswordHasher
+from app.utils.metrics import Metrics
+from app.utils.query_profiler import QueryProfiler
+from app.utils.engine import EngineTuning
+from app.utils.replica import RoutingSession
+from app.utils.rate_limit import RateLimiter
+from app.utils.sessions import ServerSessions
+from app.utils.assets import Assets
+from app.utils.templates import TemplateCache
+from app.utils.roles import RoleTable
 
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+engine_tuning = EngineTuning(db)
+role_table = RoleTable(db)
 mail = Mail()
+mail_dispatcher = MailDispatcher(mail)
+email_renderer = EmailRenderer()
+password_hasher = PasswordHasher()
+metrics = Metrics(db)
+query_profiler = QueryProfiler(db)
+rate_limiter = RateLimiter()
+server_sessions = ServerSessions()
+assets = Assets()
+template_cache = TemplateCache()
 csrf = CSRFProtect()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
@@ -1,2 +1,3 @@
-from .role import Role
-from .user import User
+from .role import Role, Permission
+from .user import User, AnonymousUser, normalize_email
+from .outbox import OutboxMail
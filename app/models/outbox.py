@@ -0,0 +1,48 @@
+from datetime import datetime
+from flask_mail import Message
+from app.ext import db
+
+
+class OutboxMail(db.Model):
+  """Mail waiting to be delivered by the outbox worker."""
+  __tablename__ = 'outbox'
+  PENDING = 'pending'
+  SENDING = 'sending'
+  SENT = 'sent'
+  FAILED = 'failed'
+
+  id = db.Column(db.Integer, primary_key=True)
+  sender = db.Column(db.String(128))
+  # comma separated, a message may have several recipients
+  recipient = db.Column(db.Text)
+  subject = db.Column(db.String(256))
+  body = db.Column(db.Text)
+  html = db.Column(db.Text)
+  status = db.Column(db.String(16), default=PENDING, index=True)
+  attempts = db.Column(db.Integer, default=0)
+  last_error = db.Column(db.Text)
+  claim_token = db.Column(db.String(32), index=True)
+  claimed_at = db.Column(db.DateTime)
+  next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+  sent_at = db.Column(db.DateTime)
+
+  def __repr__(self):
+    return f'<OutboxMail {self.id} {self.status}>'
+
+  @classmethod
+  def from_message(cls, msg: Message) -> 'OutboxMail':
+    return cls(
+      sender=msg.sender,
+      recipient=', '.join(msg.recipients),
+      subject=msg.subject,
+      body=msg.body,
+      html=msg.html)
+
+  def to_message(self) -> Message:
+    return Message(
+      self.subject,
+      sender=self.sender,
+      recipients=self.recipient.split(', '),
+      body=self.body,
+      html=self.html)
@@ -1,14 +1,36 @@
+from flask import current_app
 from app.ext import db
 
 
+class Permission:
+  """Permission flags, a role's `permissions` is a bitmask of them."""
+  FOLLOW = 1
+  COMMENT = 2
+  WRITE = 4
+  MODERATE = 8
+  ADMIN = 16
+
+
 class Role(db.Model):
   """User roles."""
   __tablename__ = 'roles'
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String(64), unique=True)
   default = db.Column(db.Boolean, default=False, index=True)
-  permessions = db.Column(db.Integer)
-  users = db.relationship('User', backref='role', lazy='dynamic')
+  permissions = db.Column(db.Integer)
+  users = db.relationship('User', back_populates='role', lazy='dynamic')
+
+  # permissions of the roles created by `insert_roles`
+  ROLES = {
+    'User': [Permission.FOLLOW, Permission.COMMENT, Permission.WRITE],
+    'Moderator': [
+      Permission.FOLLOW, Permission.COMMENT, Permission.WRITE,
+      Permission.MODERATE],
+    'Administrator': [
+      Permission.FOLLOW, Permission.COMMENT, Permission.WRITE,
+      Permission.MODERATE, Permission.ADMIN],
+  }
+  DEFAULT_ROLE = 'User'
   
   def __repr__(self):
     return f'<Role {self.name}>'
@@ -17,4 +39,55 @@ class Role(db.Model):
     super(Role, self).__init__(**kwargs)
     if self.permissions is None:
       self.permissions = 0
-      
\ No newline at end of file
+
+  def has_permission(self, permission: int) -> bool:
+    return self.permissions & permission == permission
+
+  def add_permission(self, permission: int) -> None:
+    if not self.has_permission(permission):
+      self.permissions += permission
+
+  def remove_permission(self, permission: int) -> None:
+    if self.has_permission(permission):
+      self.permissions -= permission
+
+  def reset_permissions(self) -> None:
+    self.permissions = 0
+
+  @staticmethod
+  def insert_roles() -> int:
+    """
+    Create or update the roles in `Role.ROLES`, users without a role, e.g.
+    registered before roles existed, get the administrator role when their
+    email is `ADMIN_EMAIL` and the default role otherwise
+
+    :returns: number of users given a role
+    """
+    from .user import User, normalize_email
+    roles = {}
+    for name, permissions in Role.ROLES.items():
+      role = Role.query.filter_by(name=name).first()
+      if role is None:
+        role = Role(name=name)
+      role.reset_permissions()
+      for permission in permissions:
+        role.add_permission(permission)
+      role.default = name == Role.DEFAULT_ROLE
+      db.session.add(role)
+      roles[name] = role
+    db.session.flush()
+
+    assigned = 0
+    admin_email = current_app.config['ADMIN_EMAIL']
+    if admin_email:
+      assigned += db.session.execute(
+        db.update(User)
+        .where(User.role_id.is_(None))
+        .where(User.email_normalized == normalize_email(admin_email))
+        .values(role_id=roles['Administrator'].id)).rowcount
+    assigned += db.session.execute(
+      db.update(User)
+      .where(User.role_id.is_(None))
+      .values(role_id=roles[Role.DEFAULT_ROLE].id)).rowcount
+    db.session.commit()
+    return assigned
@@ -1,27 +1,73 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import UserMixin
-from app.ext import db
+from typing import Union
+from flask import current_app, has_app_context
+from flask_login import UserMixin, AnonymousUserMixin
+from sqlalchemy.orm import validates
+from app.ext import db, password_hasher
+from .role import Permission
+
+
+def normalize_email(email: Union[str, None]) -> Union[str, None]:
+  """Form of an email address its lookups compare, case insensitive."""
+  return email.strip().lower() if email is not None else None
+
+
+def default_email_normalized(context) -> Union[str, None]:
+  """Normalized email of rows inserted without the ORM."""
+  return normalize_email(context.get_current_parameters().get('email'))
+
+
+def default_role_id(context) -> Union[int, None]:
+  """Role of a new user, the administrator role for `ADMIN_EMAIL`."""
+  if not has_app_context():
+    return None
+  return current_app.extensions['roles'].role_for(
+    context.get_current_parameters().get('email'), context.connection)
 
 
 class User(db.Model, UserMixin):
   __tablename__ = 'users'
   id = db.Column(db.Integer, primary_key=True)
   email = db.Column(db.String(64), unique=True, index=True)
+  # written with `email`, lookups by email go through its index
+  email_normalized = db.Column(
+    db.String(64), unique=True, index=True, default=default_email_normalized)
   username = db.Column(db.String(64), unique=True, index=True)
   password_hash = db.Column(db.String(128))
   confirmed = db.Column(db.Boolean, default=False)
-  role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
+  role_id = db.Column(
+    db.Integer, db.ForeignKey('roles.id'), default=default_role_id)
+  role = db.relationship('Role', back_populates='users')
 
   def __repr__(self):
     return f'<User {self.username}>'
   
+  @validates('email')
+  def _set_email_normalized(self, key, email):
+    self.email_normalized = normalize_email(email)
+    return email
+  
   @property
   def password(self):
     raise AttributeError('password is not a readable attribute')
   
   @password.setter
   def password(self, password):
-    self.password_hash = generate_password_hash(password)
+    self.password_hash = password_hasher.hash(password)
   
   def verify_password(self, password: str) -> bool:
-    return check_password_hash(self.password_hash, password)
+    return password_hasher.verify(self.password_hash, password)
+  
+  def can(self, permission: int) -> bool:
+    """Check `permission` against the role table, without a query."""
+    return current_app.extensions['roles'].can(self.role_id, permission)
+  
+  def is_administrator(self) -> bool:
+    return self.can(Permission.ADMIN)
+
+
+class AnonymousUser(AnonymousUserMixin):
+  def can(self, permission: int) -> bool:
+    return False
+  
+  def is_administrator(self) -> bool:
+    return False
@@ -1 +1,3 @@
-from .user_service import UserService
+from .user_service import UserService, UserPage
+from .async_user_service import AsyncUserService
+from .user_import import UserImporter, read_users
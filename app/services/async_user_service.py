@@ -0,0 +1,360 @@
+import asyncio
+import logging
+import contextvars
+from functools import partial
+from typing import Iterable, Union
+from flask import Flask
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models import User, OutboxMail, normalize_email
+from app.ext import password_hasher
+from app.errors import (
+  UserNotFoundError, PasswordValidationError, EmailAlreadyExistsError,
+  TokenPayloadError, MailError)
+from app.utils.security import generate_timed_token, decode_timed_token
+from app.utils.send_mail import build_message, send_message_async
+from app.utils.cache import TTLCache
+from .user_service import UserService, unique_violation, unique_values, chunked
+
+logger = logging.getLogger(__name__)
+
+# asyncio drivers of the databases we run on
+_ASYNC_DRIVERS = {
+  'sqlite': 'sqlite+aiosqlite',
+  'postgresql': 'postgresql+asyncpg',
+  'mysql': 'mysql+aiomysql',
+}
+
+
+def async_database_url(url: str) -> str:
+  """:returns: `url` with the asyncio driver of its database"""
+  scheme, sep, rest = url.partition('://')
+  return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+async def run_sync(func, *args):
+  """Run blocking `func` in the default executor, inside the app context."""
+  ctx = contextvars.copy_context()
+  return await asyncio.get_running_loop().run_in_executor(
+    None, partial(ctx.run, func, *args))
+
+
+class AsyncUserService:
+  """
+  asyncio counterpart of `UserService` with the same methods, arguments
+  and errors, for async views:
+
+    user = await current_app.async_user_service.authenticate(email, password)
+
+  Queries run on an SQLAlchemy asyncio engine for `ASYNC_DATABASE_URL`,
+  the app's database with its asyncio driver by default, password hashing
+  runs in the default executor and mail is sent with aiosmtplib, so one
+  worker overlaps database, SMTP and hashing waits of many requests.
+  Returned users are detached, change them through the service.
+
+  Needs the asyncio driver of the database ("aiosqlite" locally),
+  "aiosmtplib" and "flask[async]", the "async" extra of the project,
+  imported on first use. Flask runs every
+  async view in its own event loop, drivers whose connections are bound to
+  a loop (asyncpg) need `NullPool` in `ASYNC_ENGINE_OPTIONS`.
+  """
+  def __init__(
+      self, app: Flask, identity_cache: TTLCache=None,
+      recent_writes: TTLCache=None):
+    self.app = app
+    # shared with `UserService` so both see each other's invalidations
+    self.identity_cache = identity_cache if identity_cache is not None \
+      else TTLCache(
+        maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+    # shared too, so `UserService.get` reads users changed here from the primary
+    self.recent_writes = recent_writes if recent_writes is not None \
+      else TTLCache(maxsize=1024, ttl=app.config['REPLICA_MAX_LAG'])
+    self._engine = None
+    self._sessionmaker = None
+
+  @property
+  def engine(self):
+    """:raises RuntimeError: if the database's asyncio driver isn't installed"""
+    if self._engine is None:
+      from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+      url = self.app.config['ASYNC_DATABASE_URL'] or \
+        async_database_url(self.app.config['SQLALCHEMY_DATABASE_URI'])
+      try:
+        self._engine = create_async_engine(
+          url, **self.app.config['ASYNC_ENGINE_OPTIONS'])
+      except ImportError as e:
+        raise RuntimeError(
+          f'the async user service needs the asyncio driver for "{url}" '
+          f'({e.name}), install the "async" extra: pip install ".[async]"') from e
+      self._sessionmaker = async_sessionmaker(self._engine, expire_on_commit=False)
+    return self._engine
+
+  def session(self):
+    """:returns: a new `AsyncSession`, use it with `async with`"""
+    self.engine
+    return self._sessionmaker()
+
+  async def dispose(self) -> None:
+    """Close the engine's pooled connections."""
+    if self._engine is not None:
+      await self._engine.dispose()
+
+  async def get(self, id: int) -> Union[User, None]:
+    """
+    Get user by id, served from the identity cache when possible, otherwise
+    loaded together with their role.
+    """
+    id = int(id)
+    identity = self.identity_cache.get(id)
+    if identity is not None:
+      user = User(**identity)
+      make_transient_to_detached(user)
+      return user
+
+    async with self.session() as session:
+      user = await session.get(User, id, options=[joinedload(User.role)])
+    if user is not None:
+      self.identity_cache.set(id, UserService._identity(user))
+    return user
+
+  def invalidate(self, user: User) -> None:
+    """Drop user from the identity cache after it has been changed."""
+    self.identity_cache.delete(user.id)
+    self.recent_writes.set(user.id, True)
+
+  async def _first(self, statement) -> Union[User, None]:
+    async with self.session() as session:
+      return (await session.scalars(statement)).first()
+
+  @staticmethod
+  async def _commit_unique(session, statement=None) -> None:
+    """
+    Execute `statement` if given and commit, mapping unique constraint
+    violations on `users` like `UserService._commit_unique`
+
+    :raises EmailAlreadyExistsError: if the email is already registered
+    :raises UsernameAlreadyExistsError: if the username is already registered
+    """
+    try:
+      if statement is not None:
+        await session.execute(statement)
+      await session.commit()
+    except IntegrityError as e:
+      await session.rollback()
+      error = unique_violation(e)
+      if error is None:
+        raise
+      raise error() from e
+
+  async def _update(self, user: User, **values) -> None:
+    """Update the user's row and the given instance, without marking it dirty."""
+    async with self.session() as session:
+      await self._commit_unique(
+        session, update(User).where(User.id == user.id).values(**values))
+    for key, value in values.items():
+      set_committed_value(user, key, value)
+    self.invalidate(user)
+
+  async def _send_mail(self, to: str, subject: str, template: str, **kwargs) -> bool:
+    """
+    Send or store an email, a failed delivery is logged rather than raised
+    like `UserService` does, the user can ask for the email again
+
+    :returns: whether the email was sent or stored
+    """
+    msg = build_message(to, subject, template, **kwargs)
+    if self.app.config['MAIL_USE_OUTBOX']:
+      async with self.session() as session:
+        session.add(OutboxMail.from_message(msg))
+        await session.commit()
+      return True
+    try:
+      await send_message_async(msg)
+    except MailError as e:
+      logger.warning('Mail "%s" to %s not sent: %s', subject, to, e)
+      return False
+    return True
+
+  async def get_by_email(self, email: str) -> Union[User, None]:
+    """Get user by email account, ignoring case."""
+    return await self._first(
+      select(User).filter_by(email_normalized=normalize_email(email)))
+
+  async def get_by_username(self, username: str) -> Union[User, None]:
+    """Get user by username."""
+    return await self._first(select(User).filter_by(username=username))
+
+  async def get_many(self, ids: Iterable[int]) -> dict:
+    """:returns: dict of found users keyed by id, with chunked IN queries"""
+    return await self._read_many(
+      'id', unique_values(int(id) for id in ids if id is not None))
+
+  async def get_many_by_email(self, emails: Iterable[str]) -> dict:
+    """:returns: dict of found users keyed by the given emails, ignoring case"""
+    normalized = {email: normalize_email(email) for email in unique_values(emails)}
+    found = await self._read_many(
+      'email_normalized', unique_values(normalized.values()))
+    return {
+      email: found[value] for email, value in normalized.items() if value in found}
+
+  async def get_many_by_username(self, usernames: Iterable[str]) -> dict:
+    """:returns: dict of found users keyed by username"""
+    return await self._read_many('username', unique_values(usernames))
+
+  async def _read_many(self, key: str, values: list) -> dict:
+    column = getattr(User, key)
+    found = {}
+    async with self.session() as session:
+      for chunk in chunked(values):
+        for user in await session.scalars(select(User).where(column.in_(chunk))):
+          found[getattr(user, key)] = user
+    return found
+
+  async def register_user(self, email: str, username: str, password: str) -> User:
+    """
+    Create a new user in the database and send account confirmation email
+
+    :returns: `User` instance
+    :raises EmailAlreadyExistsError: if provided email already registered
+    :raises UsernameAlreadyExistsError: if provided username already registered
+    """
+    user = User(username=username, email=email)
+    user.password_hash = await run_sync(password_hasher.hash, password)
+    async with self.session() as session:
+      session.add(user)
+      await self._commit_unique(session)
+    await self.send_confirmation_mail(user)
+    return user
+
+  async def authenticate(self, email: str, password: str) -> User:
+    """
+    verify login credentials, rehash the password if its hash doesn't use
+    the current cost profile
+
+    :raises UserNotFoundError: if no matching email is found
+    :raises PasswordValidationError: if password hash does not match
+    """
+    user = await self.get_by_email(email)
+    if user is None:
+      raise UserNotFoundError()
+    if not await run_sync(password_hasher.verify, user.password_hash, password):
+      raise PasswordValidationError()
+    if password_hasher.needs_rehash(user.password_hash):
+      await self._update(
+        user, password_hash=await run_sync(password_hasher.hash, password))
+    return user
+
+  async def confirm_user(self, user: User, token: str) -> bool:
+    """
+    :return: true and confirm the user if token is valid
+    :raises TokenPayloadError: if token pointed at different user's id
+    :raises TokenError: if token in invalid, malformed, expired
+    """
+    decoded = decode_timed_token(token)
+    if decoded.get('confirm') != user.id:
+      raise TokenPayloadError(message='Token does not match the user')
+    if not user.confirmed:
+      await self._update(user, confirmed=True)
+      return True
+
+  async def send_confirmation_mail(self, user: User) -> bool:
+    """
+    Send account confirmation email to the user
+
+    :returns: whether the email was sent
+    """
+    token = generate_timed_token({'confirm': user.id})
+    return await self._send_mail(
+      to=user.email,
+      subject='Confirm Your Email',
+      template='email/auth/confirm',
+      user=user, token=token)
+
+  async def update_profile(self, user: User, username=None) -> None:
+    """:raises UsernameAlreadyExistsError: if username name already in use"""
+    if username == user.username:
+      return
+    await self._update(user, username=username)
+
+  async def update_email_request(self, user: User, new_email: str) -> bool:
+    """
+    :returns: whether the email was sent
+    :raises EmailAlreadyExistsError: if another user has the email
+    """
+    found = await self.get_by_email(new_email)
+    if found is not None and found.id != user.id:
+      raise EmailAlreadyExistsError()
+    token = generate_timed_token({
+      'email': user.email,
+      'new-email': new_email
+    })
+    return await self._send_mail(
+      to=new_email,
+      subject='Change Email Address',
+      template='email/user/update-email',
+      token=token)
+
+  async def update_email(self, user: User, token: str) -> None:
+    """
+    :raises TokenPayloadError: if user's email address is mismatched
+    :raises EmailAlreadyExistsError: if the new email got registered since
+    the request
+    """
+    decoded = decode_timed_token(token)
+    if not user.email == decoded.get('email'):
+      raise TokenPayloadError()
+    await self._update(
+      user, email=decoded['new-email'],
+      email_normalized=normalize_email(decoded['new-email']))
+
+  async def password_change_request(self, user: User, password: str) -> bool:
+    """
+    :returns: whether the email was sent
+    :raises PasswordValidationError: if provided password doesn't match
+    """
+    if not await run_sync(password_hasher.verify, user.password_hash, password):
+      raise PasswordValidationError()
+    token = generate_timed_token({'change-password': user.id})
+    return await self._send_mail(
+      to=user.email,
+      subject='Change Password',
+      template='email/user/change-password',
+      token=token)
+
+  async def change_password(self, user: User, token: str, password: str) -> None:
+    """:raises TokenPayloadError: if provided token doesn't match"""
+    decoded = decode_timed_token(token)
+    if not decoded.get('change-password') == user.id:
+      raise TokenPayloadError()
+    await self._update(
+      user, password_hash=await run_sync(password_hasher.hash, password))
+
+  async def reset_password_request(self, email: str) -> bool:
+    """
+    :returns: whether the email was sent
+    :raises UserNotFoundError: if user with given email not found
+    """
+    user = await self.get_by_email(email)
+    if user is None:
+      raise UserNotFoundError()
+    token = generate_timed_token({'reset-password': user.email_normalized})
+    return await self._send_mail(
+      to=user.email,
+      subject='Reset password',
+      template='email/auth/reset-password',
+      token=token)
+
+  async def reset_password(self, token: str, password: str) -> None:
+    """:raises TokenPayloadError: if email in the token is invalid"""
+    decoded = decode_timed_token(token)
+    email = decoded.get('reset-password')
+    if not isinstance(email, str):
+      raise TokenPayloadError()
+
+    user = await self.get_by_email(email)
+    if not user:
+      raise TokenPayloadError()
+    await self._update(
+      user, password_hash=await run_sync(password_hasher.hash, password))
@@ -0,0 +1,158 @@
+import csv
+import json
+import time
+from itertools import islice
+from typing import Iterable, Iterator, List
+from sqlalchemy.exc import IntegrityError
+from app.models import User, normalize_email
+from app.ext import db, password_hasher
+
+
+def read_users(path: str) -> Iterator[dict]:
+  """
+  Stream user rows from a ".csv" file with a header line or a ".jsonl"
+  file with one object per line, rows need "email", "username" and either
+  "password" or an already hashed "password_hash"
+  """
+  with open(path, newline='', encoding='utf-8') as f:
+    if path.endswith('.csv'):
+      yield from csv.DictReader(f)
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+
+class UserImporter:
+  """
+  Import users in batches, one bulk INSERT per batch with the passwords of
+  the batch hashed in parallel. Rows whose email or username already
+  exist, in the database or earlier in the file, and incomplete rows are
+  skipped and kept in `duplicates`.
+  """
+  def __init__(
+      self, user_service, batch_size: int=500, parallel: bool=True,
+      send_confirmation: bool=False, collect_duplicates: bool=False):
+    """
+    :param user_service: `UserService` used to send confirmation mail
+    :param batch_size: rows per INSERT
+    :param parallel: hash passwords in the process pool
+    :param send_confirmation: queue a confirmation mail for each new user,
+    mail the queue refuses is counted in `mail_failed` and the import goes on
+    :param collect_duplicates: keep skipped rows in `duplicates`
+    """
+    self.user_service = user_service
+    self.batch_size = batch_size
+    self.parallel = parallel
+    self.send_confirmation = send_confirmation
+    self.collect_duplicates = collect_duplicates
+    self.imported = 0
+    self.skipped = 0
+    self.mail_failed = 0
+    self.duplicates = []
+    self.elapsed = 0.0
+
+  @property
+  def rate(self) -> float:
+    return self.imported / self.elapsed if self.elapsed else 0.0
+
+  def run(self, rows: Iterable[dict], report=None) -> None:
+    """
+    :param rows: user rows, consumed one batch at a time
+    :param report: called with the importer after every batch
+    """
+    rows = iter(rows)
+    started = time.perf_counter()
+    while True:
+      batch = list(islice(rows, self.batch_size))
+      if not batch:
+        break
+      self.import_batch(batch)
+      self.elapsed = time.perf_counter() - started
+      if report is not None:
+        report(self)
+
+  def import_batch(self, batch: List[dict]) -> None:
+    batch = self._drop_duplicates(batch)
+    if not batch:
+      return
+
+    to_hash = [row for row in batch if not row.get('password_hash')]
+    hashes = password_hasher.hash_many(
+      [row['password'] for row in to_hash], parallel=self.parallel)
+    for row, pwhash in zip(to_hash, hashes):
+      row['password_hash'] = pwhash
+
+    values = [self._values(row) for row in batch]
+    try:
+      db.session.execute(db.insert(User), values)
+      db.session.commit()
+    except IntegrityError:
+      # lost a race with another writer, fall back to one row at a time
+      db.session.rollback()
+      values = self._insert_one_by_one(values)
+    self.imported += len(values)
+
+    if self.send_confirmation and values:
+      users = User.query.filter(User.email.in_([v['email'] for v in values]))
+      for user in users:
+        if not self.user_service.send_confirmation_mail(user):
+          self.mail_failed += 1
+
+  def _drop_duplicates(self, batch: List[dict]) -> List[dict]:
+    valid = []
+    for row in batch:
+      if row.get('email') and row.get('username') \
+          and (row.get('password') or row.get('password_hash')):
+        valid.append(row)
+      else:
+        self._skip(row, 'invalid')
+    batch = valid
+
+    emails = {normalize_email(row['email']) for row in batch}
+    usernames = {row['username'] for row in batch}
+    taken_emails = set(db.session.scalars(
+      db.select(User.email_normalized).where(User.email_normalized.in_(emails))))
+    taken_usernames = set(db.session.scalars(
+      db.select(User.username).where(User.username.in_(usernames))))
+
+    unique = []
+    for row in batch:
+      email = normalize_email(row['email'])
+      if email in taken_emails:
+        self._skip(row, 'email')
+      elif row['username'] in taken_usernames:
+        self._skip(row, 'username')
+      else:
+        taken_emails.add(email)
+        taken_usernames.add(row['username'])
+        unique.append(row)
+    return unique
+
+  def _insert_one_by_one(self, values: List[dict]) -> List[dict]:
+    inserted = []
+    for value in values:
+      try:
+        db.session.execute(db.insert(User), [value])
+        db.session.commit()
+        inserted.append(value)
+      except IntegrityError:
+        db.session.rollback()
+        self._skip(value, 'conflict')
+    return inserted
+
+  def _skip(self, row: dict, reason: str) -> None:
+    self.skipped += 1
+    if self.collect_duplicates:
+      self.duplicates.append(dict(
+        email=row.get('email'), username=row.get('username'), reason=reason))
+
+  @staticmethod
+  def _values(row: dict) -> dict:
+    confirmed = str(row.get('confirmed', '')).lower() in ['true', 'on', '1']
+    return dict(
+      email=row['email'],
+      email_normalized=normalize_email(row['email']),
+      username=row['username'],
+      password_hash=row['password_hash'],
+      confirmed=confirmed)
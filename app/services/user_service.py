@@ -1,30 +1,278 @@
-from typing import Union
+import logging
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Union
 from flask import Flask
-from email_validator import validate_email, EmailNotValidError
-from app.models import User
-from app.ext import db
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached, joinedload
+from sqlalchemy.orm.util import identity_key
+from app.models import User, normalize_email
+from app.ext import db, password_hasher
 from app.errors import (
   UserNotFoundError, PasswordValidationError, UsernameAlreadyExistsError,
-  EmailAlreadyExistsError, TokenError, TokenPayloadError)
+  EmailAlreadyExistsError, TokenError, TokenPayloadError, MailQueueFullError)
 from app.utils.security import generate_timed_token, decode_timed_token
 from app.utils.send_mail import send_mail
+from app.utils.cache import TTLCache
+from app.utils.replica import replica_reads, has_replica
+
+logger = logging.getLogger(__name__)
+
+# names a unique violation on `users` mentions, across database drivers
+_UNIQUE_VIOLATIONS = (
+  (('users.email_normalized', 'ix_users_email_normalized', 'users.email',
+    'ix_users_email'), EmailAlreadyExistsError),
+  (('users.username', 'ix_users_username'), UsernameAlreadyExistsError),
+)
+
+# values per IN clause of the batch lookups, below SQLite's 999 parameters
+IN_CHUNK_SIZE = 500
+
+
+def chunked(values: list, size: int=IN_CHUNK_SIZE) -> Iterable[list]:
+  for i in range(0, len(values), size):
+    yield values[i:i + size]
+
+
+def unique_values(values: Iterable) -> list:
+  """:returns: `values` without duplicates or `None`, in their first order"""
+  return [v for v in dict.fromkeys(values) if v is not None]
+
+
+class UserPage(NamedTuple):
+  """One page of users, with the cursors of its neighbour pages."""
+  users: List[User]
+  next_after: Union[int, None]
+  prev_before: Union[int, None]
+
+
+def unique_violation(e: IntegrityError) -> Union[type, None]:
+  """:returns: the registration error matching a unique violation, if any"""
+  message = str(e.orig)
+  # the violated constraint is named before any offending value
+  found = [
+    (message.find(name), error)
+    for names, error in _UNIQUE_VIOLATIONS
+    for name in names if name in message]
+  if not found:
+    return None
+  return min(found, key=lambda f: f[0])[1]
 
 
 class UserService:
   def __init__(self, app: Flask):
     self.app = app
+    # column values of recently loaded users, keyed by id
+    self.identity_cache = TTLCache(
+      maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+    # ids of users changed in the last `REPLICA_MAX_LAG` seconds, the
+    # replica may not have their change yet
+    self.recent_writes = TTLCache(
+      maxsize=max(app.config['USER_CACHE_SIZE'], 1024),
+      ttl=app.config['REPLICA_MAX_LAG'])
   
   def get(self, id: int) -> Union[User, None]:
-    """Get user by id."""
-    return User.query.get(int(id))
+    """
+    Get user by id. A user already in the current session is returned as
+    is, with any pending changes. Otherwise it is served from the identity
+    cache when possible, the cached row is attached to the session without
+    a query, or loaded together with their role. Users changed in the last
+    `REPLICA_MAX_LAG` seconds are loaded from the primary, so a lagging
+    replica's old row isn't cached.
+    """
+    id = int(id)
+    user = db.session.identity_map.get(identity_key(User, id))
+    if user is not None:
+      return user
+    identity = self.identity_cache.get(id)
+    if identity is not None:
+      user = User(**identity)
+      make_transient_to_detached(user)
+      return db.session.merge(user, load=False)
+    
+    query = lambda: db.session.get(User, id, options=[joinedload(User.role)])
+    user = query() if id in self.recent_writes else self._read(query)
+    if user is not None:
+      self.identity_cache.set(id, self._identity(user))
+    return user
+  
+  @staticmethod
+  def _read(query: Callable):
+    """
+    Run a read only `query` on the replica when one is configured, rows
+    that haven't replicated yet are read from the primary
+    """
+    with replica_reads():
+      result = query()
+    if result is None and has_replica(db):
+      result = query()
+    return result
+  
+  @staticmethod
+  def _identity(user: User) -> dict:
+    return {
+      attr.key: getattr(user, attr.key)
+      for attr in inspect(User).column_attrs}
+  
+  def invalidate(self, user: User) -> None:
+    """Drop user from the identity cache after it has been changed."""
+    self.identity_cache.delete(user.id)
+    self.recent_writes.set(user.id, True)
+  
+  @staticmethod
+  def _commit_unique() -> None:
+    """
+    Commit and map unique constraint violations on `users` to registration
+    errors, the session is rolled back first
+
+    :raises EmailAlreadyExistsError: if the email is already registered
+    :raises UsernameAlreadyExistsError: if the username is already registered
+    """
+    try:
+      db.session.commit()
+    except IntegrityError as e:
+      db.session.rollback()
+      error = unique_violation(e)
+      if error is None:
+        raise
+      raise error() from e
   
   def get_by_email(self, email: str) -> Union[User, None]:
-    """Get user by email account."""
-    return User.query.filter_by(email=email).first()
+    """Get user by email account, ignoring case."""
+    email = normalize_email(email)
+    return self._read(
+      lambda: User.query.filter_by(email_normalized=email).first())
   
   def get_by_username(self, username: str) -> Union[User, None]:
     """Get user py username."""
-    return User.query.filter_by(username=username).first()
+    return self._read(
+      lambda: User.query.filter_by(username=username).first())
+  
+  def get_many(self, ids: Iterable[int]) -> dict:
+    """
+    Get users by id, users already in the session are used as they are,
+    the rest are loaded with chunked IN queries
+
+    :returns: dict of found users keyed by id
+    """
+    return self._read_many(
+      'id', unique_values(int(id) for id in ids if id is not None))
+  
+  def get_many_by_email(self, emails: Iterable[str]) -> dict:
+    """
+    :returns: dict of found users keyed by the given emails, matched
+    ignoring case, see `get_many`
+    """
+    normalized = {email: normalize_email(email) for email in unique_values(emails)}
+    found = self._read_many('email_normalized', unique_values(normalized.values()))
+    return {
+      email: found[value] for email, value in normalized.items() if value in found}
+  
+  def get_many_by_username(self, usernames: Iterable[str]) -> dict:
+    """:returns: dict of found users keyed by username, see `get_many`"""
+    return self._read_many('username', unique_values(usernames))
+  
+  def _read_many(self, key: str, values: list) -> dict:
+    found = self._from_session(key, values)
+    missing = [v for v in values if v not in found]
+    with replica_reads():
+      found.update(self._query_in(key, missing))
+    missing = [v for v in missing if v not in found]
+    if missing and has_replica(db):
+      found.update(self._query_in(key, missing))
+    return found
+  
+  @staticmethod
+  def _from_session(key: str, values: list) -> dict:
+    """
+    Users of the current session whose loaded `key` is in `values`, expired
+    users are left to the query, which refreshes them in the same pass
+    """
+    identity_map = db.session.identity_map
+    if key == 'id':
+      users = (identity_map.get(identity_key(User, id)) for id in values)
+    else:
+      users = (obj for obj in identity_map.values() if isinstance(obj, User))
+    wanted = set(values)
+    found = {}
+    for user in users:
+      if user is None:
+        continue
+      state = inspect(user)
+      # read the loaded value, an expired attribute would emit a query
+      value = state.dict.get(key)
+      if value in wanted and not state.expired and not state.was_deleted:
+        found[value] = user
+    return found
+  
+  @staticmethod
+  def _query_in(key: str, values: list) -> dict:
+    column = getattr(User, key)
+    found = {}
+    for chunk in chunked(values):
+      for user in User.query.filter(column.in_(chunk)):
+        found[getattr(user, key)] = user
+    return found
+  
+  @staticmethod
+  def _filtered(statement, confirmed: bool=None, role_id: int=None):
+    if confirmed is not None:
+      statement = statement.where(User.confirmed.is_(confirmed))
+    if role_id is not None:
+      statement = statement.where(User.role_id == role_id)
+    return statement
+  
+  def users_page(
+      self, after: int=None, before: int=None, confirmed: bool=None,
+      role_id: int=None, per_page: int=50) -> UserPage:
+    """
+    Page through users by id with a keyset instead of an offset, so deep
+    pages cost as much as the first one. Reads go to the replica.
+
+    :param after: id of the last user of the previous page
+    :param before: id of the first user of the next page, to page back
+    :param confirmed: only confirmed or unconfirmed users
+    :param role_id: only users of this role
+    """
+    statement = self._filtered(select(User), confirmed, role_id)
+    # one extra row tells whether there is a page beyond this one
+    if before is not None:
+      statement = statement.where(User.id < before) \
+        .order_by(User.id.desc()).limit(per_page + 1)
+    else:
+      if after is not None:
+        statement = statement.where(User.id > after)
+      statement = statement.order_by(User.id).limit(per_page + 1)
+    with replica_reads():
+      users = db.session.scalars(statement).all()
+    more = len(users) > per_page
+    users = users[:per_page]
+    if before is not None:
+      users.reverse()
+      has_next, has_prev = True, more
+    else:
+      has_next, has_prev = more, after is not None
+    return UserPage(
+      users=users,
+      next_after=users[-1].id if has_next and users else None,
+      prev_before=users[0].id if has_prev and users else None)
+  
+  def iter_users(
+      self, confirmed: bool=None, role_id: int=None,
+      batch_size: int=1000) -> Iterator[list]:
+    """
+    Stream users in id order from a server side cursor, filtered like
+    `users_page`, without loading the table or building model instances
+
+    :returns: lists of up to `batch_size` rows with `id`, `username`,
+    `email`, `confirmed` and `role_id`
+    """
+    statement = self._filtered(
+      select(User.id, User.username, User.email, User.confirmed, User.role_id),
+      confirmed, role_id).order_by(User.id)
+    with replica_reads():
+      result = db.session.execute(
+        statement.execution_options(yield_per=batch_size))
+    yield from result.partitions()
   
   def register_user(self, email: str, username: str, password: str) -> User:
     """
@@ -37,22 +285,17 @@ class UserService:
     :raises EmailAlreadyExistsError: if provided email already registered
     :raises UsernameAlreadyExistsError: if provided username already registered
     """
-    user = User.query.filter_by(email=email).first()
-    if user is not None:
-      raise EmailAlreadyExistsError()
-    user = User.query.filter_by(username=username).first()
-    if user is not None:
-      raise UsernameAlreadyExistsError()
-    
-    user = User(username=username, email=email, password=password)
+    user = User(username=username, email=email)
+    user.password_hash = password_hasher.hash(password)
     db.session.add(user)
-    db.session.commit()
+    self._commit_unique()
     self.send_confirmation_mail(user)
     return user
   
   def authenticate(self, email: str, password: str) -> User:
     """
-    verify login credentials
+    verify login credentials, rehash the password if its hash doesn't use
+    the current cost profile
 
     :param email: the provided email address
     :param password: the provided password
@@ -63,8 +306,14 @@ class UserService:
     user = self.get_by_email(email)
     if user is None:
       raise UserNotFoundError()
-    if not user.verify_password(password):
+    if not password_hasher.verify(user.password_hash, password):
       raise PasswordValidationError()
+    if password_hasher.needs_rehash(user.password_hash):
+      # hashed with an older cost profile, upgrade while we know the password
+      user.password_hash = password_hasher.hash(password)
+      db.session.add(user)
+      db.session.commit()
+      self.invalidate(user)
     
     return user
 
@@ -83,16 +332,33 @@ class UserService:
       user.confirmed = True
       db.session.add(user)
       db.session.commit()
+      self.invalidate(user)
       return True
 
-  def send_confirmation_mail(self, user: User) -> None:
+  @staticmethod
+  def _send_mail(to: str, subject: str, template: str, **kwargs) -> bool:
+    """
+    Queue an email, a full or stopped mail queue is logged rather than
+    raised, the user can ask for the email again
+
+    :returns: whether the email was queued
+    """
+    try:
+      send_mail(to=to, subject=subject, template=template, **kwargs)
+    except MailQueueFullError as e:
+      logger.warning('Mail "%s" to %s not queued: %s', subject, to, e)
+      return False
+    return True
+
+  def send_confirmation_mail(self, user: User) -> bool:
     """
     Send account confirmation email to the user
     
     :param user: `User` model instance
+    :returns: whether the email was queued
     """
     token = generate_timed_token({'confirm': user.id})
-    send_mail(
+    return self._send_mail(
       to=user.email, 
       subject='Confirm Your Email', 
       template='email/auth/confirm', 
@@ -108,29 +374,32 @@ class UserService:
     """
     if username == user.username:
       return
-    elif User.query.filter_by(username=username).first():
-      raise UsernameAlreadyExistsError()
     user.username = username
     db.session.add(user)
-    db.session.commit()
+    self._commit_unique()
+    self.invalidate(user)
     
   
-  def update_email_request(self, user: User, new_email: str) -> None:
+  def update_email_request(self, user: User, new_email: str) -> bool:
     """
-    Send email to update user's email address.
+    Send email to update user's email address, the user's own email with
+    another case is allowed.
     
     :param user: `User` model instance
     :param new_email: user's new email
-    :raises EmailAlreadyExistsError: if email already exists in database
+    :returns: whether the email was queued
+    :raises EmailAlreadyExistsError: if another user has the email
     """
-    email_found = User.query.filter_by(email=new_email).first()
+    email_found = User.query.filter(
+      User.email_normalized == normalize_email(new_email),
+      User.id != user.id).first()
     if email_found:
       raise EmailAlreadyExistsError()
     token = generate_timed_token({
       'email': user.email,
       'new-email': new_email
     })
-    send_mail(
+    return self._send_mail(
       to=new_email, 
       subject='Change Email Address', 
       template='email/user/update-email', 
@@ -143,26 +412,30 @@ class UserService:
     :param user: `User` model instance
     :param token: token included in the url
     :raises TokenPayloadError: if user's email address is mismatched
+    :raises EmailAlreadyExistsError: if the new email got registered since
+    the request
     """
     decoded = decode_timed_token(token)
     if not user.email == decoded.get('email'):
       raise TokenPayloadError()
     user.email = decoded['new-email']
     db.session.add(user)
-    db.session.commit()
+    self._commit_unique()
+    self.invalidate(user)
   
-  def password_change_request(self, user: User, password: str) -> None:
+  def password_change_request(self, user: User, password: str) -> bool:
     """
     Request password change
     
     :param user: `User` model instance
     :param password: user's original password
+    :returns: whether the email was queued
     :raises PasswordValidationError: if provided password doesn't match
     """
-    if not user.verify_password(password):
+    if not password_hasher.verify(user.password_hash, password):
       raise PasswordValidationError()
     token = generate_timed_token({'change-password': user.id})
-    send_mail(
+    return self._send_mail(
       to=user.email,
       subject='Change Password',
       template='email/user/change-password',
@@ -180,24 +453,26 @@ class UserService:
     decoded = decode_timed_token(token)
     if not decoded.get('change-password') == user.id:
       raise TokenPayloadError()
-    user.password = password
+    user.password_hash = password_hasher.hash(password)
     db.session.add(user)
     db.session.commit()
+    self.invalidate(user)
   
-  def reset_password_request(self, email: str) -> None:
+  def reset_password_request(self, email: str) -> bool:
     """
     Send email to request password reset
     
     :param email: user's email
+    :returns: whether the email was queued
     :raises UserNotFoundError: if user with given email not found
     """
-    email_found = User.query.filter_by(email=email).first()
-    if not email_found:
+    user = User.query.filter_by(email_normalized=normalize_email(email)).first()
+    if not user:
       raise UserNotFoundError()
     
-    token = generate_timed_token({'reset-password': email})
-    send_mail(
-      to=email, 
+    token = generate_timed_token({'reset-password': user.email_normalized})
+    return self._send_mail(
+      to=user.email, 
       subject='Reset password', 
       template='email/auth/reset-password',
       token=token)
@@ -211,21 +486,15 @@ class UserService:
     :raises TokenPayloadError: if email in the token is invalid
     """
     decoded = decode_timed_token(token)
-    try:
-      email_info = validate_email(
-        decoded.get('reset-password'), check_deliverability=False)
-      try:
-        email = email_info.normalized
-      except AttributeError:
-        # older version of email-validator fix
-        email = email_info.email
-    except EmailNotValidError:
+    email = decoded.get('reset-password')
+    if not isinstance(email, str):
       raise TokenPayloadError()
     
-    user = User.query.filter_by(email=email).first()
+    user = User.query.filter_by(email_normalized=normalize_email(email)).first()
     if not user:
       raise TokenPayloadError()
     
-    user.password = password
+    user.password_hash = password_hasher.hash(password)
     db.session.add(user)
     db.session.commit()
+    self.invalidate(user)
@@ -0,0 +1,167 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+import mimetypes
+from flask import Flask, current_app, request, send_from_directory, url_for
+
+# files worth a precompressed copy, smaller ones aren't
+COMPRESSIBLE = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.ico', '.ttf')
+MIN_COMPRESS_SIZE = 512
+# source files of the static folder that are never served
+IGNORED = ('package.json', 'package-lock.json')
+# what gets built, the app's own folders and the vendored files base.html uses
+SOURCES = (
+  'assets', 'css', 'index.js',
+  'node_modules/bootstrap/dist',
+  'node_modules/@popperjs/core/dist/umd',
+  'node_modules/dayjs/dayjs.min.js',
+  'node_modules/@fontsource/material-icons/index.css',
+)
+
+
+def fingerprint(path: str) -> str:
+  """:returns: the first 8 hex digits of the file's sha256"""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(65536), b''):
+      digest.update(chunk)
+  return digest.hexdigest()[:8]
+
+
+def build_assets(static_folder: str, build_dir: str, sources: tuple) -> dict:
+  """
+  Copy the `sources` of `static_folder`, files or folders relative to it, to
+  a new folder of `build_dir` under fingerprinted names, "css/base.css"
+  becomes "css/base.1a2b3c4d.css", with a gzip copy next to compressible
+  files. "manifest.json" is then replaced in one step to point at the new
+  build, workers still serving the previous one keep its folder.
+
+  :returns: the manifest, source names mapped to fingerprinted names
+  """
+  os.makedirs(build_dir, exist_ok=True)
+  version_dir = tempfile.mkdtemp(prefix='build-', dir=build_dir)
+  manifest = {}
+  for source in _source_files(static_folder, sources):
+    rel = os.path.relpath(source, static_folder).replace(os.sep, '/')
+    stem, ext = os.path.splitext(rel)
+    target = f'{stem}.{fingerprint(source)}{ext}'
+    dest = os.path.join(version_dir, target)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.copyfile(source, dest)
+    if ext in COMPRESSIBLE and os.path.getsize(source) >= MIN_COMPRESS_SIZE:
+      with open(source, 'rb') as src, gzip.GzipFile(
+          dest + '.gz', 'wb', compresslevel=9, mtime=0) as gz:
+        shutil.copyfileobj(src, gz)
+    manifest[rel] = target
+  os.chmod(version_dir, 0o755)
+  version = os.path.basename(version_dir)
+  path = os.path.join(build_dir, 'manifest.json')
+  previous = _read_manifest(path).get('version')
+  with open(path + '.tmp', 'w') as f:
+    json.dump(dict(version=version, files=manifest), f, indent=2, sort_keys=True)
+  os.replace(path + '.tmp', path)
+  # older builds have no workers left once the previous one was loaded
+  for name in os.listdir(build_dir):
+    if name.startswith('build-') and name not in (version, previous):
+      shutil.rmtree(os.path.join(build_dir, name), ignore_errors=True)
+  return manifest
+
+
+def _source_files(static_folder: str, sources: tuple):
+  """:returns: the files of `sources`, missing ones are skipped"""
+  for source in sources:
+    path = os.path.join(static_folder, source)
+    if os.path.isfile(path):
+      yield path
+    for root, dirs, files in os.walk(path):
+      dirs.sort()
+      for name in sorted(files):
+        if name not in IGNORED:
+          yield os.path.join(root, name)
+
+
+def _read_manifest(path: str) -> dict:
+  if not os.path.exists(path):
+    return {}
+  with open(path) as f:
+    return json.load(f)
+
+
+class _AssetsState:
+  """Manifest and build folder of one application."""
+  def __init__(self, app: Flask):
+    self.build_dir = app.config['ASSETS_BUILD_DIR'] or \
+      os.path.join(app.static_folder, 'build')
+    self.max_age = app.config['ASSETS_MAX_AGE']
+    self.load()
+
+  def load(self) -> None:
+    data = _read_manifest(os.path.join(self.build_dir, 'manifest.json'))
+    self.manifest = data.get('files', {})
+    self.version_dir = os.path.join(self.build_dir, data.get('version', ''))
+    self.built = set(self.manifest.values())
+
+  def serve(self, filename: str):
+    if filename not in self.built:
+      # not fingerprinted, e.g. fonts referenced from built stylesheets
+      return send_from_directory(current_app.static_folder, filename)
+    gz = os.path.join(self.version_dir, filename + '.gz')
+    if 'gzip' in request.accept_encodings and os.path.exists(gz):
+      response = send_from_directory(
+        self.version_dir, filename + '.gz', max_age=self.max_age,
+        mimetype=mimetypes.guess_type(filename)[0])
+      response.headers['Content-Encoding'] = 'gzip'
+    else:
+      response = send_from_directory(
+        self.version_dir, filename, max_age=self.max_age)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+class Assets:
+  """
+  Serve the files built by "flask assets build" under `ASSETS_URL_PATH`
+  with far future, immutable caching and their gzip copies. Templates use
+  `asset_url(filename)` in place of `url_for('static', filename=...)`, it
+  falls back to the plain static file until assets are built.
+  """
+  def __init__(self, app: Flask=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('ASSETS_URL_PATH', '/assets')
+    app.config.setdefault('ASSETS_BUILD_DIR', None)
+    app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    app.config.setdefault('ASSETS_SOURCES', SOURCES)
+    state = _AssetsState(app)
+    app.extensions['assets'] = state
+    app.add_url_rule(
+      app.config['ASSETS_URL_PATH'] + '/<path:filename>', 'assets', state.serve)
+    app.add_template_global(asset_url)
+
+  @staticmethod
+  def build(app: Flask) -> dict:
+    """Build the assets of `app` and reload its manifest."""
+    state = app.extensions['assets']
+    manifest = build_assets(
+      app.static_folder, state.build_dir, app.config['ASSETS_SOURCES'])
+    state.load()
+    # cached fragments link to the previous build
+    fragments = app.extensions.get('template_cache')
+    if fragments is not None:
+      fragments.clear()
+    return manifest
+
+
+def asset_url(filename: str, **values) -> str:
+  """`url_for('static', filename=...)` resolving to the fingerprinted file."""
+  built = current_app.extensions['assets'].manifest.get(filename)
+  if built is None:
+    return url_for('static', filename=filename, **values)
+  return url_for('assets', filename=built, **values)
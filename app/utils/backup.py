@@ -0,0 +1,146 @@
+import os
+import json
+import gzip
+import time
+import sqlite3
+from typing import Callable, Iterable, Sequence
+from sqlalchemy import Table, delete, insert, select
+
+
+class _Restarted(Exception):
+  pass
+
+
+def backup_sqlite(
+    source: str, target: str, pages: int=256, pause: float=0.05,
+    max_restarts: int=3, progress: Callable=None) -> int:
+  """
+  Copy the SQLite database `source` to `target` with the online backup
+  API, `pages` pages per step with a `pause` between steps, so writers
+  only wait for one step at a time. The copy is written next to `target`
+  and moved in place when complete.
+
+  SQLite restarts a backup when another connection writes to the source,
+  after `max_restarts` restarts the copy is finished in one step, holding
+  the read lock until it is done.
+
+  :param progress: called with the remaining and total page counts after
+  every step
+  :returns: number of restarts
+  """
+  partial = f'{target}.partial'
+  if os.path.exists(partial):
+    os.remove(partial)
+  restarts = 0
+  last = None
+
+  def step(status, remaining, total):
+    nonlocal restarts, last
+    if progress is not None:
+      progress(remaining, total)
+    if last is not None and remaining > last:
+      restarts += 1
+      if restarts > max_restarts:
+        raise _Restarted()
+    last = remaining
+    if remaining:
+      time.sleep(pause)
+
+  src = sqlite3.connect(source)
+  try:
+    dst = sqlite3.connect(partial)
+    try:
+      try:
+        src.backup(dst, pages=pages, progress=step)
+      except _Restarted:
+        src.backup(dst)
+    finally:
+      dst.close()
+  finally:
+    src.close()
+  os.replace(partial, target)
+  return restarts
+
+
+def dump_tables(
+    connection, tables: Sequence[Table], path: str,
+    batch_size: int=1000) -> dict:
+  """
+  Write the rows of `tables` to gzipped JSONL at `path`, one
+  `{"table": ..., "row": {...}}` object per line, streamed from a
+  `yield_per` cursor so memory doesn't grow with the tables. The tables
+  are read in one transaction, on other databases than SQLite give
+  `connection` an isolation level with a single snapshot, e.g.
+  "REPEATABLE READ".
+
+  :returns: rows written per table
+  """
+  if connection.dialect.name == 'sqlite' and \
+      not connection.connection.driver_connection.in_transaction:
+    # pysqlite only BEGINs before writes, without it every SELECT would
+    # see the rows committed since the previous one
+    connection.exec_driver_sql('BEGIN')
+  counts = {}
+  with gzip.open(path, 'wt', encoding='utf-8') as f:
+    for table in tables:
+      counts[table.name] = 0
+      result = connection.execute(
+        select(table).order_by(*table.primary_key.columns)
+        .execution_options(yield_per=batch_size))
+      for rows in result.mappings().partitions():
+        f.writelines(
+          json.dumps({'table': table.name, 'row': dict(row)}, default=str) + '\n'
+          for row in rows)
+        counts[table.name] += len(rows)
+  return counts
+
+
+def read_dump(path: str) -> Iterable[tuple]:
+  """:returns: `(table name, row)` of a `dump_tables` file, in order"""
+  with gzip.open(path, 'rt', encoding='utf-8') as f:
+    for line in f:
+      if line.strip():
+        record = json.loads(line)
+        yield record['table'], record['row']
+
+
+def restore_tables(
+    connection, tables: Sequence[Table], path: str, batch_size: int=1000,
+    replace: bool=False) -> dict:
+  """
+  Bulk load a `dump_tables` file into `tables` with executemany INSERTs
+  of `batch_size` rows, keeping the dumped primary keys. Commit is left to
+  the caller.
+
+  :param replace: delete the tables' rows first, children before parents
+  :returns: rows inserted per table
+  :raises ValueError: if a table isn't empty and `replace` is false, or
+  the dump has rows of another table
+  """
+  by_name = {table.name: table for table in tables}
+  if replace:
+    for table in reversed(tables):
+      connection.execute(delete(table))
+  else:
+    for table in tables:
+      if connection.execute(select(table).limit(1)).first() is not None:
+        raise ValueError(f'table "{table.name}" is not empty')
+
+  counts = dict.fromkeys(by_name, 0)
+  batch, batch_table = [], None
+
+  def flush():
+    if batch:
+      connection.execute(insert(by_name[batch_table]), batch)
+      counts[batch_table] += len(batch)
+      batch.clear()
+
+  for name, row in read_dump(path):
+    if name not in by_name:
+      raise ValueError(f'unexpected table "{name}" in dump')
+    if name != batch_table or len(batch) >= batch_size:
+      flush()
+      batch_table = name
+    batch.append(row)
+  flush()
+  return counts
@@ -0,0 +1,80 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+  """
+  Thread-safe LRU cache whose entries expire after `ttl` seconds.
+  Keeps hit/miss counters, a `maxsize` of 0 disables the cache.
+  """
+  def __init__(self, maxsize: int=1024, ttl: float=60, timer=time.monotonic):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.timer = timer
+    self.hits = 0
+    self.misses = 0
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._data)
+
+  def __contains__(self, key: Hashable) -> bool:
+    item = self._data.get(key)
+    return item is not None and item[0] > self.timer()
+
+  def get(self, key: Hashable, default: Any=None) -> Any:
+    """Get a live entry and mark it as recently used."""
+    with self._lock:
+      item = self._data.get(key)
+      if item is None:
+        self.misses += 1
+        return default
+      if item[0] <= self.timer():
+        del self._data[key]
+        self.misses += 1
+        return default
+      self._data.move_to_end(key)
+      self.hits += 1
+      return item[1]
+
+  def set(self, key: Hashable, value: Any, ttl: float=None) -> None:
+    """
+    :param ttl: seconds for this entry to live, defaults to the cache's `ttl`
+    """
+    if self.maxsize <= 0:
+      return
+    expires = self.timer() + (self.ttl if ttl is None else ttl)
+    with self._lock:
+      self._data[key] = (expires, value)
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+
+  def delete(self, key: Hashable) -> None:
+    with self._lock:
+      self._data.pop(key, None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._data.clear()
+
+  def expire(self) -> int:
+    """
+    Drop expired entries
+
+    :returns: number of dropped entries
+    """
+    now = self.timer()
+    with self._lock:
+      expired = [k for k, (expires, _) in self._data.items() if expires <= now]
+      for key in expired:
+        del self._data[key]
+    return len(expired)
+
+  def stats(self) -> dict:
+    return dict(
+      hits=self.hits, misses=self.misses,
+      size=len(self._data), maxsize=self.maxsize)
@@ -1,9 +1,15 @@
 import os
+import time
+import click
 from flask import Flask
 from config import basedir
 
 
 def create_cli_commands(app: Flask) -> None:
+  from flask_migrate import Migrate
+  from app.ext import db
+  Migrate(app, db)
+
   @app.cli.command()
   def init():
     """Initialize the application."""
@@ -19,11 +25,213 @@ def create_cli_commands(app: Flask) -> None:
     tests = unittest.TestLoader().discover('tests')
     unittest.TextTestRunner(verbosity=2).run(tests)
 
+  @app.cli.command('insert-roles')
+  def insert_roles():
+    """Create or update the user roles and their permissions."""
+    from app.models import Role
+    assigned = Role.insert_roles()
+    for role in Role.query.order_by(Role.permissions):
+      default = ' (default)' if role.default else ''
+      print(f'> {role.name}: {role.permissions}{default}')
+    print(f'> {assigned} users without a role were given one.')
+    print('> running workers see the changes after USER_CACHE_TTL and ROLE_TABLE_TTL.')
+
+  @app.cli.command('calibrate-hash')
+  @click.option('--algorithm', type=click.Choice(['scrypt', 'pbkdf2']),
+                default='scrypt', help='Hash algorithm to calibrate.')
+  @click.option('--budget-ms', default=250.0, help='Time allowed for one hash.')
+  def calibrate_hash(algorithm, budget_ms):
+    """Pick password hash parameters for this machine."""
+    from app.utils.hashing import calibrate
+    method, elapsed = calibrate(algorithm, budget_ms / 1000)
+    print(f'> current: {app.config["PASSWORD_HASH_METHOD"]}')
+    print(f'> {method} takes {elapsed * 1000:.1f}ms per hash.')
+    print(f'> add to ".env": PASSWORD_HASH_METHOD={method}')
+
+  @app.cli.command('import-users')
+  @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+  @click.option('--batch-size', default=500, help='Rows per bulk INSERT.')
+  @click.option('--parallel/--no-parallel', default=True,
+                help='Hash passwords in a process pool.')
+  @click.option('--send-confirmation', is_flag=True,
+                help='Queue a confirmation email for every new user.')
+  @click.option('--duplicates', 'duplicates_path', type=click.Path(dir_okay=False),
+                help='Write skipped rows to this JSONL file.')
+  def import_users(path, batch_size, parallel, send_confirmation, duplicates_path):
+    """Import users from a CSV or JSONL file."""
+    import json
+    from app.ext import password_hasher
+    from app.services import UserImporter, read_users
+    if send_confirmation and not app.config['MAIL_LINK_HOST']:
+      raise click.UsageError(
+        'set MAIL_LINK_HOST to build confirmation links outside a request.')
+
+    def report(importer):
+      failed = f', mail failed {importer.mail_failed}' if send_confirmation else ''
+      print(
+        f'> imported {importer.imported}, skipped {importer.skipped}{failed}, '
+        f'{importer.rate:.1f} rows/s')
+
+    importer = UserImporter(
+      app.user_service, batch_size=batch_size, parallel=parallel,
+      send_confirmation=send_confirmation,
+      collect_duplicates=duplicates_path is not None)
+    try:
+      importer.run(read_users(path), report=report)
+    finally:
+      password_hasher.shutdown()
+    if duplicates_path:
+      with open(duplicates_path, 'w') as f:
+        for row in importer.duplicates:
+          f.write(json.dumps(row) + '\n')
+      print(f'> skipped rows written to "{duplicates_path}".')
+    report(importer)
+
+  @app.cli.command('query-report')
+  @click.option('--path', type=click.Path(exists=True, dir_okay=False),
+                help='Captured profile, defaults to QUERY_PROFILER_PATH.')
+  @click.option('--top', default=10, help='Number of statements to show.')
+  def query_report(path, top):
+    """Summarize the worst statements of a query profile."""
+    from app.utils.query_profiler import query_report
+    path = path or app.config['QUERY_PROFILER_PATH']
+    if not os.path.exists(path):
+      raise click.UsageError(
+        f'no profile at "{path}", run with QUERY_PROFILER_ENABLED=true first.')
+    for i, entry in enumerate(query_report(path, top), 1):
+      flag = ' [N+1]' if entry['repeated'] else ''
+      print(
+        f'{i}. total {entry["total_ms"]:.1f}ms, calls {entry["calls"]}, '
+        f'max {entry["max_ms"]:.1f}ms, max per request '
+        f'{entry["max_per_request"]}{flag}')
+      print(f'   endpoints: {", ".join(sorted(entry["endpoints"]))}')
+      print(f'   {" ".join(entry["statement"].split())}')
+
+  @app.cli.command('mail-worker')
+  @click.option('--batch-size', default=50, help='Messages claimed per batch.')
+  @click.option('--max-attempts', default=5, help='Attempts before giving up.')
+  @click.option('--backoff', default=30.0, help='Seconds before the first retry.')
+  @click.option('--interval', default=1.0, help='Seconds to sleep when idle.')
+  @click.option('--report-every', default=10.0, help='Seconds between reports.')
+  @click.option('--once', is_flag=True, help='Exit when the outbox is drained.')
+  def mail_worker(batch_size, max_attempts, backoff, interval, report_every, once):
+    """Deliver mail stored in the outbox."""
+    from app.utils.outbox import OutboxWorker
+    worker = OutboxWorker(
+      batch_size=batch_size, max_attempts=max_attempts, backoff=backoff)
+    try:
+      worker.run(interval=interval, report_every=report_every, once=once)
+    except KeyboardInterrupt:
+      print(f'> stopped, sent {worker.sent}, failed {worker.failed}.')
+
+  @app.cli.group()
+  def assets():
+    """Static asset pipeline."""
+
+  @assets.command('build')
+  def build_assets():
+    """Fingerprint and precompress the static files."""
+    from app.utils.assets import Assets
+    manifest = Assets.build(app)
+    version_dir = app.extensions['assets'].version_dir
+    print(f'> built {len(manifest)} files into "{version_dir}".')
+
+  @app.cli.command()
+  @click.argument('target', required=False, type=click.Path(dir_okay=False))
+  @click.option('--pages', default=256, help='Pages copied per step.')
+  @click.option('--pause', default=0.05, help='Seconds to sleep between steps.')
+  def backup(target, pages, pause):
+    """Copy the SQLite database while the app keeps serving."""
+    from datetime import datetime
+    from app.utils.backup import backup_sqlite
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+      raise click.UsageError('only file based SQLite databases can be backed up.')
+    if target is None:
+      name, ext = os.path.splitext(os.path.basename(url.database))
+      stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+      target = os.path.join(basedir, 'data', 'backups', f'{name}-{stamp}{ext}')
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+
+    def report(remaining, total):
+      print(f'\r> copied {total - remaining}/{total} pages', end='', flush=True)
+
+    started = time.perf_counter()
+    restarts = backup_sqlite(
+      url.database, target, pages=pages, pause=pause, progress=report)
+    print(
+      f'\n> backed up to "{target}" in {time.perf_counter() - started:.1f}s, '
+      f'restarted {restarts} times by writes.')
+
+  @app.cli.command('dump-users')
+  @click.argument('path', type=click.Path(dir_okay=False))
+  @click.option('--batch-size', default=1000, help='Rows fetched per batch.')
+  def dump_users(path, batch_size):
+    """Write the users and roles tables to gzipped JSONL."""
+    from app.models import Role, User
+    from app.utils.backup import dump_tables
+    with db.engine.connect() as connection:
+      if connection.dialect.name != 'sqlite':
+        # read every table from the same snapshot
+        connection = connection.execution_options(
+          isolation_level='REPEATABLE READ')
+      counts = dump_tables(
+        connection, [Role.__table__, User.__table__], path, batch_size)
+    for table, count in counts.items():
+      print(f'> {table}: {count} rows')
+    print(f'> dumped to "{path}".')
+
+  @app.cli.command('restore-users')
+  @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+  @click.option('--batch-size', default=1000, help='Rows per bulk INSERT.')
+  @click.option('--replace', is_flag=True,
+                help='Delete the current users and roles first.')
+  def restore_users(path, batch_size, replace):
+    """Load a "flask dump-users" file into the users and roles tables."""
+    from app.models import Role, User
+    from app.utils.backup import restore_tables
+    try:
+      with db.engine.begin() as connection:
+        counts = restore_tables(
+          connection, [Role.__table__, User.__table__], path, batch_size, replace)
+    except ValueError as e:
+      raise click.UsageError(str(e))
+    for table, count in counts.items():
+      print(f'> {table}: {count} rows')
+    print('> running workers see the changes after USER_CACHE_TTL and ROLE_TABLE_TTL.')
+
+  @app.cli.command('startup-profile')
+  @click.option('--config', 'config_name',
+                default=lambda: os.environ.get('ENV') or 'production',
+                help='Configuration to start, defaults to ENV.')
+  @click.option('--path', default='/', help='URL of the first request.')
+  @click.option('--top', default=15, help='Number of modules to show.')
+  @click.option('--sort', type=click.Choice(['cumulative', 'self']),
+                default='cumulative', help='Import time to sort modules by.')
+  def startup_profile(config_name, path, top, sort):
+    """Time a worker's imports, app creation and first request."""
+    from app.utils.startup import profile_startup
+    try:
+      result = profile_startup(config_name, path)
+    except RuntimeError as e:
+      raise click.ClickException(f'startup failed: {e}')
+    modules = sorted(result['modules'], key=lambda m: m[f'{sort}_ms'], reverse=True)
+    for module in modules[:top]:
+      print(
+        f'{module["cumulative_ms"]:9.1f}ms {module["self_ms"]:8.1f}ms  '
+        f'{"  " * module["depth"]}{module["name"]}')
+    print(f'> {len(result["modules"])} modules imported.')
+    print(f'> imports and create_app: {result["load_ms"]:.1f}ms')
+    print(f'> first request to "{path}": {result["first_request_ms"]:.1f}ms '
+          f'({result["status"]})')
+    print(f'> total to first request: {result["total_ms"]:.1f}ms')
+
 
 def create_shell_context(app: Flask) -> None:
   from app.ext import db
-  from app.models import Role, User
+  from app.models import Role, Permission, User, OutboxMail
 
   @app.shell_context_processor
   def shell_context():
-    return dict(db=db, Role=Role, User=User)
+    return dict(
+      db=db, Role=Role, Permission=Permission, User=User, OutboxMail=OutboxMail)
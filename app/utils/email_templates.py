@@ -0,0 +1,73 @@
+from typing import Tuple
+from flask import Flask, current_app, has_request_context, url_for
+
+# templates rendered by `UserService`, compiled once when the app is created
+EMAIL_TEMPLATES = (
+  'email/auth/confirm',
+  'email/auth/reset-password',
+  'email/user/change-password',
+  'email/user/update-email',
+)
+
+
+class _RendererState:
+  """Compiled email templates and URL adapter of one application."""
+  def __init__(self, app: Flask):
+    self.app = app
+    self.templates = {}
+    self.adapter = None
+    for name in EMAIL_TEMPLATES:
+      self.load(name)
+
+  def load(self, name: str) -> tuple:
+    env = self.app.jinja_env
+    pair = (env.get_template(name + '.txt'), env.get_template(name + '.html'))
+    self.templates[name] = pair
+    return pair
+
+  def url_for(self, endpoint: str, **values) -> str:
+    host = self.app.config['MAIL_LINK_HOST']
+    if has_request_context() or not host:
+      return url_for(endpoint, **values)
+    if self.adapter is None or self.adapter.server_name != host:
+      self.adapter = self.app.url_map.bind(
+        host,
+        script_name=self.app.config['APPLICATION_ROOT'],
+        url_scheme=self.app.config['PREFERRED_URL_SCHEME'])
+    values.pop('_external', None)
+    return self.adapter.build(endpoint, values, force_external=True)
+
+
+class EmailRenderer:
+  """
+  Render email templates from compiled `jinja2.Template` objects, skipping
+  the template lookup and context processors of `render_template`.
+  Works with only an app context when `MAIL_LINK_HOST` is configured,
+  links are then built against that host.
+  """
+  def __init__(self, app: Flask=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('MAIL_LINK_HOST', None)
+    app.extensions['email_renderer'] = _RendererState(app)
+
+  def render(self, template: str, **kwargs) -> Tuple[str, str]:
+    """
+    :param template: email template without file extension
+    :returns: rendered text and html bodies
+    """
+    state = current_app.extensions['email_renderer']
+    pair = state.templates.get(template) or state.load(template)
+
+    # both bodies link to the same url, build it once per message
+    links = {}
+    def _url_for(endpoint, **values):
+      key = (endpoint, tuple(sorted(values.items())))
+      if key not in links:
+        links[key] = state.url_for(endpoint, **values)
+      return links[key]
+
+    kwargs['url_for'] = _url_for
+    return pair[0].render(kwargs), pair[1].render(kwargs)
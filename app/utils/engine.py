@@ -0,0 +1,34 @@
+from flask import Flask
+from sqlalchemy import event
+
+
+def _pragma_listener(pragmas: dict):
+  def set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+      cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+  return set_pragmas
+
+
+class EngineTuning:
+  """
+  Run `SQLITE_PRAGMAS` on every new connection of the app's file based
+  SQLite engines, pool options for other databases come from
+  `SQLALCHEMY_ENGINE_OPTIONS`.
+  """
+  def __init__(self, db=None, app: Flask=None):
+    self.db = db
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('SQLITE_PRAGMAS', {})
+    pragmas = app.config['SQLITE_PRAGMAS']
+    if not pragmas:
+      return
+    with app.app_context():
+      for engine in self.db.engines.values():
+        if engine.dialect.name == 'sqlite' \
+            and engine.url.database not in (None, '', ':memory:'):
+          event.listen(engine, 'connect', _pragma_listener(pragmas))
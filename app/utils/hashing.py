@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+from typing import Iterable, List
+from flask import Flask, current_app
+from werkzeug.security import (
+  generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS)
+
+
+def normalize_method(method: str) -> str:
+  """
+  Expand a werkzeug hash method to the full form stored in the hash,
+  e.g. "scrypt" to "scrypt:32768:8:1"
+
+  :raises ValueError: if the method is not supported
+  """
+  name, *args = method.split(':')
+  if name == 'scrypt':
+    # missing trailing parameters take werkzeug's defaults
+    n, r, p = map(int, args + ['32768', '8', '1'][len(args):])
+    return f'scrypt:{n}:{r}:{p}'
+  elif name == 'pbkdf2':
+    hash_name = args[0] if args else 'sha256'
+    iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+    return f'pbkdf2:{hash_name}:{iterations}'
+  raise ValueError(f"Invalid hash method '{method}'.")
+
+
+def calibrate(algorithm: str, budget: float, rounds: int=3) -> tuple:
+  """
+  Find the most expensive parameters of `algorithm` hashing under `budget`
+
+  :param algorithm: "scrypt" or "pbkdf2"
+  :param budget: seconds allowed for one hash
+  :param rounds: hashes timed per candidate, the fastest one counts
+  :returns: the method and its measured hash time in seconds
+  """
+  def measure(method):
+    timings = []
+    for _ in range(rounds):
+      started = time.perf_counter()
+      generate_password_hash('calibration', method=method)
+      timings.append(time.perf_counter() - started)
+    return min(timings)
+
+  if algorithm == 'scrypt':
+    # double the cost factor until the budget is exceeded
+    n, best = 2**12, None
+    while True:
+      method = f'scrypt:{n}:8:1'
+      elapsed = measure(method)
+      if elapsed > budget:
+        break
+      best = (method, elapsed)
+      n *= 2
+    return best or (method, elapsed)
+  elif algorithm == 'pbkdf2':
+    # pbkdf2 time is linear in iterations, scale from one measurement
+    probe = 100000
+    elapsed = measure(f'pbkdf2:sha256:{probe}')
+    iterations = max(int(probe * budget / elapsed), 1000)
+    method = f'pbkdf2:sha256:{iterations}'
+    return method, measure(method)
+  raise ValueError(f"Invalid hash algorithm '{algorithm}'.")
+
+
+def _hash(password: str, method: str) -> str:
+  return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash: str, password: str) -> bool:
+  return check_password_hash(pwhash, password)
+
+
+class _HasherState:
+  """
+  Hash profile and process pool of one application, the pool is created
+  on first use in each process.
+  """
+  def __init__(self, app: Flask):
+    self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+    self.enabled = app.config['PASSWORD_HASH_EXECUTOR']
+    self.workers = app.config['PASSWORD_HASH_WORKERS'] or os.cpu_count() or 1
+    self.executor = None
+    self.pid = None
+    self.lock = threading.Lock()
+
+  def get_executor(self) -> 'ProcessPoolExecutor':
+    # a pool inherited through fork belongs to the parent, start a new one
+    if self.executor is None or self.pid != os.getpid():
+      with self.lock:
+        if self.executor is None or self.pid != os.getpid():
+          # only workers with PASSWORD_HASH_EXECUTOR on pay for these imports
+          import multiprocessing
+          from concurrent.futures import ProcessPoolExecutor
+          self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'))
+          self.pid = os.getpid()
+    return self.executor
+
+  def shutdown(self) -> None:
+    if self.executor is not None and self.pid == os.getpid():
+      self.executor.shutdown()
+    self.executor = None
+
+
+class PasswordHasher:
+  """
+  Hash and verify passwords, in a process pool sized to the CPU cores when
+  `PASSWORD_HASH_EXECUTOR` is set so request threads don't hold the GIL
+  while hashing, otherwise inline. New hashes use the cost profile in
+  `PASSWORD_HASH_METHOD`.
+  """
+  def __init__(self, app: Flask=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config.setdefault('PASSWORD_HASH_EXECUTOR', False)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', None)
+    app.extensions['password_hasher'] = _HasherState(app)
+
+  @staticmethod
+  def _state() -> _HasherState:
+    return current_app.extensions['password_hasher']
+
+  def hash(self, password: str) -> str:
+    state = self._state()
+    started = time.perf_counter()
+    if not state.enabled:
+      pwhash = _hash(password, state.method)
+    else:
+      pwhash = state.get_executor().submit(_hash, password, state.method).result()
+    self._observe('hash', started)
+    return pwhash
+
+  def verify(self, pwhash: str, password: str) -> bool:
+    if not pwhash:
+      return False
+    state = self._state()
+    started = time.perf_counter()
+    if not state.enabled:
+      valid = _verify(pwhash, password)
+    else:
+      valid = state.get_executor().submit(_verify, pwhash, password).result()
+    self._observe('verify', started)
+    return valid
+
+  @staticmethod
+  def _observe(operation: str, started: float) -> None:
+    metrics = current_app.extensions.get('metrics')
+    if metrics is not None:
+      metrics.password_hash_time.observe(
+        time.perf_counter() - started, operation=operation)
+
+  def hash_many(self, passwords: Iterable[str], parallel: bool=None) -> List[str]:
+    """
+    Hash passwords in parallel across the pool, in order
+
+    :param parallel: use the pool even if `PASSWORD_HASH_EXECUTOR` is off,
+    for bulk jobs outside of the web process
+    """
+    state = self._state()
+    if not (state.enabled if parallel is None else parallel):
+      return [_hash(p, state.method) for p in passwords]
+    passwords = list(passwords)
+    return list(state.get_executor().map(
+      _hash, passwords, [state.method] * len(passwords), chunksize=16))
+
+  def needs_rehash(self, pwhash: str) -> bool:
+    """True if `pwhash` was made with a different cost profile."""
+    return pwhash.split('$', 1)[0] != self._state().method
+
+  def shutdown(self) -> None:
+    self._state().shutdown()
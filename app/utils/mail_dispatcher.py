@@ -0,0 +1,177 @@
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import weakref
+from flask import Flask, current_app
+from flask_mail import Message
+from app.errors import MailQueueFullError
+
+logger = logging.getLogger(__name__)
+
+# sentinel put on the queue once per worker to stop it after draining
+_STOP = object()
+
+# dispatchers shut down at exit, held weakly so discarded apps are freed
+_live_states = weakref.WeakSet()
+
+
+@atexit.register
+def _shutdown_all() -> None:
+  for state in list(_live_states):
+    state.shutdown()
+
+
+class _DispatcherState:
+  """Per application queue and worker pool."""
+  def __init__(self, app: Flask, mail):
+    self.app = app
+    self.mail = mail
+    self.workers = app.config['MAIL_DISPATCHER_WORKERS']
+    self.put_timeout = app.config['MAIL_DISPATCHER_PUT_TIMEOUT']
+    self.idle_timeout = app.config['MAIL_DISPATCHER_IDLE_TIMEOUT']
+    self.queue = queue.Queue(maxsize=app.config['MAIL_DISPATCHER_QUEUE_SIZE'])
+    self.threads = []
+    self.lock = threading.Lock()
+    # signalled when the last in-flight `submit` is done
+    self.idle = threading.Condition(self.lock)
+    self.submitting = 0
+    self.closed = False
+
+  def start(self) -> None:
+    """Start the worker pool, only once and only when the first message arrives."""
+    with self.lock:
+      if self.threads or self.closed:
+        return
+      for i in range(self.workers):
+        thr = threading.Thread(
+          target=self._work, name=f'mail-dispatcher-{i}', daemon=True)
+        thr.start()
+        self.threads.append(thr)
+
+  def submit(self, msg: Message) -> None:
+    self.start()
+    with self.lock:
+      if self.closed:
+        raise MailQueueFullError(message='Mail dispatcher is shut down')
+      self.submitting += 1
+    try:
+      self.queue.put(msg, timeout=self.put_timeout)
+    except queue.Full:
+      raise MailQueueFullError()
+    finally:
+      with self.lock:
+        self.submitting -= 1
+        self.idle.notify_all()
+
+  def shutdown(self, timeout: float=None) -> None:
+    """Stop accepting messages, deliver what is queued and stop the workers."""
+    with self.lock:
+      if self.closed:
+        return
+      self.closed = True
+      # messages accepted before closing go on the queue ahead of the stops
+      self.idle.wait_for(lambda: self.submitting == 0)
+      threads = list(self.threads)
+    for _ in threads:
+      self.queue.put(_STOP)
+    for thr in threads:
+      thr.join(timeout)
+
+  def _work(self) -> None:
+    conn = None
+    with self.app.app_context():
+      while True:
+        try:
+          msg = self.queue.get(timeout=self.idle_timeout)
+        except queue.Empty:
+          # nothing to send for a while, don't hold the SMTP connection open
+          conn = self._close(conn)
+          continue
+
+        if msg is _STOP:
+          self.queue.task_done()
+          break
+
+        try:
+          conn = self._deliver(conn, msg)
+        except Exception:
+          logger.exception('Failed to send mail to %s', msg.recipients)
+          conn = self._close(conn)
+        finally:
+          self.queue.task_done()
+
+      self._close(conn)
+
+  def _deliver(self, conn, msg: Message):
+    """
+    Send `msg` over `conn`, opening a connection if needed and reconnecting
+    once if the server dropped the idle one.
+
+    :returns: the open connection to reuse for the next message
+    """
+    if conn is None:
+      conn = self._open()
+    try:
+      conn.send(msg)
+    except smtplib.SMTPServerDisconnected:
+      self._close(conn)
+      conn = self._open()
+      conn.send(msg)
+    return conn
+
+  def _open(self):
+    return self.mail.connect().__enter__()
+
+  @staticmethod
+  def _close(conn) -> None:
+    if conn is not None:
+      try:
+        conn.__exit__(None, None, None)
+      except Exception:
+        # connection already dropped by the server
+        pass
+    return None
+
+
+class MailDispatcher:
+  """
+  Deliver mail through a bounded queue feeding a fixed pool of worker
+  threads, each worker keeps its SMTP connection open across messages.
+  """
+  def __init__(self, mail=None, app: Flask=None):
+    self.mail = mail
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('MAIL_DISPATCHER_WORKERS', 2)
+    app.config.setdefault('MAIL_DISPATCHER_QUEUE_SIZE', 100)
+    app.config.setdefault('MAIL_DISPATCHER_PUT_TIMEOUT', 5)
+    app.config.setdefault('MAIL_DISPATCHER_IDLE_TIMEOUT', 30)
+    state = _DispatcherState(app, self.mail)
+    app.extensions['mail_dispatcher'] = state
+    _live_states.add(state)
+
+  @staticmethod
+  def _state() -> _DispatcherState:
+    return current_app.extensions['mail_dispatcher']
+
+  def submit(self, msg: Message) -> None:
+    """
+    Queue a message for delivery, blocks while the queue is full
+
+    :param msg: `flask_mail.Message` instance
+    :raises MailQueueFullError: if the queue stays full for
+    `MAIL_DISPATCHER_PUT_TIMEOUT` seconds
+    """
+    self._state().submit(msg)
+
+  def qsize(self) -> int:
+    """Number of messages waiting to be delivered."""
+    return self._state().queue.qsize()
+
+  def shutdown(self, timeout: float=None) -> None:
+    """Deliver queued messages and stop the workers."""
+    self._state().shutdown(timeout)
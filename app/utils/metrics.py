@@ -0,0 +1,272 @@
+import abc
+import hmac
+import time
+import threading
+from typing import Callable, Sequence
+from flask import Flask, Request, g, has_request_context
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (
+  .005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+  return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str='') -> str:
+  pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format(value: float) -> str:
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+  type = ''
+
+  def __init__(self, name: str, documentation: str):
+    self.name = name
+    self.documentation = documentation
+
+  def expose(self) -> list:
+    return [
+      f'# HELP {self.name} {self.documentation}',
+      f'# TYPE {self.name} {self.type}']
+
+
+class _ShardedMetric(_Metric, abc.ABC):
+  """
+  Each thread updates its own shard without locking, shards are only
+  merged when the metrics are scraped. Shards of finished threads are
+  folded into `_retired` so per-request threads don't pile up.
+  """
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str]=()):
+    super().__init__(name, documentation)
+    self.labelnames = tuple(labelnames)
+    self._local = threading.local()
+    self._shards = []
+    self._retired = {}
+    self._lock = threading.Lock()
+
+  def _shard(self) -> dict:
+    shard = getattr(self._local, 'shard', None)
+    if shard is None:
+      shard = self._local.shard = {}
+      with self._lock:
+        self._shards.append((threading.current_thread(), shard))
+    return shard
+
+  def _key(self, labels: dict) -> tuple:
+    return tuple(labels.get(name, '') for name in self.labelnames)
+
+  @abc.abstractmethod
+  def _merge(self, total, values):
+    """:returns: `values` of one shard added to `total`, which may be None"""
+
+  def collect(self) -> dict:
+    """:returns: label values mapped to the merged value of all threads"""
+    with self._lock:
+      alive = []
+      for thread, shard in self._shards:
+        if thread.is_alive():
+          alive.append((thread, shard))
+        else:
+          for key, values in shard.copy().items():
+            self._retired[key] = self._merge(self._retired.get(key), values)
+      self._shards = alive
+      merged = dict(self._retired)
+      shards = [shard.copy() for _, shard in alive]
+    for shard in shards:
+      for key, values in shard.items():
+        merged[key] = self._merge(merged.get(key), values)
+    return merged
+
+
+class Counter(_ShardedMetric):
+  type = 'counter'
+
+  def inc(self, amount: float=1, **labels) -> None:
+    shard = self._shard()
+    key = self._key(labels)
+    shard[key] = shard.get(key, 0) + amount
+
+  def _merge(self, total, value):
+    return (total or 0) + value
+
+  def expose(self) -> list:
+    lines = super().expose()
+    for key, value in sorted(self.collect().items()):
+      lines.append(f'{self.name}{_labels(self.labelnames, key)} {_format(value)}')
+    return lines
+
+
+class Histogram(_ShardedMetric):
+  type = 'histogram'
+
+  def __init__(
+      self, name: str, documentation: str, labelnames: Sequence[str]=(),
+      buckets: Sequence[float]=DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value: float, **labels) -> None:
+    shard = self._shard()
+    key = self._key(labels)
+    # per bucket counts, then sum and count
+    values = shard.get(key)
+    if values is None:
+      values = shard[key] = [0] * (len(self.buckets) + 3)
+    for i, bound in enumerate(self.buckets):
+      if value <= bound:
+        values[i] += 1
+        break
+    else:
+      values[len(self.buckets)] += 1
+    values[-2] += value
+    values[-1] += 1
+
+  def _merge(self, total, values):
+    if total is None:
+      return list(values)
+    return [a + b for a, b in zip(total, values)]
+
+  def expose(self) -> list:
+    lines = super().expose()
+    for key, values in sorted(self.collect().items()):
+      cumulative = 0
+      for bound, count in zip(self.buckets + (float('inf'),), values):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else _format(float(bound))
+        labels = _labels(self.labelnames, key, 'le="%s"' % le)
+        lines.append(f'{self.name}_bucket{labels} {cumulative}')
+      lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_format(values[-2])}')
+      lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {values[-1]}')
+    return lines
+
+
+class Gauge(_Metric):
+  """Gauge read from a callback when scraped."""
+  type = 'gauge'
+
+  def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+    super().__init__(name, documentation)
+    self.callback = callback
+
+  def expose(self) -> list:
+    return super().expose() + [f'{self.name} {_format(self.callback())}']
+
+
+class Registry:
+  def __init__(self):
+    self.metrics = []
+
+  def register(self, metric: _Metric) -> _Metric:
+    self.metrics.append(metric)
+    return metric
+
+  def expose(self) -> str:
+    """:returns: all metrics in the Prometheus text format"""
+    lines = []
+    for metric in self.metrics:
+      lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+class AppMetrics:
+  """The metrics recorded for one application."""
+  def __init__(self, app: Flask):
+    self.token = app.config['METRICS_TOKEN']
+    self.allowed_ips = frozenset(
+      ip.strip() for ip in app.config['METRICS_ALLOWED_IPS'].split(',') if ip.strip())
+    self.registry = registry = Registry()
+    self.requests = registry.register(Counter(
+      'http_requests_total', 'Handled requests.',
+      ['endpoint', 'method', 'status']))
+    self.request_latency = registry.register(Histogram(
+      'http_request_duration_seconds', 'Request latency.', ['endpoint']))
+    self.sql_statements = registry.register(Histogram(
+      'http_request_sql_statements', 'SQL statements per request.',
+      ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)))
+    self.sql_time = registry.register(Histogram(
+      'http_request_sql_seconds', 'Time spent in SQL per request.', ['endpoint']))
+    self.password_hash_time = registry.register(Histogram(
+      'password_hash_duration_seconds', 'Password hash and verify time.',
+      ['operation'], buckets=(.001, .01, .025, .05, .1, .25, .5, 1.0, 2.5)))
+    self.rate_limited = registry.register(Counter(
+      'http_rate_limited_total', 'Requests rejected by the rate limiter.',
+      ['endpoint', 'scope']))
+    dispatcher = app.extensions.get('mail_dispatcher')
+    self.mail_queue = registry.register(Gauge(
+      'mail_queue_depth', 'Messages waiting in the mail dispatcher.',
+      lambda: dispatcher.queue.qsize() if dispatcher else 0))
+
+  def allows(self, request: Request) -> bool:
+    """
+    :returns: whether `request` may scrape the metrics, it must come from
+    an allowed address or carry the token as "Authorization: Bearer ..."
+    """
+    if request.remote_addr in self.allowed_ips:
+      return True
+    if not self.token:
+      return False
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(
+      token.strip().encode(), self.token.encode())
+
+  def start_request(self) -> None:
+    g._metrics_started = time.perf_counter()
+    g._sql_statements = 0
+    g._sql_time = 0.0
+
+  def end_request(self, endpoint: str, method: str, status: int) -> None:
+    started = g.get('_metrics_started')
+    if started is None:
+      return
+    endpoint = endpoint or 'none'
+    self.requests.inc(endpoint=endpoint, method=method, status=status)
+    self.request_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+    self.sql_statements.observe(g.get('_sql_statements', 0), endpoint=endpoint)
+    self.sql_time.observe(g.get('_sql_time', 0.0), endpoint=endpoint)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  started = getattr(context, '_metrics_started', None)
+  if started is not None and has_request_context() and '_metrics_started' in g:
+    g._sql_statements += 1
+    g._sql_time += time.perf_counter() - started
+
+
+class Metrics:
+  """
+  Request, SQL, mail queue and password hashing metrics exposed in the
+  Prometheus text format, see the "/metrics" endpoint.
+  """
+  def __init__(self, db=None, app: Flask=None):
+    self.db = db
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('METRICS_ALLOWED_IPS', '127.0.0.1,::1')
+    if not app.config['METRICS_ENABLED']:
+      return
+    app.extensions['metrics'] = AppMetrics(app)
+    with app.app_context():
+      for engine in self.db.engines.values():
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+  @staticmethod
+  def get(app: Flask) -> AppMetrics:
+    """:returns: the app's metrics or None when disabled"""
+    return app.extensions.get('metrics')
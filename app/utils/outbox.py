@@ -0,0 +1,216 @@
+import time
+import smtplib
+import uuid
+import logging
+from datetime import datetime, timedelta
+from flask_mail import Message
+from app.ext import db, mail
+from app.models import OutboxMail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_mail(msg: Message) -> OutboxMail:
+  """
+  Store a message in the outbox, it is delivered later by the outbox worker
+
+  :param msg: `flask_mail.Message` instance
+  :returns: the stored `OutboxMail` row
+  """
+  row = OutboxMail.from_message(msg)
+  db.session.add(row)
+  db.session.commit()
+  return row
+
+
+def pending_count() -> int:
+  """Number of messages waiting for delivery, including ones being retried."""
+  return db.session.scalar(
+    db.select(db.func.count(OutboxMail.id))
+    .where(OutboxMail.status.in_([OutboxMail.PENDING, OutboxMail.SENDING])))
+
+
+class OutboxWorker:
+  """
+  Drain the outbox in batches, each batch is claimed with one UPDATE and
+  sent over a single SMTP connection. Failed messages are retried with
+  exponential backoff until `max_attempts` is reached.
+  """
+  def __init__(
+      self, batch_size: int=50, max_attempts: int=5, backoff: float=30,
+      max_backoff: float=3600, lease: float=300):
+    """
+    :param batch_size: number of messages claimed per batch
+    :param max_attempts: attempts before a message is marked as failed
+    :param backoff: seconds before the first retry, doubles on each attempt
+    :param max_backoff: upper bound for the retry delay
+    :param lease: seconds after which a claimed but unsent message is
+    considered abandoned by a crashed worker and claimed again
+    """
+    self.batch_size = batch_size
+    self.max_attempts = max_attempts
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.lease = lease
+    self.sent = 0
+    self.failed = 0
+
+  def claim(self) -> list:
+    """
+    Mark up to `batch_size` due messages as being sent by this worker. The
+    due ids are selected first, MySQL can't UPDATE a table it selects from
+    in the same statement, and the UPDATE checks they are still due, rows
+    another worker claimed in between are left to it.
+
+    :returns: claimed `OutboxMail` rows
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    is_due = db.or_(
+      db.and_(
+        OutboxMail.status == OutboxMail.PENDING,
+        OutboxMail.next_attempt_at <= now),
+      db.and_(
+        OutboxMail.status == OutboxMail.SENDING,
+        OutboxMail.claimed_at <= now - timedelta(seconds=self.lease)))
+    ids = db.session.scalars(
+      db.select(OutboxMail.id)
+      .where(is_due)
+      .order_by(OutboxMail.id)
+      .limit(self.batch_size)).all()
+    if not ids:
+      db.session.commit()
+      return []
+    claimed = db.session.execute(
+      db.update(OutboxMail)
+      .where(OutboxMail.id.in_(ids), is_due)
+      .values(status=OutboxMail.SENDING, claim_token=token, claimed_at=now)
+      .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    if not claimed:
+      return []
+    return db.session.scalars(
+      db.select(OutboxMail)
+      .where(OutboxMail.claim_token == token)
+      .order_by(OutboxMail.id)).all()
+
+  def deliver(self, rows: list) -> None:
+    """
+    Send claimed rows over one connection and record the outcome. A server
+    that drops the connection is reconnected to once per message, if it
+    can't be reached the rest of the batch is retried later. Outcomes are
+    committed before the connection is closed, so a failing QUIT doesn't
+    resend the batch.
+    """
+    now = datetime.utcnow()
+    conn = None
+    try:
+      for i, row in enumerate(rows):
+        try:
+          if conn is None:
+            conn = self._open()
+        except Exception as e:
+          logger.warning('Failed to connect to the mail server: %s', e)
+          for row in rows[i:]:
+            self._failed(row, e, now)
+          break
+        try:
+          conn = self._send(conn, row.to_message())
+        except Exception as e:
+          logger.warning('Failed to send outbox mail %s: %s', row.id, e)
+          self._failed(row, e, now)
+          if self._dropped(e):
+            conn = self._close(conn)
+        else:
+          row.attempts = (row.attempts or 0) + 1
+          row.status = OutboxMail.SENT
+          row.sent_at = now
+          row.last_error = None
+          row.claim_token = None
+          self.sent += 1
+      db.session.commit()
+    finally:
+      self._close(conn)
+
+  def _failed(self, row: OutboxMail, error: Exception, now: datetime) -> None:
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = str(error)
+    row.claim_token = None
+    if row.attempts >= self.max_attempts:
+      row.status = OutboxMail.FAILED
+      self.failed += 1
+    else:
+      row.status = OutboxMail.PENDING
+      row.next_attempt_at = now + timedelta(seconds=self.retry_delay(row.attempts))
+
+  def _send(self, conn, msg: Message):
+    """:returns: the connection `msg` was sent over, reopened if the server dropped `conn`"""
+    try:
+      conn.send(msg)
+    except smtplib.SMTPServerDisconnected:
+      self._close(conn)
+      conn = self._open()
+      conn.send(msg)
+    return conn
+
+  @staticmethod
+  def _dropped(error: Exception) -> bool:
+    """:returns: whether `error` left the connection unusable"""
+    # SMTP replies are OSErrors too, but the connection survives them
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+      isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException))
+
+  @staticmethod
+  def _open():
+    return mail.connect().__enter__()
+
+  @staticmethod
+  def _close(conn) -> None:
+    if conn is not None:
+      try:
+        conn.__exit__(None, None, None)
+      except smtplib.SMTPServerDisconnected:
+        pass
+      except Exception as e:
+        # the outcomes are committed, a failed QUIT changes nothing
+        logger.warning('Failed to close the mail connection: %s', e)
+    return None
+
+  def retry_delay(self, attempts: int) -> float:
+    return min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+
+  def run_once(self) -> int:
+    """
+    Claim and deliver one batch
+
+    :returns: number of claimed messages
+    """
+    rows = self.claim()
+    if rows:
+      self.deliver(rows)
+    return len(rows)
+
+  def run(self, interval: float=1, report_every: float=10, once: bool=False) -> None:
+    """
+    Keep draining the outbox, sleeping `interval` seconds when it is empty
+
+    :param interval: seconds to wait when there is nothing to send
+    :param report_every: seconds between throughput reports
+    :param once: stop as soon as the outbox is drained
+    """
+    started = last_report = time.monotonic()
+    sent_at_report = 0
+    while True:
+      claimed = self.run_once()
+      now = time.monotonic()
+      if now - last_report >= report_every or (once and not claimed):
+        rate = (self.sent - sent_at_report) / max(now - last_report, 1e-9)
+        print(
+          f'> sent {self.sent}, failed {self.failed}, '
+          f'{rate:.1f} msg/s, pending {pending_count()}, '
+          f'elapsed {now - started:.1f}s')
+        last_report, sent_at_report = now, self.sent
+      if not claimed:
+        if once:
+          return
+        time.sleep(interval)
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from flask import Flask, g, request, has_request_context
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class _ProfilerState:
+  """Thresholds and capture file of one application."""
+  def __init__(self, app: Flask):
+    self.slow = app.config['QUERY_PROFILER_SLOW_MS'] / 1000
+    self.repeats = app.config['QUERY_PROFILER_REPEATS']
+    self.path = app.config['QUERY_PROFILER_PATH']
+    self.lock = threading.Lock()
+    if self.path:
+      os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+  def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    context._profiler_started = time.perf_counter()
+
+  def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    if started is None:
+      return
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint if has_request_context() else None
+    if elapsed >= self.slow:
+      logger.warning(
+        'Slow query (%.1fms) in %s: %s', elapsed * 1000, endpoint, statement)
+    if has_request_context():
+      stats = g.setdefault('_query_profile', defaultdict(lambda: [0, 0.0, 0.0]))
+      entry = stats[statement]
+      entry[0] += 1
+      entry[1] += elapsed
+      entry[2] = max(entry[2], elapsed)
+
+  def end_request(self, exc=None) -> None:
+    stats = g.pop('_query_profile', None)
+    if not stats:
+      return
+    endpoint = request.endpoint
+    records = []
+    for statement, (count, total, slowest) in stats.items():
+      if count >= self.repeats:
+        logger.warning(
+          'Possible N+1 in %s, executed %d times: %s', endpoint, count, statement)
+      records.append(dict(
+        endpoint=endpoint, statement=statement, count=count,
+        total_ms=round(total * 1000, 3), max_ms=round(slowest * 1000, 3),
+        repeated=count >= self.repeats))
+    if self.path:
+      with self.lock, open(self.path, 'a') as f:
+        for record in records:
+          f.write(json.dumps(record) + '\n')
+
+
+class QueryProfiler:
+  """
+  Opt-in statement profiler on the app's engines, enabled with
+  `QUERY_PROFILER_ENABLED`. Logs statements slower than
+  `QUERY_PROFILER_SLOW_MS` with their endpoint, flags statements repeated
+  `QUERY_PROFILER_REPEATS` times within one request as likely N+1 and
+  appends per request statement stats to `QUERY_PROFILER_PATH` for the
+  "flask query-report" command.
+  """
+  def __init__(self, db=None, app: Flask=None):
+    self.db = db
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('QUERY_PROFILER_ENABLED', False)
+    app.config.setdefault('QUERY_PROFILER_SLOW_MS', 100)
+    app.config.setdefault('QUERY_PROFILER_REPEATS', 3)
+    app.config.setdefault('QUERY_PROFILER_PATH', None)
+    if not app.config['QUERY_PROFILER_ENABLED']:
+      return
+    state = _ProfilerState(app)
+    app.extensions['query_profiler'] = state
+    with app.app_context():
+      for engine in self.db.engines.values():
+        event.listen(engine, 'before_cursor_execute', state.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', state.after_cursor_execute)
+    app.teardown_request(state.end_request)
+
+
+def query_report(path: str, top: int=10) -> list:
+  """
+  Summarize a profile captured in `path` by statement
+
+  :returns: the `top` statements by total time, each with its call count,
+  total and max time, worst per request count and endpoints
+  """
+  summary = {}
+  with open(path) as f:
+    for line in f:
+      record = json.loads(line)
+      entry = summary.setdefault(record['statement'], dict(
+        statement=record['statement'], calls=0, total_ms=0.0, max_ms=0.0,
+        max_per_request=0, repeated=0, endpoints=set()))
+      entry['calls'] += record['count']
+      entry['total_ms'] += record['total_ms']
+      entry['max_ms'] = max(entry['max_ms'], record['max_ms'])
+      entry['max_per_request'] = max(entry['max_per_request'], record['count'])
+      entry['repeated'] += record['repeated']
+      entry['endpoints'].add(record['endpoint'] or 'none')
+  worst = sorted(summary.values(), key=lambda e: e['total_ms'], reverse=True)
+  return worst[:top]
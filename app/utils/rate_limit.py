@@ -0,0 +1,139 @@
+import time
+import threading
+from functools import wraps
+from typing import Tuple
+from flask import Flask, current_app, request, abort
+from app.utils.metrics import Metrics
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit: str) -> Tuple[float, float]:
+  """
+  :param limit: allowed requests per period, e.g. "10/minute"
+  :returns: bucket size and refill rate in tokens per second
+  :raises ValueError: if the limit is malformed or allows less than one
+  request per period
+  """
+  count, period = limit.split('/')
+  count = float(count)
+  if count < 1:
+    raise ValueError(f'Rate limit "{limit}" must allow at least one request.')
+  if period.strip() not in _PERIODS:
+    raise ValueError(f'Invalid rate limit period in "{limit}".')
+  return count, count / _PERIODS[period.strip()]
+
+
+class TokenBuckets:
+  """
+  Token buckets spread over `shards` dicts, each behind its own lock so
+  requests for different keys rarely wait on each other. Each shard drops
+  its idle buckets every `evict_every` seconds, a bucket is idle once it
+  has refilled, so evicting it changes nothing.
+  """
+  def __init__(self, shards: int=16, evict_every: float=60, timer=time.monotonic):
+    self.timer = timer
+    self.evict_every = evict_every
+    self._shards = [{} for _ in range(shards)]
+    self._locks = [threading.Lock() for _ in range(shards)]
+    self._evicted = [timer()] * shards
+
+  def __len__(self) -> int:
+    return sum(len(shard) for shard in self._shards)
+
+  def consume(self, key, size: float, rate: float) -> float:
+    """
+    Take a token from the bucket of `key`
+
+    :returns: 0 if allowed, otherwise seconds until a token is available
+    """
+    i = hash(key) % len(self._shards)
+    shard = self._shards[i]
+    with self._locks[i]:
+      now = self.timer()
+      if now - self._evicted[i] >= self.evict_every:
+        self._evict(shard, now)
+        self._evicted[i] = now
+      # tokens left, last update, time the bucket is full again
+      bucket = shard.get(key)
+      tokens = size if bucket is None else \
+        min(size, bucket[0] + (now - bucket[1]) * rate)
+      if tokens < 1:
+        shard[key] = (tokens, now, bucket[2])
+        return (1 - tokens) / rate
+      tokens -= 1
+      shard[key] = (tokens, now, now + (size - tokens) / rate)
+      return 0
+
+  @staticmethod
+  def _evict(shard: dict, now: float) -> None:
+    for key in [key for key, bucket in shard.items() if bucket[2] <= now]:
+      del shard[key]
+
+  def clear(self) -> None:
+    for shard, lock in zip(self._shards, self._locks):
+      with lock:
+        shard.clear()
+
+
+class _LimiterState:
+  """Limits and buckets of one application."""
+  def __init__(self, app: Flask):
+    self.per_ip = parse_limit(app.config['RATE_LIMIT_PER_IP'])
+    self.per_account = parse_limit(app.config['RATE_LIMIT_PER_ACCOUNT'])
+    self.buckets = TokenBuckets(
+      shards=app.config['RATE_LIMIT_SHARDS'],
+      evict_every=app.config['RATE_LIMIT_EVICT_EVERY'])
+
+  def check(self, endpoint: str, account: str=None) -> None:
+    """:raises TooManyRequests: if the client or account is over its limit"""
+    checks = [('ip', request.remote_addr, self.per_ip)]
+    if account:
+      checks.append(('account', account.strip().lower(), self.per_account))
+    for scope, value, (size, rate) in checks:
+      wait = self.buckets.consume((endpoint, scope, value), size, rate)
+      if wait:
+        app_metrics = Metrics.get(current_app)
+        if app_metrics is not None:
+          app_metrics.rate_limited.inc(endpoint=endpoint, scope=scope)
+        abort(429, retry_after=int(wait) + 1)
+
+
+class RateLimiter:
+  """
+  Per client IP and per account token buckets in front of the views that
+  hash passwords or send mail. `RATE_LIMIT_PER_IP` and
+  `RATE_LIMIT_PER_ACCOUNT` are "<requests>/<second|minute|hour|day>",
+  rejected requests get a 429 and are counted in the metrics. Behind a
+  reverse proxy set `PROXY_FIX_X_FOR`, otherwise every client shares the
+  proxy's address.
+  """
+  def __init__(self, app: Flask=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+    app.config.setdefault('RATE_LIMIT_PER_IP', '20/minute')
+    app.config.setdefault('RATE_LIMIT_PER_ACCOUNT', '5/minute')
+    app.config.setdefault('RATE_LIMIT_SHARDS', 16)
+    app.config.setdefault('RATE_LIMIT_EVICT_EVERY', 60)
+    if app.config['RATE_LIMIT_ENABLED']:
+      app.extensions['rate_limiter'] = _LimiterState(app)
+
+  def limit(self, account_field: str=None):
+    """
+    Limit POST requests to the decorated view, before the view runs
+
+    :param account_field: form field naming the account, limited on its own
+    """
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        state = current_app.extensions.get('rate_limiter')
+        if state is not None and request.method == 'POST':
+          account = request.form.get(account_field) if account_field else None
+          state.check(request.endpoint, account)
+        return view(*args, **kwargs)
+      return wrapper
+    return decorator
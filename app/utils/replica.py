@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+from flask import g, has_app_context
+from sqlalchemy.sql.dml import UpdateBase
+from flask_sqlalchemy.session import Session
+
+# bind key of the read replica in `SQLALCHEMY_BINDS`
+REPLICA_BIND = 'replica'
+
+
+@contextmanager
+def replica_reads():
+  """Send the queries made inside the block to the replica, if any."""
+  previous = g.get('_replica_reads', False)
+  g._replica_reads = True
+  try:
+    yield
+  finally:
+    g._replica_reads = previous
+
+
+def has_replica(db) -> bool:
+  """:returns: true if a replica is configured for the current app"""
+  return REPLICA_BIND in db.engines
+
+
+class RoutingSession(Session):
+  """
+  Session that sends reads made inside `replica_reads` to the replica
+  bind when one is configured. Once the app context writes anything,
+  every following statement stays on the primary so a request always
+  reads its own writes.
+  """
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if bind is None and has_app_context():
+      if self._flushing or isinstance(clause, UpdateBase):
+        g._primary_pinned = True
+      elif g.get('_replica_reads') and not g.get('_primary_pinned'):
+        engine = self._db.engines.get(REPLICA_BIND)
+        if engine is not None:
+          return engine
+    return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,150 @@
+import time
+import threading
+from itertools import chain
+from functools import wraps
+from typing import NamedTuple, Union
+from flask import Flask, abort, current_app, has_app_context
+from flask_login import current_user
+from sqlalchemy import event, select
+
+
+class RoleInfo(NamedTuple):
+  id: int
+  name: str
+  permissions: int
+  default: bool
+
+
+class _RoleTableState:
+  """Snapshot of the `roles` table of one application."""
+  def __init__(self, app: Flask, db, timer=time.monotonic):
+    self.app = app
+    self.db = db
+    self.ttl = app.config['ROLE_TABLE_TTL']
+    self.timer = timer
+    self._roles = None
+    self._loaded_at = 0
+    self._lock = threading.Lock()
+
+  def load(self, connection=None) -> dict:
+    """
+    Read every role into the table
+
+    :param connection: connection to read with, a flush passes its own so
+    roles added in the same transaction are seen
+    """
+    from app.models import Role
+    statement = select(Role.id, Role.name, Role.permissions, Role.default)
+    if connection is None:
+      with self.db.engine.connect() as connection:
+        rows = connection.execute(statement).all()
+    else:
+      rows = connection.execute(statement).all()
+    roles = {row.id: RoleInfo(
+      row.id, row.name, row.permissions or 0, bool(row.default)) for row in rows}
+    with self._lock:
+      self._roles = roles
+      self._loaded_at = self.timer()
+    return roles
+
+  def invalidate(self) -> None:
+    with self._lock:
+      self._roles = None
+
+  def roles(self, connection=None) -> dict:
+    """:returns: `RoleInfo` by id, reloaded after `ROLE_TABLE_TTL` seconds"""
+    roles = self._roles
+    if roles is None or self.timer() - self._loaded_at > self.ttl:
+      roles = self.load(connection)
+    return roles
+
+  def get(self, role_id: int) -> Union[RoleInfo, None]:
+    if role_id is None:
+      return None
+    return self.roles().get(role_id)
+
+  def by_name(self, name: str, connection=None) -> Union[RoleInfo, None]:
+    for role in self.roles(connection).values():
+      if role.name == name:
+        return role
+    return None
+
+  def can(self, role_id: int, permission: int) -> bool:
+    role = self.get(role_id)
+    return role is not None and role.permissions & permission == permission
+
+  def role_for(self, email: str, connection=None) -> Union[int, None]:
+    """:returns: id of the role new users with `email` get"""
+    from app.models.user import normalize_email
+    roles = self.roles(connection)
+    admin_email = self.app.config['ADMIN_EMAIL']
+    if admin_email and normalize_email(email) == normalize_email(admin_email):
+      admin = self.by_name('Administrator', connection)
+      if admin is not None:
+        return admin.id
+    for role in roles.values():
+      if role.default:
+        return role.id
+    return None
+
+
+def _roles_flushed(session, flush_context) -> None:
+  from app.models import Role
+  if any(isinstance(obj, Role) for obj in chain(
+      session.new, session.dirty, session.deleted)):
+    session.info['roles_changed'] = True
+
+
+def _roles_ended(session) -> None:
+  # a rolled back change may have been read by a flush, reload either way
+  if session.info.pop('roles_changed', False) and has_app_context():
+    state = current_app.extensions.get('roles')
+    if state is not None:
+      state.invalidate()
+
+
+class RoleTable:
+  """
+  Keep the permissions of every role in process so `User.can` runs no
+  query. The table is read on first use and again when a commit of this
+  process changed a role or `ROLE_TABLE_TTL` seconds passed, for changes
+  made by other workers.
+  """
+  def __init__(self, db=None, app: Flask=None):
+    self.db = db
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('ROLE_TABLE_TTL', 60)
+    app.config.setdefault('ADMIN_EMAIL', None)
+    app.extensions['roles'] = _RoleTableState(app, self.db)
+    app.context_processor(_inject_permissions)
+    for name, listener in (
+        ('after_flush', _roles_flushed),
+        ('after_commit', _roles_ended),
+        ('after_rollback', _roles_ended)):
+      if not event.contains(self.db.session, name, listener):
+        event.listen(self.db.session, name, listener)
+
+
+def _inject_permissions() -> dict:
+  from app.models import Permission
+  return dict(Permission=Permission)
+
+
+def permission_required(permission: int):
+  """
+  Let only users with `permission` through, anonymous users are sent to
+  the login page and others get a 403
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if not current_user.is_authenticated:
+        return current_app.login_manager.unauthorized()
+      if not current_user.can(permission):
+        abort(403)
+      return view(*args, **kwargs)
+    return wrapper
+  return decorator
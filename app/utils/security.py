@@ -1,44 +1,98 @@
 from datetime import datetime, timedelta, timezone
+import time
 import jwt
+from jwt.algorithms import get_default_algorithms
 from jwt.exceptions import (
   ExpiredSignatureError, InvalidSignatureError, DecodeError, InvalidTokenError)
 from flask import current_app
 from app.errors import (
   TokenError, TokenInvalidSignatureError, TokenExpiredError, 
   TokenMalformedError, TokenPayloadError)
+from app.utils.cache import TTLCache
+
+
+class TokenService:
+  """
+  Encode and decode timed JWTs with a key prepared once, recently verified
+  tokens are kept in an LRU until they expire so a token checked twice in
+  one flow is only decoded once.
+  """
+  def __init__(self, secret_key: str, algorithm: str='HS256', cache_size: int=256):
+    """
+    :param secret_key: signing key, usually the app's `SECRET_KEY`
+    :param algorithm: JWT signing algorithm
+    :param cache_size: number of verified tokens to keep, 0 disables the cache
+    """
+    self.algorithm = algorithm
+    self.algorithms = [algorithm]
+    self.key = get_default_algorithms()[algorithm].prepare_key(secret_key)
+    self.cache = TTLCache(maxsize=cache_size, ttl=0)
+
+  def generate(self, payload: dict, expiration: int=3600) -> str:
+    """
+    token default expires in 1 hour
+    
+    :returns: encoded token
+    """
+    now = datetime.now(timezone.utc)
+    _payload = payload.copy()
+    _payload.update({
+      'iat': now, # Issued At
+      'nbf': now, # Not Before Time
+      'exp': now + timedelta(seconds=expiration)
+    })
+    return jwt.encode(_payload, self.key, algorithm=self.algorithm)
+
+  def decode(self, token: str) -> dict:
+    """
+    :returns: decoded payload, a copy the caller may change
+    :raises TokenExpiredError: raised when token is expired
+    :raises TokenInvalidSignatureError: raised when token is tampered with
+    :raises TokenMalformedError: raised when token is malformed or incomplete
+    :raises TokenError: raised for any other error
+    """
+    payload = self.cache.get(token)
+    if payload is None:
+      payload = self._decode(token)
+      # cached only while the token is valid, so `exp` is still enforced
+      ttl = payload.get('exp', 0) - time.time()
+      if ttl > 0:
+        self.cache.set(token, payload, ttl=ttl)
+    return payload.copy()
+
+  def _decode(self, token: str) -> dict:
+    try:
+      return jwt.decode(token, self.key, algorithms=self.algorithms)
+    except ExpiredSignatureError:
+      raise TokenExpiredError()
+    except InvalidSignatureError:
+      raise TokenInvalidSignatureError()
+    except DecodeError:
+      raise TokenMalformedError()
+    except TokenPayloadError as e:
+      raise TokenError(message=e)
+    except Exception as e:
+      raise TokenError(message=e)
+
+  def stats(self) -> dict:
+    """Hit/miss counters of the verified token cache."""
+    return self.cache.stats()
+
 
 def generate_timed_token(payload: dict, expiration: int=3600) -> str:
   """
-  token default expires in 1 hour
+  token default expires in 1 hour, see `TokenService.generate`
   
   :returns: encoded token
   """
-  _payload = payload.copy()
-  _payload.update({
-    'iat': datetime.now(timezone.utc), # Issued At
-    'nbf': datetime.now(timezone.utc), # Not Before Time
-    'exp': datetime.now(timezone.utc) + timedelta(seconds=expiration)
-  })
-  return jwt.encode(_payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+  return current_app.token_service.generate(payload, expiration)
 
 
 def decode_timed_token(token: str) -> dict:
   """
+  see `TokenService.decode`
+
   :returns: decoded payload
-  :raises TokenExpiredError: raised when token is expired
-  :raises TokenInvalidSignatureError: raised when token is tampered with
-  :raises TokenMalformedError: raised when token is malformed or incomplete
-  :raises TokenError: raised for any other error
+  :raises TokenError: if token in invalid, malformed, expired
   """
-  try:
-    return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-  except ExpiredSignatureError:
-    raise TokenExpiredError()
-  except InvalidSignatureError:
-    raise TokenInvalidSignatureError()
-  except DecodeError:
-    raise TokenMalformedError()
-  except TokenPayloadError as e:
-    raise TokenError(message=e)
-  except Exception as e:
-    raise TokenError(message=e)
+  return current_app.token_service.decode(token)
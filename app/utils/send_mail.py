@@ -1,15 +1,15 @@
-from threading import Thread
-from flask import current_app, render_template
-from flask_mail import Message
-from app.ext import mail
+import time
+from flask import current_app
+from flask_mail import Message, email_dispatched, sanitize_address, sanitize_addresses
+from app.ext import mail_dispatcher, email_renderer
+from app.utils.outbox import enqueue_mail
+from app.errors import MailError
 
-def _send_async_mail(app, msg: str) -> None:
-  with app.app_context():
-    mail.send(msg)
 
-
-def send_mail(to: str, subject: str, template: str, **kwargs) -> None:
+def build_message(to: str, subject: str, template: str, **kwargs) -> Message:
   """
+  Render the email
+
   :param to: the recipient, user's email account
   :param subject: email subject
   :param template: email template without file extension, should have 2 versions
@@ -19,10 +19,58 @@ def send_mail(to: str, subject: str, template: str, **kwargs) -> None:
     current_app.config['MAIL_SUBJECT_PREFIX'] + subject,
     sender=current_app.config['MAIL_SENDER'],
     recipients=[to])
-  msg.body = render_template(template + '.txt', **kwargs)
-  msg.html = render_template(template + '.html', **kwargs)
+  msg.body, msg.html = email_renderer.render(template, **kwargs)
+  return msg
+
+
+def send_mail(to: str, subject: str, template: str, **kwargs) -> None:
+  """
+  Render the email and hand it over for delivery, to the outbox table when
+  `MAIL_USE_OUTBOX` is set, otherwise to the in-process mail dispatcher,
+  see `build_message` for the arguments
+
+  :raises MailQueueFullError: if the dispatcher queue stays full
+  """
+  msg = build_message(to, subject, template, **kwargs)
+
+  if current_app.config['MAIL_USE_OUTBOX']:
+    enqueue_mail(msg)
+  else:
+    mail_dispatcher.submit(msg)
+
+
+async def send_message_async(msg: Message) -> None:
+  """
+  Deliver a message with aiosmtplib, waiting on the SMTP server without
+  holding a thread. Uses the Flask-Mail settings and honours
+  `MAIL_SUPPRESS_SEND` and `email_dispatched` like `Mail.send`.
+
+  :raises MailError: if the SMTP server can't be reached or refuses the
+  message
+  :raises RuntimeError: if aiosmtplib isn't installed
+  """
+  try:
+    import aiosmtplib
+  except ImportError as e:
+    raise RuntimeError(
+      'sending mail asynchronously needs aiosmtplib, install the "async" '
+      'extra: pip install ".[async]"') from e
 
-  thr = Thread(
-    target=_send_async_mail, 
-    args=[current_app._get_current_object(), msg])
-  thr.start()
+  state = current_app.extensions['mail']
+  if msg.date is None:
+    msg.date = time.time()
+  if not state.suppress:
+    try:
+      await aiosmtplib.send(
+        msg.as_bytes(),
+        sender=sanitize_address(msg.sender),
+        recipients=list(sanitize_addresses(msg.send_to)),
+        hostname=state.server,
+        port=state.port,
+        username=state.username or None,
+        password=state.password or None,
+        use_tls=state.use_ssl,
+        start_tls=state.use_tls)
+    except (aiosmtplib.SMTPException, OSError) as e:
+      raise MailError(message=f'Mail delivery failed: {e}') from e
+  email_dispatched.send(current_app._get_current_object(), message=msg)
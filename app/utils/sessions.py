@@ -0,0 +1,176 @@
+import os
+import time
+import secrets
+import threading
+from typing import Optional, Tuple
+from flask import Flask
+from flask.sessions import SessionInterface, SecureCookieSession
+from flask.json.tag import TaggedJSONSerializer
+from app.utils.cache import TTLCache
+
+
+class MemorySessionStore:
+  """Sessions of this process in an LRU cache, lost on restart."""
+  def __init__(self, maxsize: int=10000):
+    self.cache = TTLCache(maxsize=maxsize)
+
+  def load(self, sid: str) -> Optional[Tuple[str, float]]:
+    return self.cache.get(sid)
+
+  def save(self, sid: str, payload: str, expires: float) -> None:
+    self.cache.set(sid, (payload, expires), ttl=expires - time.time())
+
+  def delete(self, sid: str) -> None:
+    self.cache.delete(sid)
+
+
+class SQLiteSessionStore:
+  """
+  Sessions in a SQLite file shared by all workers of a host, expired
+  rows are purged every `purge_every` seconds.
+  """
+  def __init__(self, path: str, purge_every: float=300):
+    self.path = path
+    self.purge_every = purge_every
+    self._purged = time.time()
+    self._local = threading.local()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with self._conn() as conn:
+      conn.execute(
+        'CREATE TABLE IF NOT EXISTS sessions '
+        '(id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)')
+
+  def _conn(self) -> 'sqlite3.Connection':
+    conn = getattr(self._local, 'conn', None)
+    if conn is None:
+      import sqlite3
+      conn = self._local.conn = sqlite3.connect(
+        self.path, timeout=5, isolation_level=None)
+      conn.execute('PRAGMA journal_mode=WAL')
+      conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+  def load(self, sid: str) -> Optional[Tuple[str, float]]:
+    return self._conn().execute(
+      'SELECT data, expires FROM sessions WHERE id = ? AND expires > ?',
+      (sid, time.time())).fetchone()
+
+  def save(self, sid: str, payload: str, expires: float) -> None:
+    conn = self._conn()
+    conn.execute(
+      'INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)',
+      (sid, payload, expires))
+    now = time.time()
+    if now - self._purged >= self.purge_every:
+      self._purged = now
+      conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+
+  def delete(self, sid: str) -> None:
+    self._conn().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+
+class ServerSession(SecureCookieSession):
+  """Session stored server side under `sid`, as loaded in `payload`."""
+  def __init__(
+      self, initial: dict=None, sid: str=None, payload: str=None,
+      expires: float=None):
+    super().__init__(initial)
+    self.sid = sid
+    self.new = sid is None
+    self.payload = payload
+    self.expires = expires
+    self.user_id = (initial or {}).get('_user_id')
+
+
+class ServerSessionInterface(SessionInterface):
+  """
+  Keep session data in `store`, the cookie only carries a random session
+  id so it is neither re-serialized nor re-signed per request. A session
+  is written only when its serialized contents changed, or when less than
+  half of its lifetime is left, and gets a new id on login and logout.
+  """
+  serializer = TaggedJSONSerializer()
+  session_class = ServerSession
+
+  def __init__(self, store):
+    self.store = store
+
+  def open_session(self, app: Flask, request) -> ServerSession:
+    sid = request.cookies.get(self.get_cookie_name(app))
+    if sid:
+      found = self.store.load(sid)
+      if found is not None:
+        payload, expires = found
+        return self.session_class(
+          self.serializer.loads(payload), sid=sid, payload=payload, expires=expires)
+    return self.session_class()
+
+  def save_session(self, app: Flask, session: ServerSession, response) -> None:
+    name = self.get_cookie_name(app)
+    domain = self.get_cookie_domain(app)
+    path = self.get_cookie_path(app)
+    secure = self.get_cookie_secure(app)
+    samesite = self.get_cookie_samesite(app)
+    httponly = self.get_cookie_httponly(app)
+
+    if session.accessed:
+      response.vary.add('Cookie')
+
+    if not session:
+      if session.sid is not None:
+        self.store.delete(session.sid)
+        response.delete_cookie(
+          name, domain=domain, path=path, secure=secure, samesite=samesite,
+          httponly=httponly)
+        response.vary.add('Cookie')
+      return
+
+    now = time.time()
+    lifetime = app.permanent_session_lifetime.total_seconds()
+    stale = session.expires is None or session.expires - now < lifetime / 2
+    if not session.modified and not stale:
+      return
+    payload = self.serializer.dumps(dict(session))
+    # e.g. a flash added and shown in the same request
+    if payload == session.payload and not stale:
+      return
+
+    sid = session.sid
+    if sid is None or dict.get(session, '_user_id') != session.user_id:
+      # new id when the user changes, against session fixation
+      if sid is not None:
+        self.store.delete(sid)
+      sid = session.sid = secrets.token_urlsafe(32)
+    self.store.save(sid, payload, now + lifetime)
+    response.set_cookie(
+      name, sid, expires=self.get_expiration_time(app, session),
+      httponly=httponly, domain=domain, path=path, secure=secure,
+      samesite=samesite)
+    response.vary.add('Cookie')
+
+
+class ServerSessions:
+  """
+  Replace the signed cookie session with a server side store chosen by
+  `SESSION_BACKEND`: "cookie" keeps Flask's default, "memory" keeps
+  sessions in the process (single worker deployments) and "sqlite" in
+  the `SESSION_SQLITE_PATH` file.
+  """
+  def __init__(self, app: Flask=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app: Flask) -> None:
+    app.config.setdefault('SESSION_BACKEND', 'cookie')
+    app.config.setdefault('SESSION_MEMORY_SIZE', 10000)
+    app.config.setdefault('SESSION_SQLITE_PATH', None)
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+      return
+    if backend == 'memory':
+      store = MemorySessionStore(app.config['SESSION_MEMORY_SIZE'])
+    elif backend == 'sqlite':
+      store = SQLiteSessionStore(app.config['SESSION_SQLITE_PATH'])
+    else:
+      raise ValueError(f'Unknown session backend "{backend}"')
+    app.session_interface = ServerSessionInterface(store)
@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import json
+import subprocess
+from config import basedir
+
+# timed in a fresh interpreter, the way a WSGI server loads a worker
+_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import run
+loaded = time.perf_counter()
+response = run.app.test_client().get({path!r})
+done = time.perf_counter()
+print(json.dumps(dict(
+  load_ms=(loaded - started) * 1000, first_request_ms=(done - loaded) * 1000,
+  status=response.status_code)))
+'''
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(output: str) -> list:
+  """
+  Parse the stderr of `python -X importtime`
+
+  :returns: one dict per import with `name`, `self_ms`, `cumulative_ms` and
+  `depth`, 0 for modules imported by the script itself
+  """
+  modules = []
+  for line in output.splitlines():
+    match = _IMPORT_LINE.match(line)
+    if match is None:
+      continue
+    own, cumulative, indent, name = match.groups()
+    modules.append(dict(
+      name=name, self_ms=int(own) / 1000, cumulative_ms=int(cumulative) / 1000,
+      depth=(len(indent) - 1) // 2))
+  return modules
+
+
+def profile_startup(config_name: str, path: str='/') -> dict:
+  """
+  Load the application in a new serving process (no CLI commands) with
+  `config_name` and request `path` once
+
+  :returns: dict with `modules` from `parse_importtime`, `load_ms` (imports
+  and `create_app`), `first_request_ms`, `total_ms` and the `status` of the
+  first response
+  :raises RuntimeError: if the process fails
+  """
+  env = dict(os.environ, ENV=config_name)
+  env.pop('FLASK_RUN_FROM_CLI', None)
+  process = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', _SCRIPT.format(path=path)],
+    cwd=basedir, env=env, capture_output=True, text=True)
+  if process.returncode != 0:
+    raise RuntimeError(process.stderr.strip().splitlines()[-1])
+  result = json.loads(process.stdout.strip().splitlines()[-1])
+  result['modules'] = parse_importtime(process.stderr)
+  result['total_ms'] = result['load_ms'] + result['first_request_ms']
+  return result
@@ -0,0 +1,126 @@
+"""
+Throughput of `UserService` on threads against `AsyncUserService` on one
+event loop as the number of in-flight requests grows. Each request is a
+password reset request: a user lookup plus one email, delivered to a local
+SMTP server that answers after `--smtp-delay` seconds. The sync runs count
+a request as done once the mail dispatcher delivered its email.
+
+  python -m benchmarks.bench_async_service --requests 200 --concurrency 1 8 32
+"""
+import os
+import time
+import socket
+import asyncio
+import tempfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from aiosmtpd.controller import Controller
+from app import db
+from app.models import User
+from benchmarks.common import create_bench_app, save_json
+
+
+class SlowHandler:
+  """SMTP sink answering each message after `delay` seconds."""
+  def __init__(self, delay: float):
+    self.delay = delay
+
+  async def handle_DATA(self, server, session, envelope):
+    await asyncio.sleep(self.delay)
+    return '250 OK'
+
+
+def free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+def create_app(tmp: str, port: int, concurrency: int):
+  app = create_bench_app(
+    f'sqlite:///{os.path.join(tmp, "bench.sqlite")}',
+    MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False,
+    MAIL_SUPPRESS_SEND=False, MAIL_LINK_HOST='localhost',
+    MAIL_DISPATCHER_WORKERS=concurrency,
+    MAIL_DISPATCHER_QUEUE_SIZE=0)
+  with app.app_context():
+    db.create_all()
+    db.session.execute(db.insert(User), [
+      dict(email=f'user{i}@example.com', username=f'user{i}', password_hash='x')
+      for i in range(100)])
+    db.session.commit()
+  return app
+
+
+def run_sync(app, requests: int, concurrency: int) -> float:
+  srv = app.user_service
+
+  def reset(i):
+    with app.app_context():
+      srv.reset_password_request(f'user{i % 100}@example.com')
+      db.session.remove()
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    list(pool.map(reset, range(requests)))
+  app.extensions['mail_dispatcher'].queue.join()
+  return time.perf_counter() - started
+
+
+def run_async(app, requests: int, concurrency: int) -> float:
+  srv = app.async_user_service
+
+  async def main():
+    limit = asyncio.Semaphore(concurrency)
+
+    async def reset(i):
+      async with limit:
+        await srv.reset_password_request(f'user{i % 100}@example.com')
+
+    # open the pool outside of the timed part, like the sync engine
+    await srv.get(1)
+    started = time.perf_counter()
+    await asyncio.gather(*[reset(i) for i in range(requests)])
+    elapsed = time.perf_counter() - started
+    await srv.dispose()
+    return elapsed
+
+  with app.app_context():
+    return asyncio.run(main())
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--requests', type=int, default=200)
+  parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+  parser.add_argument('--smtp-delay', type=float, default=0.02)
+  parser.add_argument('--output', help='save results as JSON')
+  args = parser.parse_args()
+
+  port = free_port()
+  controller = Controller(
+    SlowHandler(args.smtp_delay), hostname='127.0.0.1', port=port)
+  controller.start()
+  results = {}
+  print('concurrency   sync req/s   async req/s')
+  try:
+    for concurrency in args.concurrency:
+      row = {}
+      for name, run in (('sync', run_sync), ('async', run_async)):
+        with tempfile.TemporaryDirectory() as tmp:
+          app = create_app(tmp, port, concurrency)
+          elapsed = run(app, args.requests, concurrency)
+          row[name] = round(args.requests / elapsed, 1)
+          app.extensions['mail_dispatcher'].shutdown()
+          with app.app_context():
+            db.engine.dispose()
+      results[f'x{concurrency}'] = row
+      print(f'{concurrency:>11} {row["sync"]:>12} {row["async"]:>13}')
+  finally:
+    controller.stop()
+  if args.output:
+    save_json(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
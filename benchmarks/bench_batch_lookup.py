@@ -0,0 +1,77 @@
+"""
+Resolving many users with one lookup per user against the batch lookups
+with chunked IN queries, by id, email and username, on a file database.
+Every run starts from an empty session and the identity cache is off.
+
+  python -m benchmarks.bench_batch_lookup --users 10000 --runs 5
+"""
+import os
+import time
+import random
+import tempfile
+import argparse
+from sqlalchemy import insert
+from app import db
+from app.models import User
+from benchmarks.common import create_bench_app, summarize, print_table, save_json
+
+
+def seed(users: int) -> None:
+  db.create_all()
+  db.session.execute(insert(User), [
+    dict(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+    for i in range(users)])
+  db.session.commit()
+
+
+def lookups(srv, users: int) -> dict:
+  """:returns: name to a function resolving every user"""
+  ids = list(range(1, users + 1))
+  emails = [f'user{i}@example.com' for i in range(users)]
+  names = [f'user{i}' for i in range(users)]
+  for values in (ids, emails, names):
+    random.shuffle(values)
+  return {
+    'loop get': lambda: [srv.get(id) for id in ids],
+    'get_many': lambda: srv.get_many(ids),
+    'loop get_by_email': lambda: [srv.get_by_email(e) for e in emails],
+    'get_many_by_email': lambda: srv.get_many_by_email(emails),
+    'loop get_by_username': lambda: [srv.get_by_username(n) for n in names],
+    'get_many_by_username': lambda: srv.get_many_by_username(names),
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--users', type=int, default=10000)
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--output', help='save results as JSON')
+  args = parser.parse_args()
+
+  results = {}
+  with tempfile.TemporaryDirectory() as tmp:
+    app = create_bench_app(
+      f'sqlite:///{os.path.join(tmp, "bench.sqlite")}', USER_CACHE_SIZE=0)
+    with app.app_context():
+      seed(args.users)
+      for name, lookup in lookups(app.user_service, args.users).items():
+        samples = []
+        for _ in range(args.runs):
+          db.session.remove()
+          started = time.perf_counter()
+          lookup()
+          samples.append(time.perf_counter() - started)
+        # one sample per run of `--users` lookups
+        row = results[name] = summarize(samples)
+        row['lookups_per_sec'] = round(args.users / row['mean_ms'] * 1000)
+      db.drop_all()
+
+  print_table(results)
+  for name, row in results.items():
+    print(f'> {name}: {row["lookups_per_sec"]} lookups/s')
+  if args.output:
+    save_json(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
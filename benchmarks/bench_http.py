@@ -0,0 +1,205 @@
+"""
+End-to-end latency of the auth and user endpoints, driven through the
+Flask test client against N users seeded with faker.
+
+  python -m benchmarks.bench_http --users 1000 --iterations 200 \
+    --output http.json --compare previous.json
+"""
+import os
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from faker import Faker
+from flask import Flask
+from app import db
+from app.ext import password_hasher
+from app.models import User
+from app.utils.security import generate_timed_token
+from benchmarks.common import create_bench_app, summarize, print_table, save_json
+
+PASSWORD = 'bench-password'
+
+
+def seed(app: Flask, fake: Faker, count: int) -> list:
+  """
+  Insert `count` users sharing one password hash
+
+  :returns: (id, email) of the seeded users
+  """
+  with app.app_context():
+    db.create_all()
+    pwhash = password_hasher.hash(PASSWORD)
+    rows = []
+    emails, usernames = set(), set()
+    while len(rows) < count:
+      email, username = fake.unique.email(), fake.unique.user_name()
+      if email in emails or username in usernames:
+        continue
+      emails.add(email)
+      usernames.add(username)
+      rows.append(dict(
+        email=email, username=username, password_hash=pwhash, confirmed=False))
+    db.session.execute(db.insert(User), rows)
+    db.session.commit()
+    return [(u.id, u.email) for u in User.query.order_by(User.id)]
+
+
+def login(client, email: str) -> None:
+  client.post('/auth/login', data=dict(email=email, password=PASSWORD))
+
+
+def token(app: Flask, payload: dict) -> str:
+  with app.app_context():
+    return generate_timed_token(payload)
+
+
+class Runner:
+  def __init__(self, app: Flask, users: list, fake: Faker, iterations: int):
+    self.app = app
+    self.users = users
+    self.fake = fake
+    self.iterations = iterations
+    self.results = {}
+
+  def measure(
+      self, name: str, setup, request, status: int=200,
+      location: str=None) -> None:
+    """
+    :param setup: called with the iteration number before each request,
+    not timed, returns the client to use
+    :param request: called with the client and iteration number, timed
+    :param status: expected status, anything else fails the run so an
+    error page or a rejected form isn't timed as the scenario
+    :param location: expected redirect path when `status` is a redirect
+    """
+    samples = []
+    for i in range(self.iterations):
+      client = setup(i)
+      started = time.perf_counter()
+      response = request(client, i)
+      samples.append(time.perf_counter() - started)
+      if response.status_code != status:
+        raise RuntimeError(
+          f'{name} returned {response.status_code}, expected {status}')
+      if location is not None and urlsplit(response.location).path != location:
+        raise RuntimeError(
+          f'{name} redirected to {response.location}, expected {location}')
+    self.results[name] = summarize(samples)
+
+  def user(self, i: int) -> tuple:
+    return self.users[i % len(self.users)]
+
+  def anonymous(self, i: int):
+    return self.app.test_client()
+
+  def logged_in(self, i: int):
+    client = self.app.test_client()
+    login(client, self.user(i)[1])
+    return client
+
+  def run(self) -> dict:
+    self.measure(
+      'auth.login GET', self.anonymous,
+      lambda c, i: c.get('/auth/login'))
+    self.measure(
+      'auth.login POST', self.anonymous,
+      lambda c, i: c.post('/auth/login', data=dict(
+        email=self.user(i)[1], password=PASSWORD)),
+      status=302, location='/')
+    self.measure(
+      'auth.register POST', self.anonymous,
+      lambda c, i: c.post('/auth/register', data=dict(
+        email=f'bench{i}-{self.fake.unique.email()}',
+        username=f'bench{i}{self.fake.unique.user_name()}'.replace('-', ''),
+        password=PASSWORD, password2=PASSWORD, terms='y')),
+      status=302, location='/auth/login')
+    self.measure(
+      'auth.reset_password_request POST', self.anonymous,
+      lambda c, i: c.post('/auth/reset-password', data=dict(
+        email=self.user(i)[1])),
+      status=302, location='/')
+    self.measure(
+      'auth.reset_password GET', self.anonymous,
+      lambda c, i: c.get('/auth/reset-password/' + token(
+        self.app, {'reset-password': self.user(i)[1]})))
+    self.measure(
+      'auth.reset_password POST', self.anonymous,
+      lambda c, i: c.post(
+        '/auth/reset-password/' + token(
+          self.app, {'reset-password': self.user(i)[1]}),
+        data=dict(password=PASSWORD, password2=PASSWORD)),
+      status=302, location='/auth/login')
+    self.measure(
+      'user.settings GET', self.logged_in,
+      lambda c, i: c.get('/user/settings'))
+    self.measure(
+      'auth.confirm GET', self.logged_in,
+      lambda c, i: c.get('/auth/confirm/' + token(
+        self.app, {'confirm': self.user(i)[0]})),
+      status=302, location='/')
+    self.measure(
+      'user.update_user_email GET', self.logged_in,
+      lambda c, i: c.get('/user/update-user-email/' + token(
+        self.app, {'email': self.user(i)[1], 'new-email': self.user(i)[1]})),
+      status=302, location='/user/settings')
+    return self.results
+
+
+def compare(results: dict, path: str) -> None:
+  """Print p50/p95 and requests/sec change against a saved run."""
+  with open(path) as f:
+    previous = json.load(f)['results']
+  print(f'\nchange against "{path}":')
+  for name, row in results.items():
+    old = previous.get(name)
+    if not old:
+      continue
+    deltas = [
+      f'{key} {(row[key] - old[key]) / old[key] * 100:+.1f}%'
+      for key in ('p50_ms', 'p95_ms', 'rps') if old[key]]
+    print(f'  {name}: ' + ', '.join(deltas))
+
+
+def git_revision() -> str:
+  try:
+    return subprocess.check_output(
+      ['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return ''
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--users', type=int, default=1000)
+  parser.add_argument('--iterations', type=int, default=200)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='save results as JSON')
+  parser.add_argument('--compare', help='JSON of a previous run')
+  args = parser.parse_args()
+
+  fake = Faker()
+  Faker.seed(args.seed)
+  with tempfile.TemporaryDirectory() as tmp:
+    app = create_bench_app(f'sqlite:///{os.path.join(tmp, "bench.sqlite")}')
+    users = seed(app, fake, args.users)
+    results = Runner(app, users, fake, args.iterations).run()
+
+  print_table(results)
+  if args.compare:
+    compare(results, args.compare)
+  if args.output:
+    save_json(args.output, dict(
+      meta=dict(
+        revision=git_revision(),
+        date=datetime.now(timezone.utc).isoformat(),
+        users=args.users,
+        iterations=args.iterations),
+      results=results))
+
+
+if __name__ == '__main__':
+  main()
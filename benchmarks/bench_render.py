@@ -0,0 +1,116 @@
+"""
+Template render time per page, timed between Flask's render signals. Warm
+renders compare the navbar fragment cache on and off, cold renders (first
+render of a fresh app, compilation included) compare with and without the
+Jinja bytecode cache.
+
+  python -m benchmarks.bench_render --iterations 500 --cold-runs 20
+"""
+import os
+import time
+import tempfile
+import argparse
+from flask import before_render_template, template_rendered
+from app import db
+from app.models import User
+from benchmarks.common import create_bench_app, summarize, print_table, save_json
+
+PAGES = (
+  ('index', '/', False),
+  ('login', '/auth/login', False),
+  ('register', '/auth/register', False),
+  ('index logged in', '/', True),
+  ('settings', '/user/settings', True),
+)
+
+
+def create_app(database_url: str, **settings):
+  app = create_bench_app(database_url, **settings)
+  with app.app_context():
+    db.create_all()
+    if db.session.get(User, 1) is None:
+      db.session.add(User(
+        username='bench', email='bench@example.com', password='password',
+        confirmed=True))
+      db.session.commit()
+  return app
+
+
+class RenderTimer:
+  """Collect render times of `app` from the template signals."""
+  def __init__(self, app):
+    self.samples = []
+    self._started = None
+    before_render_template.connect(self.before, app)
+    template_rendered.connect(self.after, app)
+
+  def before(self, sender, **extra):
+    self._started = time.perf_counter()
+
+  def after(self, sender, **extra):
+    self.samples.append(time.perf_counter() - self._started)
+
+  def take(self) -> list:
+    samples, self.samples = self.samples, []
+    return samples
+
+
+def clients(app) -> dict:
+  anonymous = app.test_client()
+  logged_in = app.test_client()
+  logged_in.post('/auth/login', data=dict(email='bench@example.com', password='password'))
+  return {False: anonymous, True: logged_in}
+
+
+def warm(database_url: str, iterations: int, fragments: bool) -> dict:
+  app = create_app(database_url, TEMPLATE_FRAGMENT_CACHE=fragments)
+  timer = RenderTimer(app)
+  users = clients(app)
+  results = {}
+  for name, url, logged_in in PAGES:
+    for _ in range(iterations):
+      users[logged_in].get(url)
+    results[name] = summarize(timer.take())
+  return results
+
+
+def cold(database_url: str, runs: int, cache_dir: str=None) -> dict:
+  samples = {name: [] for name, _, _ in PAGES}
+  if cache_dir:
+    # fill the cache like a previous worker would have
+    warm(database_url, 1, True)
+  for _ in range(runs):
+    app = create_app(database_url, JINJA_BYTECODE_CACHE_DIR=cache_dir)
+    timer = RenderTimer(app)
+    users = clients(app)
+    for name, url, logged_in in PAGES:
+      users[logged_in].get(url)
+      samples[name].extend(timer.take())
+  return {name: summarize(values) for name, values in samples.items()}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--iterations', type=int, default=500)
+  parser.add_argument('--cold-runs', type=int, default=20)
+  parser.add_argument('--output', help='save results as JSON')
+  args = parser.parse_args()
+
+  results = {}
+  with tempfile.TemporaryDirectory() as tmp:
+    database_url = f'sqlite:///{os.path.join(tmp, "bench.sqlite")}'
+    cache_dir = os.path.join(tmp, 'jinja')
+    for label, fragments in (('no fragments', False), ('fragments', True)):
+      for name, row in warm(database_url, args.iterations, fragments).items():
+        results[f'warm {label}: {name}'] = row
+    for label, directory in (('no bytecode', None), ('bytecode', cache_dir)):
+      for name, row in cold(database_url, args.cold_runs, directory).items():
+        results[f'cold {label}: {name}'] = row
+
+  print_table(results)
+  if args.output:
+    save_json(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,73 @@
+"""
+Signup latency with the pre-check SELECTs against relying on the unique
+indexes, on a file database so commits pay their real cost.
+
+  python -m benchmarks.bench_signup --users 1000
+"""
+import os
+import time
+import tempfile
+import argparse
+from app import db
+from app.ext import password_hasher
+from app.models import User
+from app.errors import EmailAlreadyExistsError, UsernameAlreadyExistsError
+from benchmarks.common import create_bench_app, summarize, print_table, save_json
+
+
+def register_with_prechecks(srv, email, username, password):
+  """The registration path before unique constraint mapping."""
+  if User.query.filter_by(email=email).first() is not None:
+    raise EmailAlreadyExistsError()
+  if User.query.filter_by(username=username).first() is not None:
+    raise UsernameAlreadyExistsError()
+  user = User(username=username, email=email)
+  user.password_hash = password_hasher.hash(password)
+  db.session.add(user)
+  db.session.commit()
+  srv.send_confirmation_mail(user)
+  return user
+
+
+def run(register, users: int) -> list:
+  with tempfile.TemporaryDirectory() as tmp:
+    app = create_bench_app(f'sqlite:///{os.path.join(tmp, "bench.sqlite")}')
+    with app.test_request_context():
+      db.create_all()
+      srv = app.user_service
+      samples = []
+      for i in range(users):
+        started = time.perf_counter()
+        register(srv, f'user{i}@example.com', f'user{i}', 'password')
+        samples.append(time.perf_counter() - started)
+        db.session.remove()
+      # duplicates, half on email and half on username
+      for i in range(users // 10):
+        email = f'user{i}@example.com' if i % 2 else f'new{i}@example.com'
+        try:
+          register(srv, email, f'user{i}', 'password')
+        except (EmailAlreadyExistsError, UsernameAlreadyExistsError):
+          pass
+        db.session.remove()
+      db.drop_all()
+  return samples
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--users', type=int, default=1000)
+  parser.add_argument('--output', help='save results as JSON')
+  args = parser.parse_args()
+
+  results = {
+    'precheck_selects': summarize(run(register_with_prechecks, args.users)),
+    'unique_constraints': summarize(
+      run(lambda srv, *a: srv.register_user(*a), args.users)),
+  }
+  print_table(results)
+  if args.output:
+    save_json(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
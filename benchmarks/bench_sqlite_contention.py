@@ -0,0 +1,104 @@
+"""
+Write throughput of N concurrent writers on a SQLite file, with stock
+settings against the production pragmas (WAL, synchronous=NORMAL, ...).
+Each writer commits one user per transaction while a reader thread keeps
+looking users up, like logins alongside signups.
+
+  python -m benchmarks.bench_sqlite_contention --writers 1 4 8 --seconds 5
+"""
+import os
+import time
+import tempfile
+import argparse
+import threading
+from sqlalchemy.exc import OperationalError
+from config import sqlite_pragmas
+from app import db
+from app.models import User
+from benchmarks.common import create_bench_app, save_json
+
+
+def run(pragmas: dict, writers: int, seconds: float) -> dict:
+  with tempfile.TemporaryDirectory() as tmp:
+    app = create_bench_app(
+      f'sqlite:///{os.path.join(tmp, "bench.sqlite")}', SQLITE_PRAGMAS=pragmas)
+    with app.app_context():
+      db.create_all()
+    stop = threading.Event()
+    counts = dict(commits=0, locked=0, reads=0)
+    lock = threading.Lock()
+
+    def write(n):
+      i = 0
+      with app.app_context():
+        while not stop.is_set():
+          db.session.add(User(
+            username=f'w{n}-{i}', email=f'w{n}-{i}@example.com',
+            password_hash='x'))
+          try:
+            db.session.commit()
+            with lock:
+              counts['commits'] += 1
+          except OperationalError:
+            db.session.rollback()
+            with lock:
+              counts['locked'] += 1
+          i += 1
+
+    def read():
+      with app.app_context():
+        while not stop.is_set():
+          try:
+            User.query.filter_by(email='w0-0@example.com').first()
+            db.session.rollback()
+            with lock:
+              counts['reads'] += 1
+          except OperationalError:
+            db.session.rollback()
+            with lock:
+              counts['locked'] += 1
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    threads.append(threading.Thread(target=read))
+    started = time.perf_counter()
+    for thr in threads:
+      thr.start()
+    time.sleep(seconds)
+    stop.set()
+    for thr in threads:
+      thr.join()
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+      db.engine.dispose()
+
+  return dict(
+    writers=writers,
+    commits_per_sec=round(counts['commits'] / elapsed, 1),
+    reads_per_sec=round(counts['reads'] / elapsed, 1),
+    locked_errors=counts['locked'])
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 8])
+  parser.add_argument('--seconds', type=float, default=5)
+  parser.add_argument('--output', help='save results as JSON')
+  args = parser.parse_args()
+
+  # sqlite3 waits 5s on a locked database by default, so stock runs wait too
+  profiles = {'stock': {}, 'tuned': sqlite_pragmas()}
+  results = {}
+  print('profile   writers   commits/s   reads/s   locked')
+  for name, pragmas in profiles.items():
+    for writers in args.writers:
+      row = run(pragmas, writers, args.seconds)
+      results[f'{name} x{writers}'] = row
+      print(
+        f'{name:<9} {writers:>7} {row["commits_per_sec"]:>11} '
+        f'{row["reads_per_sec"]:>9} {row["locked_errors"]:>8}')
+  if args.output:
+    save_json(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
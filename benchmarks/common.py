@@ -0,0 +1,56 @@
+import json
+import statistics
+from flask import Flask
+from config import options, TestingConfig
+from app import create_app
+
+
+def create_bench_app(database_url: str='sqlite://', **settings) -> Flask:
+  """
+  Create a testing app on its own database
+
+  :param database_url: database for this run, in memory by default
+  :param settings: extra config values
+  """
+  settings.setdefault('WTF_CSRF_ENABLED', False)
+  options['benchmark'] = type(
+    'BenchmarkConfig', (TestingConfig,),
+    dict(SQLALCHEMY_DATABASE_URI=database_url, **settings))
+  return create_app('benchmark')
+
+
+def percentile(samples: list, pct: float) -> float:
+  ordered = sorted(samples)
+  index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+  return ordered[index]
+
+
+def summarize(samples: list, elapsed: float=None) -> dict:
+  """
+  :param samples: latencies in seconds
+  :param elapsed: wall time of the run, defaults to the sum of samples
+  :returns: count, requests/sec and latency percentiles in milliseconds
+  """
+  elapsed = elapsed or sum(samples)
+  return dict(
+    count=len(samples),
+    rps=round(len(samples) / elapsed, 1) if elapsed else 0,
+    mean_ms=round(statistics.mean(samples) * 1000, 3),
+    p50_ms=round(percentile(samples, 50) * 1000, 3),
+    p95_ms=round(percentile(samples, 95) * 1000, 3),
+    p99_ms=round(percentile(samples, 99) * 1000, 3))
+
+
+def print_table(results: dict) -> None:
+  """Print one row of `summarize` output per benchmark name."""
+  columns = ['count', 'rps', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms']
+  width = max(len(name) for name in results) + 2
+  print('name'.ljust(width) + ''.join(c.rjust(10) for c in columns))
+  for name, row in results.items():
+    print(name.ljust(width) + ''.join(str(row[c]).rjust(10) for c in columns))
+
+
+def save_json(path: str, results: dict) -> None:
+  with open(path, 'w') as f:
+    json.dump(results, f, indent=2)
+  print(f'> results saved to "{path}".')
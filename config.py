@@ -3,9 +3,44 @@ import secrets
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def engine_options(uri: str) -> dict:
+  """
+  SQLAlchemy engine options for `uri`, pool sizing applies to server
+  databases only, SQLite is tuned through `SQLITE_PRAGMAS` instead
+  """
+  if uri.startswith('sqlite'):
+    return {}
+  return dict(
+    pool_size=int(os.environ.get('DB_POOL_SIZE') or 5),
+    max_overflow=int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+    pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT') or 30),
+    pool_recycle=int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+    pool_pre_ping=os.environ.get('DB_POOL_PRE_PING', 'true').lower() in \
+      ['true', 'on', '1'])
+
+
+def sqlite_pragmas() -> dict:
+  """
+  PRAGMAs run on every new SQLite connection, WAL lets readers and the
+  writer work at the same time and `busy_timeout` makes writers wait for
+  the lock instead of failing with "database is locked"
+  """
+  return {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL',
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024),
+    # negative values are in KiB
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE') or -64000),
+  }
+
+
 class Config:
   SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
   ADMIN_EMAIL = os.environ.get('ADMIN')
+  # number of verified tokens kept until they expire, 0 disables the cache
+  TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE') or 256)
   # Mail Server config
   MAIL_SERVER = os.environ.get('MAIL_SERVER')
   MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
@@ -16,13 +51,101 @@ class Config:
   MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
   MAIL_SUBJECT_PREFIX = '[Ghusn]'
   MAIL_SENDER = 'Ghusn Admin <Ghusn@email.com>'
+  # host used for links in emails rendered outside of a request
+  MAIL_LINK_HOST = os.environ.get('MAIL_LINK_HOST')
+  # Mail dispatcher config, workers share a bounded queue and keep their
+  # SMTP connections open between messages
+  MAIL_DISPATCHER_WORKERS = int(os.environ.get('MAIL_DISPATCHER_WORKERS') or 2)
+  MAIL_DISPATCHER_QUEUE_SIZE = int(
+    os.environ.get('MAIL_DISPATCHER_QUEUE_SIZE') or 100)
+  MAIL_DISPATCHER_PUT_TIMEOUT = float(
+    os.environ.get('MAIL_DISPATCHER_PUT_TIMEOUT') or 5)
+  MAIL_DISPATCHER_IDLE_TIMEOUT = float(
+    os.environ.get('MAIL_DISPATCHER_IDLE_TIMEOUT') or 30)
+  # Outbox config, when enabled mail is stored in the database and
+  # delivered by the "flask mail-worker" command
+  MAIL_USE_OUTBOX = os.environ.get('MAIL_USE_OUTBOX', 'false').lower() in \
+    ['true', 'on', '1']
+  # Password hashing config, werkzeug hash method with its cost parameters,
+  # use "flask calibrate-hash" to pick one for the target machine
+  PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or \
+    'scrypt:32768:8:1'
+  # hash in a process pool instead of the request thread, the pool defaults
+  # to one worker per core
+  PASSWORD_HASH_EXECUTOR = os.environ.get(
+    'PASSWORD_HASH_EXECUTOR', 'false').lower() in ['true', 'on', '1']
+  PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 0) \
+    or None
+  # Prometheus metrics at "/metrics", served to the comma separated
+  # METRICS_ALLOWED_IPS and to requests with "Authorization: Bearer <METRICS_TOKEN>"
+  METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in \
+    ['true', 'on', '1']
+  METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+  METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS') or '127.0.0.1,::1'
+  # Rate limits of login, register and password reset POSTs, per client
+  # IP and per account, as "<requests>/<second|minute|hour|day>"
+  RATE_LIMIT_ENABLED = os.environ.get(
+    'RATE_LIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+  RATE_LIMIT_PER_IP = os.environ.get('RATE_LIMIT_PER_IP') or '20/minute'
+  RATE_LIMIT_PER_ACCOUNT = os.environ.get('RATE_LIMIT_PER_ACCOUNT') or '5/minute'
+  # number of reverse proxies in front of the app, the client IP is read
+  # from that many X-Forwarded-For entries, 0 uses the socket address
+  PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+  # Session storage: "cookie" (signed cookie), "memory" (per process) or
+  # "sqlite", the server side stores only put a session id in the cookie
+  SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'cookie'
+  SESSION_MEMORY_SIZE = int(os.environ.get('SESSION_MEMORY_SIZE') or 10000)
+  SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH') or \
+    os.path.join(basedir, 'tmp', 'sessions.sqlite')
+  # compiled templates are kept here across restarts
+  JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or \
+    os.path.join(basedir, 'tmp', 'jinja-cache')
+  # output of "flask assets build", served with immutable caching
+  ASSETS_BUILD_DIR = os.environ.get('ASSETS_BUILD_DIR') or \
+    os.path.join(basedir, 'app', 'static', 'build')
   # Database config
   SQLALCHEMY_TRACK_MODIFICATIONS = False
+  SQLITE_PRAGMAS = {}
+  # user lookups and Flask-Login's user loader read from this database
+  # when set, writes and reads after a write stay on the primary
+  DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+  SQLALCHEMY_BINDS = {
+    'replica': dict(url=DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL))
+  } if DATABASE_REPLICA_URL else {}
+  # seconds after a change during which a user is read from the primary,
+  # the longest the replica is expected to lag
+  REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG') or 5)
+  # Query profiler, logs slow and repeated statements and captures per
+  # request stats for "flask query-report"
+  QUERY_PROFILER_ENABLED = os.environ.get(
+    'QUERY_PROFILER_ENABLED', 'false').lower() in ['true', 'on', '1']
+  QUERY_PROFILER_SLOW_MS = float(os.environ.get('QUERY_PROFILER_SLOW_MS') or 100)
+  QUERY_PROFILER_REPEATS = int(os.environ.get('QUERY_PROFILER_REPEATS') or 3)
+  QUERY_PROFILER_PATH = os.environ.get('QUERY_PROFILER_PATH') or \
+    os.path.join(basedir, 'tmp', 'query-profile.jsonl')
+  # Users loaded by Flask-Login are cached per process, a size of 0
+  # disables the cache
+  USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+  USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL') or 60)
+  # seconds before the in-process role table is read again, for role
+  # changes made by other workers
+  ROLE_TABLE_TTL = float(os.environ.get('ROLE_TABLE_TTL') or 60)
+  # users per page of the admin listing, rows per batch of the CSV export
+  ADMIN_USERS_PER_PAGE = int(os.environ.get('ADMIN_USERS_PER_PAGE') or 50)
+  ADMIN_EXPORT_BATCH_SIZE = int(os.environ.get('ADMIN_EXPORT_BATCH_SIZE') or 1000)
+
+  # database of `AsyncUserService`, defaults to the app's database with
+  # its asyncio driver, e.g. "sqlite+aiosqlite://"
+  ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+  ASYNC_ENGINE_OPTIONS = {}
 
   @staticmethod
   def init_app(app):
-    from app.services import UserService
+    from app.services import UserService, AsyncUserService
     app.user_service = UserService(app)
+    app.async_user_service = AsyncUserService(
+      app, identity_cache=app.user_service.identity_cache,
+      recent_writes=app.user_service.recent_writes)
 
 
 class DevelopmentConfig(Config):
@@ -30,11 +153,16 @@ class DevelopmentConfig(Config):
   ENV = 'development'
   SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or\
     f'sqlite:///{os.path.join(basedir, "data", "dev.sqlite")}'
+  SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
 
 
 class TestingConfig(Config):
   TESTING = True
   ENV = 'testing'
+  PASSWORD_HASH_EXECUTOR = False
+  PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+  RATE_LIMIT_ENABLED = False
+  JINJA_BYTECODE_CACHE_DIR = None
   SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or\
     'sqlite://'
 
@@ -43,6 +171,8 @@ class ProductionConfig(Config):
   ENV = 'production'
   SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or\
     f'sqlite:///{os.path.join(basedir, "data", "data.sqlite")}'
+  SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+  SQLITE_PRAGMAS = sqlite_pragmas()
 
 
 options = {
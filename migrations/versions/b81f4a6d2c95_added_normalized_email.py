@@ -0,0 +1,68 @@
+"""added normalized email
+
+Revision ID: b81f4a6d2c95
+Revises: 5e2c8d71b9a3
+Create Date: 2026-10-17 16:47:05.281930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f4a6d2c95'
+down_revision = '5e2c8d71b9a3'
+branch_labels = None
+depends_on = None
+
+# rows read and updated per backfill step
+CHUNK_SIZE = 1000
+
+users = sa.table(
+    'users',
+    sa.column('id', sa.Integer),
+    sa.column('email', sa.String),
+    sa.column('email_normalized', sa.String))
+
+
+def normalize_email(email):
+    # same as app.models.user.normalize_email, copied so this revision
+    # keeps working when the app changes
+    return email.strip().lower() if email is not None else None
+
+
+def backfill():
+    connection = op.get_bind()
+    update = users.update() \
+        .where(users.c.id == sa.bindparam('_id')) \
+        .values(email_normalized=sa.bindparam('_email_normalized'))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(users.c.id, users.c.email)
+            .where(users.c.id > last_id)
+            .order_by(users.c.id)
+            .limit(CHUNK_SIZE)).all()
+        if not rows:
+            break
+        connection.execute(update, [
+            dict(_id=row.id, _email_normalized=normalize_email(row.email))
+            for row in rows])
+        last_id = rows[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('email_normalized', sa.String(length=64), nullable=True))
+
+    backfill()
+
+    # fails if two addresses only differ by case, merge those accounts first
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email_normalized'), ['email_normalized'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_email_normalized'))
+        batch_op.drop_column('email_normalized')
@@ -1,12 +1,19 @@
 import os
-from dotenv import load_dotenv
-from app import create_app
-from app.utils.cli import create_cli_commands, create_shell_context
 from config import basedir
 
-load_dotenv(os.path.join(basedir, '.env'))
+# deployments usually set the environment themselves, only pay for dotenv
+# when there is a file to load
+if os.path.exists(os.path.join(basedir, '.env')):
+  from dotenv import load_dotenv
+  load_dotenv(os.path.join(basedir, '.env'))
+
+from app import create_app
 
 app = create_app(os.environ.get('ENV') or 'production')
 
-create_cli_commands(app)
-create_shell_context(app)
+# commands, migrations and the shell context are only needed when loaded by
+# the "flask" command, WSGI servers skip them
+if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+  from app.utils.cli import create_cli_commands, create_shell_context
+  create_cli_commands(app)
+  create_shell_context(app)
@@ -0,0 +1,87 @@
+import csv
+import io
+import unittest
+from config import options, TestingConfig
+from app import create_app, db
+from app.models import User, Role
+
+
+class TestAdmin(unittest.TestCase):
+  def setUp(self):
+    options['admin'] = type('AdminConfig', (TestingConfig,), dict(
+      WTF_CSRF_ENABLED=False, ADMIN_EMAIL='admin@example.com',
+      ADMIN_USERS_PER_PAGE=4, ADMIN_EXPORT_BATCH_SIZE=3))
+    self.app = create_app('admin')
+    # no app context around requests, `g` would carry the logged in user over
+    with self.app.app_context():
+      db.create_all()
+      Role.insert_roles()
+      db.session.add(User(username='admin', email='admin@example.com', password='pass1'))
+      db.session.add_all(
+        User(
+          username=f'user{i}', email=f'user{i}@example.com', password='pass1',
+          confirmed=i % 2 == 0)
+        for i in range(9))
+      db.session.commit()
+      self.moderator_id = Role.query.filter_by(name='Moderator').first().id
+    self.client = self.app.test_client()
+    self.client.post('/auth/login', data=dict(email='admin@example.com', password='pass1'))
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+      db.drop_all()
+    options.pop('admin')
+
+  def test_keyset_pages(self):
+    srv = self.app.user_service
+    with self.app.app_context():
+      first = srv.users_page(per_page=4)
+      self.assertEqual([u.id for u in first.users], [1, 2, 3, 4])
+      self.assertIsNone(first.prev_before)
+      second = srv.users_page(after=first.next_after, per_page=4)
+      self.assertEqual([u.id for u in second.users], [5, 6, 7, 8])
+      last = srv.users_page(after=second.next_after, per_page=4)
+      self.assertEqual([u.id for u in last.users], [9, 10])
+      self.assertIsNone(last.next_after)
+      back = srv.users_page(before=last.prev_before, per_page=4)
+      self.assertEqual([u.id for u in back.users], [5, 6, 7, 8])
+      self.assertEqual((back.prev_before, back.next_after), (5, 8))
+
+      confirmed = srv.users_page(confirmed=True, per_page=10)
+      self.assertEqual([u.username for u in confirmed.users], [
+        'user0', 'user2', 'user4', 'user6', 'user8'])
+      self.assertEqual(srv.users_page(role_id=self.moderator_id).users, [])
+
+  def test_users_page(self):
+    page = self.client.get('/admin/users').text
+    self.assertIn('admin@example.com', page)
+    self.assertIn('?after=4', page)
+    page = self.client.get('/admin/users?after=4&confirmed=0').text
+    self.assertIn('user5@example.com', page)
+    self.assertNotIn('user4@example.com', page)
+
+  def test_export_streams_csv(self):
+    response = self.client.get('/admin/users.csv?confirmed=1')
+    self.assertTrue(response.is_streamed)
+    rows = list(csv.reader(io.StringIO(response.text)))
+    self.assertEqual(rows[0], ['id', 'username', 'email', 'confirmed', 'role'])
+    self.assertEqual([row[1] for row in rows[1:]], [
+      'user0', 'user2', 'user4', 'user6', 'user8'])
+    self.assertEqual(rows[1][3:], ['1', 'User'])
+
+  def test_export_escapes_formulas(self):
+    with self.app.app_context():
+      db.session.add(User(
+        username='=HYPERLINK("x")', email='@evil.example.com', password='pass1'))
+      db.session.commit()
+    rows = list(csv.reader(io.StringIO(self.client.get('/admin/users.csv').text)))
+    self.assertEqual(rows[-1][1:3], ["'=HYPERLINK(\"x\")", "'@evil.example.com"])
+    self.assertEqual(rows[1][1], 'admin')
+
+  def test_requires_admin(self):
+    anonymous = self.app.test_client()
+    self.assertEqual(anonymous.get('/admin/users').status_code, 302)
+    user = self.app.test_client()
+    user.post('/auth/login', data=dict(email='user0@example.com', password='pass1'))
+    self.assertEqual(user.get('/admin/users.csv').status_code, 403)
@@ -0,0 +1,131 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from config import options, TestingConfig
+from app import create_app, db
+from app.ext import mail
+from app.models import User
+from app.errors import (
+  EmailAlreadyExistsError, UsernameAlreadyExistsError, PasswordValidationError,
+  UserNotFoundError, TokenPayloadError)
+from app.services.async_user_service import async_database_url
+from app.utils.security import generate_timed_token
+
+try:
+  import aiosqlite
+  import aiosmtplib
+except ImportError:
+  aiosqlite = None
+
+
+@unittest.skipIf(aiosqlite is None, 'needs aiosqlite and aiosmtplib')
+class TestAsyncUserService(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    options['async'] = type('AsyncConfig', (TestingConfig,), dict(
+      SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(self.tmp.name, "db.sqlite")}'))
+    self.app = create_app('async')
+    self.ctx = self.app.test_request_context()
+    self.ctx.push()
+    db.create_all()
+    db.session.add(User(username='user', email='user@example.com', password='pass1'))
+    db.session.commit()
+    self.srv = self.app.async_user_service
+
+  def tearDown(self):
+    self.wait(self.srv.dispose())
+    db.session.remove()
+    db.engine.dispose()
+    self.ctx.pop()
+    options.pop('async')
+    self.tmp.cleanup()
+
+  def wait(self, coro):
+    return asyncio.run(coro)
+
+  def test_async_database_url(self):
+    self.assertEqual(async_database_url('sqlite://'), 'sqlite+aiosqlite://')
+    self.assertEqual(
+      async_database_url('postgresql://db/ghusn'), 'postgresql+asyncpg://db/ghusn')
+
+  def test_missing_driver(self):
+    self.app.config['ASYNC_DATABASE_URL'] = 'postgresql+asyncpg://db/ghusn'
+    self.srv._engine = None
+    try:
+      import asyncpg
+      self.skipTest('asyncpg is installed')
+    except ImportError:
+      pass
+    with self.assertRaisesRegex(RuntimeError, r'asyncpg.*"async" extra'):
+      self.srv.engine
+
+  def test_register_and_authenticate(self):
+    with mail.record_messages() as outbox:
+      user = self.wait(self.srv.register_user('new@example.com', 'new', 'pass2'))
+    self.assertEqual(outbox[0].recipients, ['new@example.com'])
+    self.assertEqual(db.session.get(User, user.id).username, 'new')
+
+    self.assertEqual(
+      self.wait(self.srv.authenticate('new@example.com', 'pass2')).id, user.id)
+    with self.assertRaises(PasswordValidationError):
+      self.wait(self.srv.authenticate('new@example.com', 'wrong'))
+    with self.assertRaises(UserNotFoundError):
+      self.wait(self.srv.authenticate('none@example.com', 'pass2'))
+
+  def test_failed_mail_is_logged(self):
+    state = self.app.extensions['mail']
+    # nothing listens there, the connection is refused
+    state.suppress, state.server, state.port = False, '127.0.0.1', 1
+    with self.assertLogs('app.services.async_user_service', 'WARNING'):
+      user = self.wait(self.srv.register_user('new@example.com', 'new', 'pass2'))
+      self.assertFalse(self.wait(self.srv.send_confirmation_mail(user)))
+      self.assertFalse(self.wait(self.srv.reset_password_request('new@example.com')))
+    self.assertEqual(db.session.get(User, user.id).username, 'new')
+
+  def test_unique_violations(self):
+    with self.assertRaises(EmailAlreadyExistsError):
+      self.wait(self.srv.register_user('user@example.com', 'other', 'pass2'))
+    user = self.wait(self.srv.register_user('other@example.com', 'other', 'pass2'))
+    with self.assertRaises(UsernameAlreadyExistsError):
+      self.wait(self.srv.update_profile(user, username='user'))
+    with self.assertRaises(EmailAlreadyExistsError):
+      self.wait(self.srv.update_email_request(user, 'USER@example.com'))
+    # changing only the case of one's own email is allowed
+    with mail.record_messages() as outbox:
+      self.wait(self.srv.update_email_request(user, 'Other@example.com'))
+    self.assertEqual(outbox[0].recipients, ['Other@example.com'])
+
+  def test_updates_invalidate_shared_cache(self):
+    user = db.session.scalar(db.select(User).filter_by(username='user'))
+    self.assertEqual(self.wait(self.srv.get(user.id)).username, 'user')
+    self.assertIn(user.id, self.app.user_service.identity_cache)
+
+    self.wait(self.srv.update_profile(user, username='renamed'))
+    self.assertEqual(user.username, 'renamed')
+    self.assertNotIn(user, db.session.dirty)
+    self.assertNotIn(user.id, self.app.user_service.identity_cache)
+    self.assertEqual(self.wait(self.srv.get(user.id)).username, 'renamed')
+
+  def test_reset_password(self):
+    token = generate_timed_token({'reset-password': 'user@example.com'})
+    self.wait(self.srv.reset_password(token, 'pass3'))
+    self.wait(self.srv.authenticate('user@example.com', 'pass3'))
+    with self.assertRaises(TokenPayloadError):
+      self.wait(self.srv.reset_password(
+        generate_timed_token({'reset-password': 'bad'}), 'pass3'))
+
+  def test_concurrent_lookups(self):
+    async def lookups():
+      return await asyncio.gather(*[
+        self.srv.get_by_username('user') for _ in range(20)])
+    self.assertEqual({u.email for u in self.wait(lookups())}, {'user@example.com'})
+
+  def test_get_many(self):
+    db.session.add(User(username='other', email='other@example.com', password='pass1'))
+    db.session.commit()
+    found = self.wait(self.srv.get_many_by_email(
+      ['user@example.com', 'other@example.com', 'none@example.com']))
+    self.assertEqual(sorted(found), ['other@example.com', 'user@example.com'])
+    by_id = self.wait(self.srv.get_many([found['user@example.com'].id, None]))
+    self.assertEqual(by_id[found['user@example.com'].id].username, 'user')
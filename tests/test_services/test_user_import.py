@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+from flask import current_app
+from app import create_app, db
+from app.ext import mail, mail_dispatcher
+from app.models import User
+from app.services import UserImporter, read_users
+
+
+class TestUserImport(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.app.config['MAIL_LINK_HOST'] = 'ghusn.test'
+    self.app.config['MAIL_USE_OUTBOX'] = True
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+    db.session.add(User(username='taken', email='taken@example.com', password='pass1'))
+    db.session.commit()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def rows(self):
+    return [
+      dict(email='a@example.com', username='a', password='pass1'),
+      dict(email='taken@example.com', username='b', password='pass1'),
+      dict(email='c@example.com', username='taken', password='pass1'),
+      dict(email='a@example.com', username='d', password='pass1'),
+      dict(email='e@example.com', username='e', password_hash='pbkdf2:sha256:1$x$y'),
+      dict(email='f@example.com', username='f'),
+    ]
+
+  def test_import_skips_duplicates(self):
+    importer = UserImporter(
+      current_app.user_service, batch_size=2, parallel=False,
+      collect_duplicates=True)
+    importer.run(self.rows())
+
+    self.assertEqual(importer.imported, 2)
+    self.assertEqual(importer.skipped, 4)
+    self.assertEqual(
+      [d['reason'] for d in importer.duplicates],
+      ['email', 'username', 'email', 'invalid'])
+    self.assertTrue(User.query.filter_by(username='a').one().verify_password('pass1'))
+    self.assertEqual(
+      User.query.filter_by(username='e').one().password_hash, 'pbkdf2:sha256:1$x$y')
+
+  def test_send_confirmation_is_queued(self):
+    importer = UserImporter(
+      current_app.user_service, parallel=False, send_confirmation=True)
+    importer.run(self.rows())
+    from app.models import OutboxMail
+    self.assertEqual(
+      sorted(m.recipient for m in OutboxMail.query),
+      ['a@example.com', 'e@example.com'])
+
+  def test_refused_confirmation_mail_is_counted(self):
+    self.app.config['MAIL_USE_OUTBOX'] = False
+    # a closed dispatcher refuses mail like a full one
+    mail_dispatcher.shutdown()
+    importer = UserImporter(
+      current_app.user_service, batch_size=2, parallel=False,
+      send_confirmation=True)
+    with self.assertLogs('app.services.user_service', 'WARNING'):
+      importer.run(self.rows())
+    self.assertEqual(importer.imported, 2)
+    self.assertEqual(importer.mail_failed, 2)
+
+  def test_read_users(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, 'users.jsonl')
+      with open(path, 'w') as f:
+        f.write('\n'.join(json.dumps(r) for r in self.rows()[:2]))
+      self.assertEqual(list(read_users(path)), self.rows()[:2])
+
+      path = os.path.join(tmp, 'users.csv')
+      with open(path, 'w') as f:
+        f.write('email,username,password\na@example.com,a,pass1\n')
+      self.assertEqual(list(read_users(path)), self.rows()[:1])
@@ -0,0 +1,172 @@
+import unittest
+from flask import current_app
+from sqlalchemy import event
+from app import create_app, db
+from app.ext import password_hasher, mail_dispatcher
+from app.models import User, OutboxMail
+from app.errors import (
+  EmailAlreadyExistsError, UsernameAlreadyExistsError, TokenPayloadError)
+from app.utils.security import generate_timed_token
+
+
+class TestUserService(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.ctx = self.app.test_request_context()
+    self.ctx.push()
+    db.create_all()
+    self.srv = current_app.user_service
+    self.user = User(username='user', email='user@example.com', password='pass1')
+    db.session.add(self.user)
+    db.session.commit()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def test_get_is_cached(self):
+    cache = self.srv.identity_cache
+    id = self.user.id
+    db.session.remove()
+    self.assertEqual(self.srv.get(id).username, 'user')
+    db.session.remove()
+
+    user = self.srv.get(str(id))
+    self.assertEqual(user.username, 'user')
+    self.assertTrue(user.verify_password('pass1'))
+    self.assertIn(user, db.session)
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+  def test_get_keeps_pending_changes(self):
+    self.srv.get(self.user.id)
+    self.user.username = 'changed'
+    user = self.srv.get(self.user.id)
+    self.assertIs(user, self.user)
+    self.assertEqual(user.username, 'changed')
+
+  def test_cached_user_can_be_updated(self):
+    self.srv.get(self.user.id)
+    db.session.remove()
+
+    user = self.srv.get(self.user.id)
+    self.srv.update_profile(user, username='user2')
+    db.session.remove()
+    self.assertEqual(self.srv.get(self.user.id).username, 'user2')
+    self.assertEqual(db.session.get(User, self.user.id).username, 'user2')
+
+  def test_writes_invalidate_cache(self):
+    user = self.srv.get(self.user.id)
+    token = generate_timed_token({'confirm': user.id})
+    self.srv.confirm_user(user, token)
+    self.assertNotIn(user.id, self.srv.identity_cache)
+
+    self.srv.get(user.id)
+    token = generate_timed_token({'change-password': user.id})
+    self.srv.change_password(user, token, 'pass2')
+    self.assertNotIn(user.id, self.srv.identity_cache)
+    self.assertTrue(self.srv.get(user.id).verify_password('pass2'))
+
+  def test_authenticate_rehashes_old_profile(self):
+    old_hash = self.user.password_hash
+    self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    password_hasher.init_app(self.app)
+
+    user = self.srv.authenticate('user@example.com', 'pass1')
+    self.assertNotEqual(user.password_hash, old_hash)
+    self.assertTrue(user.password_hash.startswith('pbkdf2:sha256:2000$'))
+    self.assertEqual(self.srv.authenticate('user@example.com', 'pass1'), user)
+
+  def test_register_duplicates(self):
+    with self.assertRaises(EmailAlreadyExistsError):
+      self.srv.register_user('user@example.com', 'other', 'pass1')
+    with self.assertRaises(UsernameAlreadyExistsError):
+      self.srv.register_user('other@example.com', 'user', 'pass1')
+    user = self.srv.register_user('other@example.com', 'other', 'pass1')
+    self.assertEqual(User.query.count(), 2)
+    self.assertIsNotNone(user.id)
+
+  def test_register_with_full_mail_queue(self):
+    # a closed dispatcher refuses mail like a full one
+    mail_dispatcher.shutdown()
+    with self.assertLogs('app.services.user_service', 'WARNING'):
+      user = self.srv.register_user('other@example.com', 'other', 'pass1')
+    self.assertIsNotNone(user.id)
+    with self.assertLogs('app.services.user_service', 'WARNING'):
+      self.assertFalse(self.srv.send_confirmation_mail(user))
+      self.assertFalse(self.srv.update_email_request(user, 'new@example.com'))
+      self.assertFalse(self.srv.password_change_request(user, 'pass1'))
+      self.assertFalse(self.srv.reset_password_request('other@example.com'))
+
+  def test_update_profile_duplicate_username(self):
+    other = self.srv.register_user('other@example.com', 'other', 'pass1')
+    with self.assertRaises(UsernameAlreadyExistsError):
+      self.srv.update_profile(other, username='user')
+    self.assertEqual(other.username, 'other')
+
+  def test_get_many(self):
+    users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+    db.session.add_all(users)
+    db.session.commit()
+    ids = [u.id for u in users]
+    db.session.remove()
+
+    found = self.srv.get_many(ids + [str(ids[0]), 999, None])
+    self.assertEqual(sorted(found), ids)
+    self.assertEqual(found[ids[2]].username, 'user2')
+    self.assertEqual(
+      sorted(self.srv.get_many_by_email(['user1@example.com', 'none@example.com'])),
+      ['user1@example.com'])
+    self.assertEqual(
+      self.srv.get_many_by_username(['user3'])['user3'].id, ids[3])
+
+  def test_get_many_reuses_session_users(self):
+    other = User(username='other', email='other@example.com')
+    db.session.add(other)
+    db.session.commit()
+    db.session.refresh(self.user)
+    statements = []
+    def count(conn, cursor, statement, *args):
+      statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+      found = self.srv.get_many([self.user.id, other.id])
+      self.assertIs(found[self.user.id], self.user)
+      self.assertIs(found[other.id], other)
+      self.assertIs(self.srv.get_many_by_username(['user'])['user'], self.user)
+    finally:
+      event.remove(db.engine, 'before_cursor_execute', count)
+    # only the expired user is queried, the refreshed one is reused
+    self.assertEqual(len(statements), 1)
+
+  def test_email_lookups_ignore_case(self):
+    self.assertEqual(self.user.email_normalized, 'user@example.com')
+    self.assertEqual(self.srv.get_by_email(' User@Example.COM'), self.user)
+    self.assertEqual(self.srv.authenticate('USER@example.com', 'pass1'), self.user)
+    self.assertEqual(
+      list(self.srv.get_many_by_email(['USER@example.com'])), ['USER@example.com'])
+    with self.assertRaises(EmailAlreadyExistsError):
+      self.srv.register_user('User@Example.com', 'other', 'pass1')
+    other = self.srv.register_user('other@example.com', 'other', 'pass1')
+    with self.assertRaises(EmailAlreadyExistsError):
+      self.srv.update_email_request(other, 'USER@EXAMPLE.COM')
+
+  def test_update_email_case_only(self):
+    self.app.config['MAIL_USE_OUTBOX'] = True
+    self.srv.update_email_request(self.user, 'User@Example.com')
+    self.assertEqual(OutboxMail.query.one().recipient, 'User@Example.com')
+    token = generate_timed_token(
+      {'email': self.user.email, 'new-email': 'User@Example.com'})
+    self.srv.update_email(self.user, token)
+    self.assertEqual(self.user.email, 'User@Example.com')
+    self.assertEqual(self.user.email_normalized, 'user@example.com')
+
+  def test_reset_password_by_normalized_email(self):
+    self.app.config['MAIL_USE_OUTBOX'] = True
+    self.srv.reset_password_request('USER@example.com')
+    self.assertEqual(OutboxMail.query.one().recipient, 'user@example.com')
+    token = generate_timed_token({'reset-password': 'User@Example.com'})
+    self.srv.reset_password(token, 'pass2')
+    self.assertTrue(self.srv.get_by_email('user@example.com').verify_password('pass2'))
+    with self.assertRaises(TokenPayloadError):
+      self.srv.reset_password(generate_timed_token({'reset-password': None}), 'pass2')
@@ -0,0 +1,74 @@
+import os
+import gzip
+import tempfile
+import unittest
+from config import options, TestingConfig
+from app import create_app
+from app.utils.assets import Assets
+
+
+class TestAssets(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    options['assets'] = type('AssetsConfig', (TestingConfig,), dict(
+      ASSETS_BUILD_DIR=os.path.join(self.tmp.name, 'build')))
+    self.app = create_app('assets')
+    self.client = self.app.test_client()
+
+  def tearDown(self):
+    options.pop('assets')
+    self.tmp.cleanup()
+
+  def test_falls_back_to_static_before_build(self):
+    with self.app.test_request_context():
+      self.assertEqual(
+        self.app.jinja_env.globals['asset_url']('css/base.css'),
+        '/static/css/base.css')
+
+  def test_build_and_serve(self):
+    manifest = Assets.build(self.app)
+    built = manifest['assets/icons.svg']
+    self.assertRegex(built, r'^assets/icons\.[0-9a-f]{8}\.svg$')
+    self.assertNotIn('package.json', manifest)
+    version_dir = self.app.extensions['assets'].version_dir
+    with gzip.open(os.path.join(version_dir, built + '.gz')) as f:
+      with open(os.path.join(self.app.static_folder, 'assets/icons.svg'), 'rb') as src:
+        self.assertEqual(f.read(), src.read())
+
+    page = self.client.get('/').text
+    self.assertIn(f'/assets/{built}#svg-branch-3', page)
+    self.assertIn(f'/assets/{manifest["css/base.css"]}', page)
+
+    response = self.client.get(f'/assets/{built}', headers={'Accept-Encoding': 'gzip'})
+    self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+    self.assertEqual(response.mimetype, 'image/svg+xml')
+    self.assertIn('immutable', response.headers['Cache-Control'])
+    response.close()
+    response = self.client.get(f'/assets/{built}')
+    self.assertNotIn('Content-Encoding', response.headers)
+    self.assertIn(b'svg-branch-3', response.data)
+    response.close()
+
+    # unbuilt names, e.g. relative urls in stylesheets, aren't immutable
+    response = self.client.get('/assets/assets/branch-3.svg')
+    self.assertEqual(response.status_code, 200)
+    self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+    response.close()
+
+  def test_builds_only_sources(self):
+    self.app.config['ASSETS_SOURCES'] = ('css',)
+    manifest = Assets.build(self.app)
+    self.assertIn('css/base.css', manifest)
+    self.assertTrue(all(name.startswith('css/') for name in manifest))
+
+  def test_rebuild_keeps_previous_build(self):
+    Assets.build(self.app)
+    first = self.app.extensions['assets'].version_dir
+    Assets.build(self.app)
+    second = self.app.extensions['assets'].version_dir
+    self.assertNotEqual(first, second)
+    # workers that loaded the first manifest still find their files
+    self.assertTrue(os.path.isdir(first))
+    Assets.build(self.app)
+    self.assertFalse(os.path.isdir(first))
+    self.assertTrue(os.path.isdir(second))
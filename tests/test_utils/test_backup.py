@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from sqlalchemy import create_engine, event
+from app import create_app, db
+from app.models import User, Role
+from app.utils.backup import backup_sqlite, dump_tables, read_dump, restore_tables
+
+
+class TestBackup(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.app = create_app('testing')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+    self.tables = [Role.__table__, User.__table__]
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+    self.tmp.cleanup()
+
+  def path(self, name: str) -> str:
+    return os.path.join(self.tmp.name, name)
+
+  def test_backup_stays_writable(self):
+    source = self.path('source.sqlite')
+    conn = sqlite3.connect(source)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.executemany('INSERT INTO items (body) VALUES (?)', [('x' * 500,)] * 200)
+    conn.commit()
+    steps = []
+
+    def write_between_steps(remaining, total):
+      steps.append(remaining)
+      conn.execute('INSERT INTO items (body) VALUES (?)', ('y',))
+      conn.commit()
+
+    # every write restarts the stepwise copy, the last attempt takes one step
+    restarts = backup_sqlite(
+      source, self.path('backup.sqlite'), pages=8, pause=0, max_restarts=2,
+      progress=write_between_steps)
+    conn.close()
+    self.assertEqual(restarts, 3)
+    self.assertGreater(len(steps), 3)
+    self.assertFalse(os.path.exists(self.path('backup.sqlite.partial')))
+    copy = sqlite3.connect(self.path('backup.sqlite'))
+    self.assertGreaterEqual(copy.execute('SELECT count(*) FROM items').fetchone()[0], 200)
+    copy.close()
+
+  def test_dump_and_restore(self):
+    Role.insert_roles()
+    db.session.add_all(
+      User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x',
+           confirmed=i % 2 == 0)
+      for i in range(25))
+    db.session.commit()
+    dump = self.path('users.jsonl.gz')
+    with db.engine.connect() as connection:
+      counts = dump_tables(connection, self.tables, dump, batch_size=10)
+    self.assertEqual(counts, {'roles': 3, 'users': 25})
+
+    with db.engine.begin() as connection:
+      with self.assertRaises(ValueError):
+        restore_tables(connection, self.tables, dump)
+    db.session.execute(db.delete(User))
+    db.session.execute(db.delete(Role))
+    db.session.commit()
+
+    with db.engine.begin() as connection:
+      counts = restore_tables(connection, self.tables, dump, batch_size=10)
+    self.assertEqual(counts, {'roles': 3, 'users': 25})
+    user = db.session.get(User, 3)
+    self.assertEqual((user.username, user.confirmed, user.role.name), ('user2', True, 'User'))
+
+    with db.engine.begin() as connection:
+      restore_tables(connection, self.tables, dump, replace=True)
+    self.assertEqual(User.query.count(), 25)
+
+  def test_dump_reads_one_snapshot(self):
+    source = self.path('source.sqlite')
+    writer = sqlite3.connect(source)
+    writer.execute('PRAGMA journal_mode=WAL')
+    engine = create_engine(f'sqlite:///{source}')
+    db.metadata.create_all(engine, tables=self.tables)
+    writer.execute("INSERT INTO roles (name) VALUES ('User')")
+    writer.commit()
+
+    def write_after_roles(conn, cursor, statement, *args):
+      if 'FROM roles' in statement:
+        writer.execute(
+          "INSERT INTO users (username, email, email_normalized) "
+          "VALUES ('late', 'late@example.com', 'late@example.com')")
+        writer.commit()
+
+    with engine.connect() as connection:
+      event.listen(connection, 'after_cursor_execute', write_after_roles)
+      counts = dump_tables(connection, self.tables, self.path('users.jsonl.gz'))
+    writer.close()
+    engine.dispose()
+    # the user committed between the two SELECTs is not in the dump
+    self.assertEqual(counts, {'roles': 1, 'users': 0})
+    self.assertEqual(
+      [name for name, _ in read_dump(self.path('users.jsonl.gz'))], ['roles'])
@@ -0,0 +1,45 @@
+import unittest
+from app.utils.cache import TTLCache
+
+
+class FakeTimer:
+  def __init__(self):
+    self.now = 0
+
+  def __call__(self):
+    return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+  def setUp(self):
+    self.timer = FakeTimer()
+    self.cache = TTLCache(maxsize=2, ttl=10, timer=self.timer)
+
+  def test_entries_expire(self):
+    self.cache.set('a', 1)
+    self.cache.set('b', 2, ttl=20)
+    self.timer.now = 15
+    self.assertIsNone(self.cache.get('a'))
+    self.assertEqual(self.cache.get('b'), 2)
+    self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+  def test_least_recently_used_is_evicted(self):
+    self.cache.set('a', 1)
+    self.cache.set('b', 2)
+    self.cache.get('a')
+    self.cache.set('c', 3)
+    self.assertIn('a', self.cache)
+    self.assertNotIn('b', self.cache)
+    self.assertEqual(len(self.cache), 2)
+
+  def test_expire_drops_stale_entries(self):
+    self.cache.set('a', 1, ttl=5)
+    self.cache.set('b', 2)
+    self.timer.now = 6
+    self.assertEqual(self.cache.expire(), 1)
+    self.assertEqual(len(self.cache), 1)
+
+  def test_zero_maxsize_disables_cache(self):
+    cache = TTLCache(maxsize=0)
+    cache.set('a', 1)
+    self.assertIsNone(cache.get('a'))
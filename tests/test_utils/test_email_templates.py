@@ -0,0 +1,35 @@
+import unittest
+from flask import render_template
+from app import create_app
+from app.ext import email_renderer
+from app.models import User
+from app.utils.email_templates import EMAIL_TEMPLATES
+
+
+class TestEmailRenderer(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.app.config['MAIL_LINK_HOST'] = 'ghusn.test'
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+
+  def tearDown(self):
+    self.ctx.pop()
+
+  def test_templates_are_preloaded(self):
+    state = self.app.extensions['email_renderer']
+    self.assertEqual(set(state.templates), set(EMAIL_TEMPLATES))
+
+  def test_render_matches_render_template(self):
+    user = User(username='user')
+    with self.app.test_request_context(base_url='http://ghusn.test'):
+      for name in EMAIL_TEMPLATES:
+        body, html = email_renderer.render(name, user=user, token='abc')
+        self.assertEqual(body, render_template(name + '.txt', user=user, token='abc'))
+        self.assertEqual(html, render_template(name + '.html', user=user, token='abc'))
+
+  def test_render_outside_request_context(self):
+    body, html = email_renderer.render(
+      'email/auth/reset-password', token='abc')
+    self.assertIn('http://ghusn.test/auth/reset-password/abc', body)
+    self.assertIn('http://ghusn.test/auth/reset-password/abc', html)
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+from config import options, TestingConfig, engine_options, sqlite_pragmas
+from app import create_app, db
+
+
+class TestEngineTuning(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    options['tuned'] = type('TunedConfig', (TestingConfig,), dict(
+      SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(self.tmp.name, "db.sqlite")}',
+      SQLITE_PRAGMAS=sqlite_pragmas()))
+    self.app = create_app('tuned')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+
+  def tearDown(self):
+    db.session.remove()
+    db.engine.dispose()
+    self.ctx.pop()
+    options.pop('tuned')
+    self.tmp.cleanup()
+
+  def pragma(self, name):
+    return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+  def test_sqlite_pragmas(self):
+    self.assertEqual(self.pragma('journal_mode'), 'wal')
+    self.assertEqual(self.pragma('synchronous'), 1)
+    self.assertEqual(self.pragma('busy_timeout'), 5000)
+    self.assertEqual(self.pragma('cache_size'), -64000)
+
+  def test_engine_options(self):
+    self.assertEqual(engine_options('sqlite:///data.sqlite'), {})
+    opts = engine_options('postgresql://localhost/ghusn')
+    self.assertTrue(opts['pool_pre_ping'])
+    self.assertEqual(opts['pool_size'], 5)
@@ -0,0 +1,54 @@
+import unittest
+from app import create_app
+from app.ext import password_hasher
+from app.utils.hashing import normalize_method, calibrate
+
+
+class TestPasswordHasher(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+
+  def tearDown(self):
+    password_hasher.shutdown()
+    self.ctx.pop()
+
+  def test_sync_fallback(self):
+    pwhash = password_hasher.hash('pass1')
+    self.assertIsNone(self.app.extensions['password_hasher'].executor)
+    self.assertTrue(password_hasher.verify(pwhash, 'pass1'))
+    self.assertFalse(password_hasher.verify(pwhash, 'pass2'))
+    self.assertFalse(password_hasher.verify(None, 'pass1'))
+
+  def test_process_pool(self):
+    state = self.app.extensions['password_hasher']
+    state.enabled = True
+    state.workers = 2
+
+    hashes = password_hasher.hash_many(['pass1', 'pass2', 'pass3'])
+    self.assertIsNotNone(state.executor)
+    self.assertEqual(len(set(hashes)), 3)
+    self.assertTrue(password_hasher.verify(hashes[1], 'pass2'))
+    self.assertFalse(password_hasher.verify(hashes[1], 'pass1'))
+
+  def test_needs_rehash(self):
+    pwhash = password_hasher.hash('pass1')
+    self.assertFalse(password_hasher.needs_rehash(pwhash))
+    self.app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2'
+    password_hasher.init_app(self.app)
+    self.assertTrue(password_hasher.needs_rehash(pwhash))
+    self.assertTrue(password_hasher.hash('pass1').startswith('pbkdf2:sha256:600000$'))
+
+  def test_normalize_method(self):
+    self.assertEqual(normalize_method('scrypt'), 'scrypt:32768:8:1')
+    self.assertEqual(normalize_method('scrypt:16384'), 'scrypt:16384:8:1')
+    self.assertEqual(normalize_method('scrypt:16384:4'), 'scrypt:16384:4:1')
+    self.assertEqual(normalize_method('pbkdf2:sha512'), 'pbkdf2:sha512:600000')
+    with self.assertRaises(ValueError):
+      normalize_method('md5')
+
+  def test_calibrate(self):
+    method, elapsed = calibrate('pbkdf2', budget=0.01, rounds=1)
+    self.assertTrue(method.startswith('pbkdf2:sha256:'))
+    self.assertLess(elapsed, 0.1)
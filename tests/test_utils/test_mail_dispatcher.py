@@ -0,0 +1,85 @@
+import unittest
+import threading
+from flask_mail import Message
+from app import create_app
+from app.ext import mail, mail_dispatcher
+from app.utils.mail_dispatcher import _live_states
+from app.errors import MailQueueFullError
+
+
+class TestMailDispatcher(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+
+  def tearDown(self):
+    mail_dispatcher.shutdown()
+    self.ctx.pop()
+
+  def message(self, i=0):
+    return Message(
+      f'subject {i}', sender='sender@example.com',
+      recipients=['user@example.com'], body='body')
+
+  def test_queued_messages_are_delivered_on_shutdown(self):
+    with mail.record_messages() as outbox:
+      for i in range(10):
+        mail_dispatcher.submit(self.message(i))
+      mail_dispatcher.shutdown()
+
+    self.assertEqual(len(outbox), 10)
+    self.assertEqual(mail_dispatcher.qsize(), 0)
+
+  def test_worker_pool_is_fixed(self):
+    for i in range(10):
+      mail_dispatcher.submit(self.message(i))
+    state = self.app.extensions['mail_dispatcher']
+    self.assertEqual(len(state.threads), self.app.config['MAIL_DISPATCHER_WORKERS'])
+
+  def test_full_queue_raises(self):
+    state = self.app.extensions['mail_dispatcher']
+    state.put_timeout = 0.01
+    # no workers, so nothing drains the queue
+    state.workers = 0
+    for i in range(state.queue.maxsize):
+      mail_dispatcher.submit(self.message(i))
+    with self.assertRaises(MailQueueFullError):
+      mail_dispatcher.submit(self.message())
+
+  def test_submit_after_shutdown_raises(self):
+    mail_dispatcher.shutdown()
+    with self.assertRaises(MailQueueFullError):
+      mail_dispatcher.submit(self.message())
+
+  def test_accepted_messages_survive_concurrent_shutdown(self):
+    accepted = []
+    first_accepted = threading.Event()
+
+    def submit(worker):
+      with self.app.app_context():
+        for i in range(10):
+          try:
+            mail_dispatcher.submit(self.message(f'{worker}-{i}'))
+          except MailQueueFullError:
+            return
+          accepted.append(f'subject {worker}-{i}')
+          first_accepted.set()
+
+    with mail.record_messages() as outbox:
+      threads = [threading.Thread(target=submit, args=(i,)) for i in range(4)]
+      for t in threads:
+        t.start()
+      first_accepted.wait(5)
+      mail_dispatcher.shutdown()
+      for t in threads:
+        t.join()
+    self.assertTrue(accepted)
+    self.assertEqual(sorted(m.subject for m in outbox), sorted(accepted))
+    self.assertEqual(mail_dispatcher.qsize(), 0)
+
+  def test_dispatchers_are_shut_down_at_exit(self):
+    state = self.app.extensions['mail_dispatcher']
+    self.assertIn(state, _live_states)
+    create_app('testing')
+    self.assertIn(state, _live_states)
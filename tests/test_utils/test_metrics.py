@@ -0,0 +1,91 @@
+import threading
+import unittest
+from config import options, TestingConfig
+from app import create_app, db
+from app.models import User
+from app.utils.metrics import Counter, Histogram
+
+
+class TestMetrics(unittest.TestCase):
+  def test_shards_are_merged(self):
+    counter = Counter('c', 'counter', ['name'])
+    histogram = Histogram('h', 'histogram', buckets=(1, 2))
+
+    def work():
+      for _ in range(100):
+        counter.inc(name='a')
+        histogram.observe(1.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thr in threads:
+      thr.start()
+    for thr in threads:
+      thr.join()
+    counter.inc(name='b')
+
+    self.assertEqual(counter.collect(), {('a',): 400, ('b',): 1})
+    self.assertEqual(histogram.collect()[()], [0, 400, 0, 600.0, 400])
+    self.assertIn('h_bucket{le="2.0"} 400', histogram.expose())
+    self.assertIn('h_bucket{le="+Inf"} 400', histogram.expose())
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def test_requests_and_sql_are_recorded(self):
+    client = self.app.test_client()
+    client.get('/')
+    client.post('/auth/login', data=dict(email='user@example.com', password='pass1'))
+    text = client.get('/metrics').get_data(as_text=True)
+
+    self.assertIn(
+      'http_requests_total{endpoint="main.index",method="GET",status="200"} 1', text)
+    self.assertIn('http_request_duration_seconds_count{endpoint="main.index"} 1', text)
+    self.assertIn('http_request_sql_statements_sum{endpoint="main.index"} 0', text)
+    self.assertIn('mail_queue_depth 0', text)
+    self.assertIn('# TYPE password_hash_duration_seconds histogram', text)
+
+  def test_sql_statements_are_counted(self):
+    self.app.config['WTF_CSRF_ENABLED'] = False
+    user = User(username='user', email='user@example.com', password='pass1')
+    db.session.add(user)
+    db.session.commit()
+    client = self.app.test_client()
+    client.post('/auth/login', data=dict(email='user@example.com', password='pass1'))
+    text = client.get('/metrics').get_data(as_text=True)
+
+    self.assertIn('http_request_sql_statements_count{endpoint="auth.login"} 1', text)
+    self.assertNotIn('http_request_sql_statements_sum{endpoint="auth.login"} 0', text)
+    self.assertIn('password_hash_duration_seconds_count{operation="verify"} 1', text)
+
+  def test_scrapers_are_restricted(self):
+    self.app.extensions['metrics'].token = 'secret'
+    client = self.app.test_client()
+    remote = dict(REMOTE_ADDR='203.0.113.7')
+    self.assertEqual(client.get('/metrics', environ_base=remote).status_code, 403)
+    self.assertEqual(client.get(
+      '/metrics', environ_base=remote,
+      headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+    self.assertEqual(client.get(
+      '/metrics', environ_base=remote,
+      headers={'Authorization': 'Bearer secret'}).status_code, 200)
+    self.assertEqual(client.get('/metrics').status_code, 200)
+
+  def test_disabled(self):
+    options['no-metrics'] = type('NoMetricsConfig', (TestingConfig,), dict(
+      METRICS_ENABLED=False))
+    try:
+      app = create_app('no-metrics')
+    finally:
+      options.pop('no-metrics')
+    self.assertIsNone(app.extensions.get('metrics'))
+    self.assertEqual(app.test_client().get('/metrics').status_code, 404)
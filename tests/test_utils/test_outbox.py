@@ -0,0 +1,147 @@
+import smtplib
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from flask_mail import Message
+from app import create_app, db
+from app.ext import mail
+from app.models import OutboxMail
+from app.utils.outbox import enqueue_mail, pending_count, OutboxWorker
+from app.utils.send_mail import send_mail
+
+
+class TestOutbox(unittest.TestCase):
+  def setUp(self):
+    self.app = create_app('testing')
+    self.app.config['MAIL_USE_OUTBOX'] = True
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+
+  def message(self, i=0):
+    return Message(
+      f'subject {i}', sender='sender@example.com',
+      recipients=['user@example.com'], body='body', html='<p>body</p>')
+
+  def test_send_mail_writes_to_outbox(self):
+    with self.app.test_request_context():
+      send_mail(
+        to='user@example.com', subject='Reset password',
+        template='email/auth/reset-password', token='token')
+    row = OutboxMail.query.one()
+    self.assertEqual(row.recipient, 'user@example.com')
+    self.assertEqual(row.status, OutboxMail.PENDING)
+    self.assertIn('token', row.body)
+
+  def test_worker_drains_in_batches(self):
+    for i in range(7):
+      enqueue_mail(self.message(i))
+    worker = OutboxWorker(batch_size=3)
+
+    with mail.record_messages() as outbox:
+      self.assertEqual(worker.run_once(), 3)
+      self.assertEqual(pending_count(), 4)
+      worker.run(once=True)
+
+    self.assertEqual(len(outbox), 7)
+    self.assertEqual(pending_count(), 0)
+    self.assertEqual(
+      OutboxMail.query.filter_by(status=OutboxMail.SENT).count(), 7)
+
+  def test_failed_delivery_is_retried_with_backoff(self):
+    row = enqueue_mail(self.message())
+    row.sender = None  # no sender, send fails
+    db.session.commit()
+    worker = OutboxWorker(max_attempts=2, backoff=60)
+
+    worker.run_once()
+    self.assertEqual(row.status, OutboxMail.PENDING)
+    self.assertEqual(row.attempts, 1)
+    self.assertGreater(row.next_attempt_at, datetime.utcnow() + timedelta(seconds=30))
+    # not due yet
+    self.assertEqual(worker.run_once(), 0)
+
+    row.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    worker.run_once()
+    self.assertEqual(row.status, OutboxMail.FAILED)
+    self.assertEqual(worker.failed, 1)
+
+  def test_many_recipients(self):
+    recipients = [f'recipient{i}@example.com' for i in range(10)]
+    enqueue_mail(Message(
+      'subject', sender='sender@example.com', recipients=recipients, body='body'))
+    with mail.record_messages() as outbox:
+      OutboxWorker().run_once()
+    self.assertEqual(outbox[0].recipients, recipients)
+
+  def test_claimed_rows_are_not_claimed_again(self):
+    for i in range(3):
+      enqueue_mail(self.message(i))
+    first, second = OutboxWorker(), OutboxWorker()
+    self.assertEqual(len(first.claim()), 3)
+    self.assertEqual(second.claim(), [])
+
+  def test_connect_failure_is_retried_with_backoff(self):
+    for i in range(3):
+      enqueue_mail(self.message(i))
+    worker = OutboxWorker(backoff=60)
+
+    with mock.patch.object(mail, 'connect', side_effect=ConnectionRefusedError('refused')):
+      self.assertEqual(worker.run_once(), 3)
+
+    rows = OutboxMail.query.all()
+    self.assertEqual({row.status for row in rows}, {OutboxMail.PENDING})
+    self.assertEqual({row.attempts for row in rows}, {1})
+    self.assertEqual({row.last_error for row in rows}, {'refused'})
+    self.assertTrue(all(
+      row.next_attempt_at > datetime.utcnow() + timedelta(seconds=30) for row in rows))
+
+  def test_failed_quit_keeps_outcomes(self):
+    for i in range(2):
+      enqueue_mail(self.message(i))
+    conn = FakeConnection(quit_error=smtplib.SMTPServerDisconnected('gone'))
+
+    with mock.patch.object(mail, 'connect', return_value=conn):
+      OutboxWorker().run_once()
+    self.assertEqual(len(conn.sent), 2)
+    self.assertEqual(
+      OutboxMail.query.filter_by(status=OutboxMail.SENT).count(), 2)
+
+  def test_dropped_connection_is_reopened(self):
+    for i in range(3):
+      enqueue_mail(self.message(i))
+    dropping = FakeConnection(drop_after=1)
+    fresh = FakeConnection()
+
+    with mock.patch.object(mail, 'connect', side_effect=[dropping, fresh]):
+      OutboxWorker().run_once()
+    self.assertEqual(len(dropping.sent) + len(fresh.sent), 3)
+    self.assertEqual({row.attempts for row in OutboxMail.query}, {1})
+    self.assertEqual(
+      OutboxMail.query.filter_by(status=OutboxMail.SENT).count(), 3)
+
+
+class FakeConnection:
+  """SMTP connection that records messages, drops or fails to quit on demand."""
+  def __init__(self, drop_after: int=None, quit_error: Exception=None):
+    self.drop_after = drop_after
+    self.quit_error = quit_error
+    self.sent = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    if self.quit_error is not None:
+      raise self.quit_error
+
+  def send(self, msg):
+    if self.drop_after is not None and len(self.sent) >= self.drop_after:
+      raise smtplib.SMTPServerDisconnected('dropped')
+    self.sent.append(msg)
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from app import create_app, db
+from app.ext import query_profiler
+from app.models import User
+from app.utils.query_profiler import query_report
+
+
+class TestQueryProfiler(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmp.name, 'profile.jsonl')
+    self.app = create_app('testing')
+    self.app.config.update(
+      QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_PATH=self.path,
+      QUERY_PROFILER_SLOW_MS=0)
+    query_profiler.init_app(self.app)
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+    self.tmp.cleanup()
+
+  def test_repeated_statements_are_flagged(self):
+    with self.assertLogs('app.utils.query_profiler', 'WARNING') as logs:
+      with self.app.test_request_context('/'):
+        for i in range(3):
+          User.query.filter_by(username=f'user{i}').first()
+        User.query.count()
+        self.app.do_teardown_request()
+
+    self.assertTrue(any('Slow query' in line for line in logs.output))
+    self.assertTrue(any('Possible N+1' in line for line in logs.output))
+
+    report = query_report(self.path)
+    self.assertEqual(len(report), 2)
+    repeated = [e for e in report if e['repeated']]
+    self.assertEqual(len(repeated), 1)
+    self.assertEqual(repeated[0]['calls'], 3)
+    self.assertEqual(repeated[0]['endpoints'], {'main.index'})
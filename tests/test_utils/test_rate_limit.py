@@ -0,0 +1,104 @@
+import unittest
+from unittest import mock
+from config import options, TestingConfig
+from app import create_app, db
+from app.ext import metrics
+from app.errors import PasswordValidationError
+from app.utils.rate_limit import TokenBuckets, parse_limit
+
+
+class TestTokenBuckets(unittest.TestCase):
+  def setUp(self):
+    self.now = 0.0
+    self.buckets = TokenBuckets(shards=4, evict_every=10, timer=lambda: self.now)
+
+  def test_parse_limit(self):
+    self.assertEqual(parse_limit('10/minute'), (10.0, 10 / 60))
+    for limit in ('0/minute', '0.5/hour', '-1/second', '10/week'):
+      with self.assertRaises(ValueError):
+        parse_limit(limit)
+
+  def test_bucket_refills(self):
+    for _ in range(3):
+      self.assertEqual(self.buckets.consume('a', 3, 1), 0)
+    self.assertEqual(self.buckets.consume('a', 3, 1), 1)
+    self.assertEqual(self.buckets.consume('b', 3, 1), 0)
+    self.now = 1.0
+    self.assertEqual(self.buckets.consume('a', 3, 1), 0)
+
+  def test_idle_buckets_are_evicted(self):
+    self.buckets = TokenBuckets(shards=1, evict_every=10, timer=lambda: self.now)
+    self.buckets.consume('a', 3, 1)
+    self.buckets.consume('b', 3, 0.01)
+    self.now = 10.0
+    self.buckets.consume('c', 3, 1)
+    self.now = 20.0
+    for key in ('a', 'b', 'c'):
+      self.buckets.consume(key + 'x', 3, 1)
+    # 'b' needs 100s to refill
+    self.assertEqual(len(self.buckets), 4)
+
+
+class TestRateLimitedViews(unittest.TestCase):
+  def setUp(self):
+    options['limited'] = type('LimitedConfig', (TestingConfig,), dict(
+      WTF_CSRF_ENABLED=False, RATE_LIMIT_ENABLED=True,
+      RATE_LIMIT_PER_IP='3/minute', RATE_LIMIT_PER_ACCOUNT='2/minute'))
+    self.app = create_app('limited')
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+    self.client = self.app.test_client()
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+    options.pop('limited')
+
+  def login(self, email, addr='10.0.0.1'):
+    return self.client.post(
+      '/auth/login', data=dict(email=email, password='pass'),
+      environ_base={'REMOTE_ADDR': addr})
+
+  def test_account_limit(self):
+    with mock.patch.object(
+        self.app.user_service, 'authenticate',
+        side_effect=PasswordValidationError) as auth:
+      self.login('a@example.com', '10.0.0.1')
+      self.login('A@example.com', '10.0.0.2')
+      response = self.login('a@example.com', '10.0.0.3')
+    self.assertEqual(response.status_code, 429)
+    self.assertIn('Retry-After', response.headers)
+    # rejected before the view hashes anything
+    self.assertEqual(auth.call_count, 2)
+    self.assertEqual(self.login('b@example.com', '10.0.0.3').status_code, 200)
+
+  def test_ip_limit_and_metric(self):
+    statuses = [
+      self.login(f'{i}@example.com').status_code for i in range(4)]
+    self.assertEqual(statuses, [200, 200, 200, 429])
+    self.assertEqual(self.client.get('/auth/login').status_code, 200)
+    counter = metrics.get(self.app).rate_limited
+    self.assertEqual(counter.collect(), {('auth.login', 'ip'): 1})
+
+  def test_client_address_behind_proxy(self):
+    options['proxied'] = type('ProxiedConfig', (options['limited'],), dict(
+      PROXY_FIX_X_FOR=1))
+    try:
+      app = create_app('proxied')
+    finally:
+      options.pop('proxied')
+    client = app.test_client()
+
+    def login(i, forwarded_for):
+      return client.post(
+        '/auth/login', data=dict(email=f'{i}@example.com', password='pass'),
+        headers={'X-Forwarded-For': forwarded_for}).status_code
+
+    with mock.patch.object(
+        app.user_service, 'authenticate', side_effect=PasswordValidationError):
+      # both clients share the proxy's socket address but get their own limit
+      statuses = [login(i, f'192.0.2.{i % 2}') for i in range(6)]
+      self.assertEqual(statuses, [200] * 6)
+      self.assertEqual(login(6, '192.0.2.0'), 429)
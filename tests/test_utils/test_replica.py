@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from config import options, TestingConfig
+from app import create_app, db
+from app.models import User
+
+
+class TestReplicaRouting(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    options['replica'] = type('ReplicaConfig', (TestingConfig,), dict(
+      SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(self.tmp.name, "primary.sqlite")}',
+      SQLALCHEMY_BINDS={
+        'replica': f'sqlite:///{os.path.join(self.tmp.name, "replica.sqlite")}'},
+      USER_CACHE_SIZE=0))
+    self.app = create_app('replica')
+    self.srv = self.app.user_service
+    with self.app.app_context():
+      db.create_all()
+      replica = db.engines['replica']
+      db.metadata.create_all(replica)
+      # only on the replica, so a hit proves where the read went
+      with replica.begin() as conn:
+        conn.execute(db.insert(User), [dict(
+          id=100, username='ghost', email='ghost@example.com', password_hash='x')])
+      db.session.add(User(username='user', email='user@example.com', password='pass1'))
+      db.session.commit()
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+      for engine in db.engines.values():
+        engine.dispose()
+    # the bind's metadata is global, later apps without the bind choke on it
+    db.metadatas.pop('replica', None)
+    options.pop('replica')
+    self.tmp.cleanup()
+
+  def test_reads_go_to_replica(self):
+    with self.app.app_context():
+      self.assertEqual(self.srv.get_by_email('ghost@example.com').id, 100)
+      self.assertEqual(self.srv.get_by_username('ghost').id, 100)
+      self.assertEqual(self.srv.get(100).username, 'ghost')
+
+  def test_missing_rows_are_read_from_primary(self):
+    with self.app.app_context():
+      self.assertEqual(self.srv.get_by_email('user@example.com').username, 'user')
+
+  def test_reads_after_write_stay_on_primary(self):
+    with self.app.app_context():
+      user = self.srv.get_by_email('user@example.com')
+      self.srv.update_profile(user, username='renamed')
+      self.assertIsNone(self.srv.get_by_username('ghost'))
+    with self.app.app_context():
+      self.assertIsNotNone(self.srv.get_by_username('ghost'))
+
+  def test_load_user_reads_replica(self):
+    with self.app.test_request_context():
+      loader = self.app.login_manager._user_callback
+      self.assertEqual(loader('100').username, 'ghost')
+
+  def test_changed_user_is_not_cached_from_replica(self):
+    self.srv.identity_cache.maxsize = 10
+    with self.app.app_context():
+      user = self.srv.get_by_email('user@example.com')
+      # the replica still has the row from before the change
+      with db.engines['replica'].begin() as conn:
+        conn.execute(db.insert(User), [dict(
+          id=user.id, username='user', email='user@example.com',
+          password_hash='x')])
+      self.srv.update_profile(user, username='renamed')
+    with self.app.app_context():
+      self.assertEqual(self.srv.get(user.id).username, 'renamed')
+    with self.app.app_context():
+      self.assertEqual(self.srv.get(user.id).username, 'renamed')
+      self.assertEqual(self.srv.identity_cache.hits, 1)
@@ -0,0 +1,85 @@
+import unittest
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import event
+from config import options, TestingConfig
+from app import create_app, db
+from app.models import User, Role, Permission
+
+
+class TestRoleTable(unittest.TestCase):
+  def setUp(self):
+    options['roles'] = type('RolesConfig', (TestingConfig,), dict(
+      ADMIN_EMAIL='admin@example.com'))
+    self.app = create_app('roles')
+    self.ctx = self.app.test_request_context()
+    self.ctx.push()
+    db.create_all()
+    Role.insert_roles()
+    self.roles = current_app.extensions['roles']
+    self.statements = []
+    event.listen(db.engine, 'before_cursor_execute', self.count)
+
+  def tearDown(self):
+    event.remove(db.engine, 'before_cursor_execute', self.count)
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+    options.pop('roles')
+
+  def count(self, conn, cursor, statement, *args):
+    self.statements.append(statement)
+
+  def test_new_users_get_default_role(self):
+    srv = current_app.user_service
+    user = srv.register_user('user@example.com', 'user', 'pass1')
+    admin = srv.register_user('Admin@Example.com', 'admin', 'pass1')
+    db.session.execute(db.insert(User), [dict(username='bulk', email='bulk@example.com')])
+    self.assertEqual(user.role.name, 'User')
+    self.assertEqual(admin.role.name, 'Administrator')
+    self.assertEqual(srv.get_by_username('bulk').role.name, 'User')
+
+  def test_insert_roles_backfills_users(self):
+    db.session.execute(db.insert(User), [
+      dict(username='old', email='old@example.com'),
+      dict(username='admin', email='Admin@Example.com')])
+    # registered before the roles existed
+    db.session.execute(db.update(User).values(role_id=None))
+    db.session.commit()
+
+    self.assertEqual(Role.insert_roles(), 2)
+    srv = current_app.user_service
+    self.assertEqual(srv.get_by_username('old').role.name, 'User')
+    self.assertEqual(srv.get_by_username('admin').role.name, 'Administrator')
+    self.assertEqual(Role.insert_roles(), 0)
+
+  def test_can_runs_no_query(self):
+    user = current_app.user_service.register_user('user@example.com', 'user', 'pass1')
+    self.roles.roles()
+    del self.statements[:]
+    self.assertTrue(user.can(Permission.WRITE))
+    self.assertFalse(user.can(Permission.MODERATE | Permission.WRITE))
+    self.assertFalse(user.is_administrator())
+    self.assertEqual(self.statements, [])
+
+  def test_get_loads_role_in_one_query(self):
+    srv = current_app.user_service
+    user = srv.register_user('user@example.com', 'user', 'pass1')
+    db.session.remove()
+    srv.identity_cache.clear()
+    del self.statements[:]
+    self.assertEqual(srv.get(user.id).role.name, 'User')
+    self.assertEqual(len(self.statements), 1)
+    self.assertIn('JOIN roles', self.statements[0])
+
+  def test_table_refreshed_on_commit(self):
+    user = current_app.user_service.register_user('user@example.com', 'user', 'pass1')
+    self.assertFalse(user.can(Permission.MODERATE))
+    role = Role.query.filter_by(name='User').first()
+    role.add_permission(Permission.MODERATE)
+    db.session.commit()
+    self.assertTrue(user.can(Permission.MODERATE))
+
+  def test_anonymous_user(self):
+    self.assertFalse(current_user.can(Permission.FOLLOW))
+    self.assertFalse(current_user.is_administrator())
@@ -0,0 +1,33 @@
+import time
+import unittest
+from app.errors import TokenExpiredError, TokenInvalidSignatureError, TokenMalformedError
+from app.utils.security import TokenService
+
+
+class TestTokenService(unittest.TestCase):
+  def setUp(self):
+    self.srv = TokenService('secret')
+
+  def test_decode_is_cached(self):
+    token = self.srv.generate({'confirm': 1})
+    self.assertEqual(self.srv.decode(token)['confirm'], 1)
+    payload = self.srv.decode(token)
+    payload['confirm'] = 2
+    self.assertEqual(self.srv.decode(token)['confirm'], 1)
+    self.assertEqual(self.srv.stats()['hits'], 2)
+    self.assertEqual(self.srv.stats()['misses'], 1)
+
+  def test_cached_token_expires(self):
+    token = self.srv.generate({'confirm': 1}, expiration=1)
+    self.srv.decode(token)
+    time.sleep(1.1)
+    with self.assertRaises(TokenExpiredError):
+      self.srv.decode(token)
+
+  def test_invalid_tokens(self):
+    token = TokenService('other').generate({'confirm': 1})
+    with self.assertRaises(TokenInvalidSignatureError):
+      self.srv.decode(token)
+    with self.assertRaises(TokenMalformedError):
+      self.srv.decode('not a token')
+    self.assertEqual(len(self.srv.cache), 0)
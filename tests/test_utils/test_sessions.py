@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from flask import session, flash, get_flashed_messages
+from config import options, TestingConfig
+from app import create_app, db
+from app.models import User
+from app.utils.sessions import SQLiteSessionStore
+
+
+class TestServerSessions(unittest.TestCase):
+  backend = 'memory'
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    options['sessions'] = type('SessionsConfig', (TestingConfig,), dict(
+      WTF_CSRF_ENABLED=False, SESSION_BACKEND=self.backend,
+      SESSION_SQLITE_PATH=os.path.join(self.tmp.name, 'sessions.sqlite')))
+    self.app = create_app('sessions')
+
+    @self.app.route('/set/<value>')
+    def set_value(value):
+      session['value'] = value
+      return ''
+
+    @self.app.route('/get')
+    def get_value():
+      return session.get('value', '')
+
+    @self.app.route('/flash')
+    def flash_and_show():
+      flash('hello')
+      return ', '.join(get_flashed_messages())
+
+    self.ctx = self.app.app_context()
+    self.ctx.push()
+    db.create_all()
+    db.session.add(User(username='user', email='user@example.com', password='pass1'))
+    db.session.commit()
+    self.client = self.app.test_client()
+    self.store = self.app.session_interface.store
+
+  def tearDown(self):
+    db.session.remove()
+    db.drop_all()
+    self.ctx.pop()
+    options.pop('sessions')
+    self.tmp.cleanup()
+
+  def sid(self):
+    cookie = self.client.get_cookie(self.app.config['SESSION_COOKIE_NAME'])
+    return cookie and cookie.value
+
+  def test_cookie_holds_only_the_id(self):
+    self.client.get('/set/' + 'x' * 500)
+    self.assertLess(len(self.sid()), 50)
+    self.assertEqual(self.client.get('/get').text, 'x' * 500)
+    self.assertIsNotNone(self.store.load(self.sid()))
+
+  def test_unchanged_session_is_not_written(self):
+    self.client.get('/set/a')
+    with mock.patch.object(self.store, 'save', wraps=self.store.save) as save:
+      self.client.get('/get')
+      self.client.get('/flash')
+      self.client.get('/set/a')
+      self.assertEqual(save.call_count, 0)
+      self.client.get('/set/b')
+      self.assertEqual(save.call_count, 1)
+
+  def test_login_rotates_session_id(self):
+    self.client.get('/set/a')
+    before = self.sid()
+    self.client.post('/auth/login', data=dict(email='user@example.com', password='pass1'))
+    self.assertNotEqual(self.sid(), before)
+    self.assertIsNone(self.store.load(before))
+    self.assertEqual(self.client.get('/user/settings').status_code, 200)
+
+
+class TestSQLiteSessions(TestServerSessions):
+  backend = 'sqlite'
+
+  def test_expired_sessions_are_purged(self):
+    store = SQLiteSessionStore(os.path.join(self.tmp.name, 'other.sqlite'), purge_every=0)
+    store.save('old', '{}', 1)
+    self.assertIsNone(store.load('old'))
+    store.save('new', '{}', 2 ** 40)
+    count = store._conn().execute('SELECT count(*) FROM sessions').fetchone()[0]
+    self.assertEqual(count, 1)
@@ -0,0 +1,28 @@
+import unittest
+from app.utils.startup import parse_importtime, profile_startup
+
+OUTPUT = '''import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     _io
+import time:      1500 |       2000 |   app.ext
+import time:       300 |       2300 | run
+'''
+
+
+class TestStartupProfile(unittest.TestCase):
+  def test_parse_importtime(self):
+    modules = parse_importtime(OUTPUT)
+    self.assertEqual([m['name'] for m in modules], ['_io', 'app.ext', 'run'])
+    self.assertEqual([m['depth'] for m in modules], [2, 1, 0])
+    self.assertEqual(modules[1]['self_ms'], 1.5)
+    self.assertEqual(modules[2]['cumulative_ms'], 2.3)
+
+  def test_serving_process_skips_cli(self):
+    result = profile_startup('testing')
+    self.assertEqual(result['status'], 200)
+    names = {m['name'] for m in result['modules']}
+    self.assertIn('app.ext', names)
+    self.assertNotIn('flask_migrate', names)
+    self.assertNotIn('app.utils.cli', names)
+    # the password hashing pool is off by default
+    self.assertNotIn('concurrent.futures.process', names)
+    self.assertGreater(result['total_ms'], result['first_request_ms'])
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from flask import render_template_string
+from jinja2 import FileSystemBytecodeCache
+from config import options, TestingConfig
+from app import create_app, db
+from app.models import User
+
+
+class TestTemplateCache(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    options['templates'] = type('TemplatesConfig', (TestingConfig,), dict(
+      WTF_CSRF_ENABLED=False,
+      JINJA_BYTECODE_CACHE_DIR=os.path.join(self.tmp.name, 'jinja')))
+    self.app = create_app('templates')
+    # no app context around requests, `g` would carry the logged in user over
+    with self.app.app_context():
+      db.create_all()
+      for name in ('first', 'second'):
+        db.session.add(User(username=name, email=f'{name}@example.com', password='pass1'))
+      db.session.commit()
+    self.fragments = self.app.extensions['template_cache'].fragments
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+      db.drop_all()
+    options.pop('templates')
+    self.tmp.cleanup()
+
+  def test_bytecode_cache(self):
+    self.assertIsInstance(self.app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
+    self.app.test_client().get('/')
+    self.assertTrue(os.listdir(self.app.config['JINJA_BYTECODE_CACHE_DIR']))
+
+  def test_navbar_fragment_per_auth_state(self):
+    page = self.app.test_client().get('/').text
+    self.assertIn('Sign Up', page)
+
+    for name in ('first', 'second'):
+      client = self.app.test_client()
+      client.post('/auth/login', data=dict(email=f'{name}@example.com', password='pass1'))
+      page = client.get('/').text
+      self.assertIn(f'Hello {name}', page)
+      self.assertNotIn('Sign Up', page)
+    # anonymous and logged in unconfirmed
+    self.assertEqual(len(self.fragments), 2)
+
+  def test_dynamic_values_are_escaped(self):
+    with self.app.test_request_context():
+      html = render_template_string(
+        "{{ fragment('includes/navbar.html', {'authenticated': True}, username=name) }}",
+        name='<b>')
+    self.assertIn('Hello &lt;b&gt;', html)